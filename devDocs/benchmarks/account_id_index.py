@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: Benchmarks looking up users by account id in ShelveAuthenticator,
+    with the account id index and with the full scan it replaced.
+
+    Usage, from the root of the source tree:
+        python devDocs/benchmarks/account_id_index.py [users]
+
+    The users are written straight to the shelves of a temporary resource
+    directory, because creating them through create_user would spend nearly
+    all of the time hashing passwords.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import esapi.test.conf
+from esapi.core import ESAPI
+
+def scan(authenticator, account_id):
+    # The lookup used before the index
+    for user in authenticator.user_shelf.values():
+        if user.account_id == account_id:
+            return user
+    return None
+
+def main():
+    count = 100000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+
+    directory = tempfile.mkdtemp()
+    try:
+        ESAPI.security_configuration().set_resource_directory(directory)
+        authenticator = ESAPI.authenticator()
+        user_class = ESAPI.security_configuration().get_class_for_interface('user')
+
+        start = time.time()
+        ids = []
+        for i in xrange(count):
+            # DefaultUser checks exists(account_id=...) to pick a free id
+            user = user_class("user%s" % i)
+            authenticator.user_shelf[user.account_name] = user
+            authenticator.id_shelf[str(user.account_id)] = user.account_name
+            ids.append(user.account_id)
+            if i % 1000 == 999:
+                # Keep the writeback cache of the user shelf small
+                authenticator.user_shelf.sync()
+        authenticator.user_shelf.sync()
+        authenticator.id_shelf.sync()
+        print "created %s users in %.1fs (%.1f us per user)" % (
+            count, time.time() - start, (time.time() - start) * 1e6 / count)
+
+        random.seed(1)
+        sample = [random.choice(ids) for i in range(1000)]
+        start = time.time()
+        for account_id in sample:
+            assert authenticator.exists(account_id=account_id)
+            assert authenticator.get_user(account_id=account_id) is not None
+        elapsed = time.time() - start
+        print "indexed: %s lookups in %.3fs (%.1f us each)" % (
+            len(sample) * 2, elapsed, elapsed * 1e6 / (len(sample) * 2))
+
+        start = time.time()
+        for account_id in sample[:3]:
+            assert scan(authenticator, account_id) is not None
+            authenticator.user_shelf.sync()
+        elapsed = time.time() - start
+        print "scan:    3 lookups in %.3fs (%.1f ms each)" % (elapsed, elapsed * 1e3 / 3)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
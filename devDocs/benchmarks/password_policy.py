@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: Benchmarks the password policy checks of verify_password_strength
+    against the loops over the Encoder character sets that they replaced, and
+    generate_strong_password, which checks passwords until one passes, against
+    its old retry loop around verify_password_strength.
+
+    Usage, from the root of the source tree:
+        python devDocs/benchmarks/password_policy.py [passwords]
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import random
+import sys
+import time
+
+import esapi.test.conf
+from esapi.core import ESAPI
+from esapi.encoder import Encoder
+from esapi.reference.password_policy import get_password_policy
+
+def old_check(new_password, old_password):
+    # The checks used before the policy rules
+    if old_password is not None:
+        for i in range( 0, len(old_password) - 2 ):
+            if old_password[i:i+3] in new_password:
+                return False
+    num_charsets = 0
+    for charset in [Encoder.CHAR_PASSWORD_LOWERS, Encoder.CHAR_PASSWORD_UPPERS,
+                    Encoder.CHAR_PASSWORD_DIGITS, Encoder.CHAR_PASSWORD_SPECIALS]:
+        for c in new_password:
+            if c in charset:
+                num_charsets += 1
+                break
+    return len(new_password) * num_charsets >= 16
+
+def new_check(policy, new_password, old_password):
+    try:
+        policy.check(new_password, old_password)
+        return True
+    except Exception:
+        return False
+
+def timed(name, count, function):
+    start = time.time()
+    passed = function()
+    elapsed = time.time() - start
+    print "%-10s %s checks in %.3fs (%.1f us each), %s passed" % (
+        name, count, elapsed, elapsed * 1e6 / count, passed)
+
+def main():
+    count = 100000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+
+    random.seed(1)
+    alphabet = Encoder.CHAR_PASSWORD_ALL + "iloIO01 "
+    pairs = []
+    for i in xrange(count):
+        new_password = "".join(random.choice(alphabet) for j in range(random.randint(6, 24)))
+        old_password = "".join(random.choice(alphabet) for j in range(random.randint(6, 24)))
+        pairs.append((new_password, old_password))
+
+    # Passphrases, where searching for each piece of the old password
+    # takes time proportional to the product of the lengths
+    phrases = []
+    for i in xrange(count / 100):
+        new_password = "".join(random.choice(alphabet) for j in range(1000))
+        old_password = "".join(random.choice(alphabet) for j in range(1000))
+        phrases.append((new_password, old_password))
+
+    policy = get_password_policy()
+    for name, samples in (("passwords", pairs), ("passphrases", phrases)):
+        print name
+        timed("old", len(samples), lambda: sum(old_check(n, o) for n, o in samples))
+        timed("is_valid", len(samples), lambda: sum(policy.is_valid(n, o) for n, o in samples))
+        timed("check", len(samples), lambda: sum(new_check(policy, n, o) for n, o in samples))
+
+    authenticator = ESAPI.authenticator()
+    def old_generate():
+        # The retry loop used before is_valid, which logs each rejection
+        while True:
+            length = ESAPI.randomizer().get_random_integer(7, 9)
+            password = ESAPI.randomizer().get_random_string(length, Encoder.CHAR_PASSWORD_ALL)
+            try:
+                authenticator.verify_password_strength(password)
+                return password
+            except Exception:
+                pass
+    for name, generate in (("old", old_generate),
+                           ("new", authenticator.generate_strong_password)):
+        start = time.time()
+        for i in xrange(count / 10):
+            generate()
+        elapsed = time.time() - start
+        print "%-10s generate_strong_password: %.1f us each" % (name, elapsed * 1e6 / (count / 10))
+
+if __name__ == "__main__":
+    main()
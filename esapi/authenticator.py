@@ -172,13 +172,13 @@ class Authenticator():
     
     def hash_password(self, password, account_name):
         """
-        Returns a string of the hashed password, using the account_name as a
-        salt. The salt helps to prevent against "rainbow" table attacks where
-        the attacker pre-calculates hashes for known strings.
+        Returns a string of the hashed password. The salt helps to prevent 
+        against "rainbow" table attacks where the attacker pre-calculates 
+        hashes for known strings.
         
-        This method specifies the use of the user's account name as the salt
-        value. The Encryptor.hash method can be used if a different salt is
-        required.
+        Implementations may use the account name as the salt, or store a 
+        random salt in the returned string, in which case hashing the same
+        password twice gives different results.
         
         @param password: the password to hash
         @param account_name: the account name to use as the salt
@@ -238,3 +238,11 @@ class Authenticator():
         @return: True if the account exists
         """
         raise NotImplementedError()
+
+    def get_user_names(self):
+        """
+        Gets the account names of all stored users.
+        
+        @return: a list of account names
+        """
+        raise NotImplementedError()
@@ -66,6 +66,50 @@ Authenticator_PasswordParameterName = 'password'
 Authenticator_RememberTokenDuration = timedelta(days=14)
 Authenticator_IdleTimeoutDuration = timedelta(minutes=20)
 Authenticator_AbsoluteTimeoutDuration = timedelta(minutes=20)
+# New passwords must pass these rules, in order, given as (name, parameters)
+# pairs:
+#   'length' - {'min_length' : n, 'max_length' : n}
+#   'character_classes' - {'min_classes' : n}, of lowercase and uppercase
+#       letters, digits and specials
+#   'strength' - {'min_strength' : n}, for length times character classes
+#   'old_password' - {'length' : n}, rejects passwords that contain any
+#       piece of the old password this long
+#   'breach_list' - {'filename' : path}, rejects passwords whose SHA-1 hash
+#       is in the file, either a text file of hashes or a Bloom filter built
+#       from one with python -m esapi.reference.bloom_filter
+Authenticator_PasswordPolicy = (
+    ('old_password', {'length' : 3}),
+    ('strength', {'min_strength' : 16}),
+    )
+# Bloom filters of breached passwords are built to wrongly reject about
+# this share of passwords. Each halving of the rate adds about 1.44 bits
+# per breached password to the filter.
+Authenticator_BreachFilterFalsePositiveRate = 0.001
+# Passwords are hashed with this algorithm, 'pbkdf2' or 'scrypt', and these
+# parameters. To pick parameters for a target verification time on this
+# machine, run python -m esapi.reference.password_hashing. Hashes stored
+# with other settings, or by older versions, are upgraded on login.
+Authenticator_PasswordHashAlgorithm = 'pbkdf2'
+Authenticator_PasswordHashParameters = {'digest' : 'sha512', 'iterations' : 100000}
+# Passwords are hashed on this many worker processes, so that a burst of
+# logins does not starve other requests. Use 0 to hash in the request thread.
+# At most HashingMaxPending hashes may wait or run; past that, and after
+# waiting HashingTimeout for a hash, logins fail as unavailable.
+Authenticator_HashingProcesses = 2
+Authenticator_HashingMaxPending = 32
+Authenticator_HashingTimeout = timedelta(seconds=10)
+# Successful password verifications are remembered this long, so that
+# remember token logins do not hash the same password on every request
+Authenticator_VerificationCacheTTL = timedelta(minutes=2)
+Authenticator_VerificationCacheSize = 10000
+# Changed users are written to storage in batches, at most this long after
+# the change. Locking, disabling and role changes are written at once, and
+# clear_current() writes everything at the end of each request.
+Authenticator_UserFlushInterval = timedelta(seconds=5)
+# The number of users kept in memory between requests, and how long each
+# is kept before it is read again, to see changes made by other processes
+Authenticator_UserCacheSize = 1000
+Authenticator_UserCacheTTL = timedelta(minutes=5)
 
 
 #===========================================================================
@@ -265,3 +309,50 @@ Validator_HTTPJSESSIONID = r"""^[A-Z0-9]{10,30}$"""
 # Validation of file related input
 Validator_Filename = r"""^[a-zA-Z0-9!@#$%^&{}\[\]()_+-=,.~'` ]{1,255}$"""
 Validator_DirectoryName = r"""^[a-zA-Z0-9:\\!@#$%^&{}\[\]()_+-=,.~'` ]{1,255}$"""
+
+# Validation patterns run against attacker-supplied input. Every Validator_
+# pattern is checked at startup for constructs that backtrack exponentially,
+# such as nested quantifiers, and a warning is logged for each one found.
+#
+# The engine used to match patterns:
+#   'inline'  - match in the calling thread, with no time budget
+#   'process' - match in a worker process, abandoned after the time budget
+#   're2'     - match with the linear-time RE2 engine (requires the re2 module)
+Validation_PatternEngine = 'inline'
+# The time budget of a single pattern match
+Validation_PatternMatchTimeout = timedelta(seconds=1)
+# The number of worker processes of the 'process' engine. Matches wait for
+# a free worker without using their time budget, so this bounds how many
+# slow patterns can run at once without delaying every other match.
+Validation_PatternProcesses = 4
+# How long a validated directory path is remembered, so that repeated checks
+# of the same directories skip the pattern checks. A remembered path is
+# forgotten early if the directory or its parent is replaced or modified, or
+# if either no longer resolves to itself. Use timedelta(0) to turn this off.
+Validation_DirectoryCacheTTL = timedelta(seconds=30)
+# The number of threads shared by all ValidationBatches, which validate
+# independent fields in parallel. Use 0 to validate them in the calling thread.
+Validation_BatchThreads = 4
+# The locations that redirects may go to. When this list is not empty,
+# redirect locations are checked against it instead of Validator_Redirect.
+# Entries can be:
+#   'example.com'       - any path on exactly that host
+#   '.example.com'      - any path on that host or any of its subdomains
+#   'example.com/app/'  - paths on the host that start with /app/
+#   '/account/'         - relative locations that start with /account/
+Validation_RedirectAllowList = []
+# Whether validation rules record counters and latency histograms by type
+# and context. Read them with esapi.reference.validation.validation_metrics.
+Validation_MetricsEnabled = False
+# A file the Validator_ patterns and their analysis are cached in, so that
+# processes started later skip analyzing them. Each process still compiles
+# the patterns. It is rebuilt whenever the patterns change. The file must
+# only be writable by the application. Use None to turn this off.
+Validation_ProfileCacheFile = None
+# The most checks an AsyncValidator lets wait for or run on the validation
+# thread pool. Past that, checks fail at once as unavailable.
+Validation_AsyncMaxPending = 100
+# The deepest nesting of objects and arrays, and the most keys in any one
+# object, allowed in a JSON body checked by Validator.get_valid_json
+Validation_JSONMaxDepth = 32
+Validation_JSONMaxKeys = 1000
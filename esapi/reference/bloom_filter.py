@@ -0,0 +1,229 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: A Bloom filter of SHA-1 hashes kept in a memory mapped file, for
+    checking passwords against large lists of breached passwords.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import binascii
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from esapi.core import ESAPI
+from esapi.translation import _
+
+# The file starts with the magic, the number of bits, the number of hashes
+# it was built from, and the number of bits set for each
+MAGIC = 'ESAPIBF1'
+HEADER = struct.Struct('<8sQQI4x')
+
+# The bit indexes come from the SHA-1 hash itself, which is already
+# uniformly distributed, by double hashing its first 16 bytes
+_HALVES = struct.Struct('<QQ')
+
+def filter_size(count, false_positive_rate):
+    """
+    Returns the number of bits and of bits set per hash that give a filter
+    of count hashes the false_positive_rate.
+    """
+    count = max(count, 1)
+    bits = int(math.ceil(-count * math.log(false_positive_rate) / math.log(2) ** 2))
+    bits = max(bits, 64)
+    probes = max(1, int(round(float(bits) / count * math.log(2))))
+    return bits, probes
+
+def _indexes(digest, bits, probes):
+    first, second = _HALVES.unpack_from(digest)
+    second |= 1
+    return [(first + i * second) % bits for i in xrange(probes)]
+
+def is_bloom_filter(filename):
+    """
+    Returns whether filename is a Bloom filter written by build_filter.
+    """
+    filter_file = open(filename, 'rb')
+    try:
+        return filter_file.read(len(MAGIC)) == MAGIC
+    finally:
+        filter_file.close()
+
+class BloomFilter:
+    """
+    A read only Bloom filter of SHA-1 hashes. The file is memory mapped, so
+    a lookup reads a few pages instead of loading the filter, and processes
+    that open the same file share its pages in the operating system's cache.
+
+    Hashes are tested with 'in', as raw 20 byte digests or 40 character
+    hexadecimal strings in either case. A hash that was added is always
+    found; others are found with about the false positive rate it was built
+    with.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        filter_file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(filter_file.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            filter_file.close()
+        if len(self._map) < HEADER.size:
+            raise ValueError(_("Not a Bloom filter: %(file)s") % {'file' : filename})
+        magic, self.bits, self.count, self.probes = HEADER.unpack_from(self._map)
+        if magic != MAGIC or len(self._map) < HEADER.size + (self.bits + 7) // 8:
+            raise ValueError(_("Not a Bloom filter: %(file)s") % {'file' : filename})
+
+    def __contains__(self, sha1_hash):
+        if len(sha1_hash) == 40:
+            sha1_hash = binascii.unhexlify(sha1_hash)
+        bitmap = self._map
+        for index in _indexes(sha1_hash, self.bits, self.probes):
+            if not ord(bitmap[HEADER.size + (index >> 3)]) & (1 << (index & 7)):
+                return False
+        return True
+
+    def contains_password(self, password):
+        """
+        Returns whether password is, probably, one of the hashed passwords.
+        """
+        if isinstance(password, unicode):
+            password = password.encode('utf-8')
+        return hashlib.sha1(password).digest() in self
+
+    def get_false_positive_rate(self):
+        """
+        Returns the expected false positive rate for the hashes it holds.
+        """
+        return (1 - math.exp(-float(self.probes) * self.count / self.bits)) ** self.probes
+
+    def close(self):
+        self._map.close()
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+def open_filter(filename):
+    """
+    Returns the BloomFilter of filename, opening each file once per process.
+    A filter replaced by build_filter is opened again when its modification
+    time changes.
+    """
+    filename = os.path.abspath(filename)
+    modified = os.stat(filename).st_mtime
+    _filters_lock.acquire()
+    try:
+        entry = _filters.get(filename)
+        if entry is None or entry[0] != modified:
+            entry = (modified, BloomFilter(filename))
+            _filters[filename] = entry
+        return entry[1]
+    finally:
+        _filters_lock.release()
+
+def read_hashes(hash_file):
+    """
+    Yields the hashes of a file with a 40 character hexadecimal SHA-1 hash
+    on each line, optionally followed by ':' and a count, as raw digests.
+    """
+    for number, line in enumerate(hash_file):
+        line = line.split(':', 1)[0].strip()
+        if not line:
+            continue
+        if len(line) != 40:
+            raise ValueError(_("Bad hash on line %(line)s") % {'line' : number + 1})
+        try:
+            yield binascii.unhexlify(line)
+        except TypeError:
+            raise ValueError(_("Bad hash on line %(line)s") % {'line' : number + 1})
+
+def build_filter(source_filename, filter_filename, false_positive_rate=None):
+    """
+    Builds a Bloom filter of the hashes in source_filename, in the format
+    read by read_hashes, sized for false_positive_rate. The source is read
+    twice, once to count the hashes, so it does not have to fit in memory.
+    The filter is written next to filter_filename and renamed over it, so
+    processes using the old filter keep a consistent copy until they open
+    it again.
+
+    @param false_positive_rate: defaults to the configured
+        Authenticator_BreachFilterFalsePositiveRate
+    @return: the number of hashes added
+    """
+    if false_positive_rate is None:
+        false_positive_rate = ESAPI.security_configuration().get_breach_filter_false_positive_rate()
+
+    source = open(source_filename, 'rb')
+    try:
+        count = sum(1 for line in source if line.strip())
+    finally:
+        source.close()
+    bits, probes = filter_size(count, false_positive_rate)
+
+    temporary_filename = "%s.%s.tmp" % (filter_filename, os.getpid())
+    filter_file = open(temporary_filename, 'w+b')
+    try:
+        filter_file.write(HEADER.pack(MAGIC, bits, count, probes))
+        filter_file.truncate(HEADER.size + (bits + 7) // 8)
+        filter_file.flush()
+        bitmap = mmap.mmap(filter_file.fileno(), 0)
+        try:
+            source = open(source_filename, 'rb')
+            try:
+                for digest in read_hashes(source):
+                    for index in _indexes(digest, bits, probes):
+                        offset = HEADER.size + (index >> 3)
+                        bitmap[offset] = chr(ord(bitmap[offset]) | (1 << (index & 7)))
+            finally:
+                source.close()
+            bitmap.flush()
+        finally:
+            bitmap.close()
+        filter_file.close()
+        if os.name == 'nt' and os.path.exists(filter_filename):
+            # Windows does not rename over an existing file
+            os.remove(filter_filename)
+        os.rename(temporary_filename, filter_filename)
+    except:
+        filter_file.close()
+        os.remove(temporary_filename)
+        raise
+    return count
+
+def main(args):
+    """
+    Builds a Bloom filter from a file of SHA-1 hashes:
+        python -m esapi.reference.bloom_filter HASHES FILTER [false_positive_rate]
+    The filter is used with the 'breach_list' rule of
+    Authenticator_PasswordPolicy, with FILTER as its filename.
+    """
+    if len(args) not in (2, 3):
+        print main.__doc__
+        return 2
+    false_positive_rate = None
+    if len(args) == 3:
+        false_positive_rate = float(args[2])
+    count = build_filter(args[0], args[1], false_positive_rate)
+    bloom_filter = BloomFilter(args[1])
+    print "%s hashes in %s bytes, %s bits set per hash, false positive rate %.2g" % (
+        count, os.path.getsize(args[1]), bloom_filter.probes,
+        bloom_filter.get_false_positive_rate())
+    bloom_filter.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,358 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: Imports and exports users of an Authenticator in bulk, as CSV or
+    JSON lines.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import csv
+import multiprocessing
+import sys
+from datetime import datetime
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from esapi.core import ESAPI
+from esapi.translation import _
+from esapi.logger import Logger
+from esapi.exceptions import EnterpriseSecurityException
+from esapi.reference import password_hashing
+from esapi.reference.password_hashing_pool import PasswordHashingPool
+from esapi.reference.user_credentials import UserCredentials
+
+# The fields of a record. A record has either a password, which is hashed
+# on import, or the password_hash written by an export.
+FIELDS = ('account_name', 'account_id', 'screen_name', 'roles', 'enabled',
+          'locked', 'expiration_time', 'password', 'password_hash',
+          'old_password_hashes')
+EXPORT_FIELDS = tuple(field for field in FIELDS if field != 'password')
+
+_TIME_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
+def _parse_time(text):
+    for time_format in _TIME_FORMATS:
+        try:
+            return datetime.strptime(text, time_format)
+        except ValueError:
+            pass
+    raise ValueError(_("Bad time: %(time)s") % {'time' : text})
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return value.strip().lower() in ('1', 'true', 'yes')
+
+def _parse_list(value):
+    # CSV holds lists as space separated words, JSON as lists
+    if isinstance(value, basestring):
+        return value.split()
+    return list(value)
+
+# Readers and writers
+def read_csv(stream):
+    """
+    Yields the records of a CSV file with a header row of field names.
+    Empty fields are left out.
+    """
+    for row in csv.DictReader(stream):
+        yield dict((name, value) for name, value in row.items()
+            if name is not None and value not in (None, ''))
+
+def read_jsonl(stream):
+    """
+    Yields the records of a file with one JSON object per line.
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+class _CSVWriter:
+    def __init__(self, stream):
+        self._writer = csv.DictWriter(stream, EXPORT_FIELDS)
+        self._writer.writerow(dict(zip(EXPORT_FIELDS, EXPORT_FIELDS)))
+
+    def write(self, record):
+        row = {}
+        for name, value in record.items():
+            if isinstance(value, (list, tuple)):
+                value = ' '.join(value)
+            elif isinstance(value, unicode):
+                value = value.encode('utf-8')
+            row[name] = value
+        self._writer.writerow(row)
+
+class _JSONLWriter:
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, record):
+        self._stream.write(json.dumps(record, sort_keys=True))
+        self._stream.write('\n')
+
+READERS = {'csv' : read_csv, 'jsonl' : read_jsonl}
+WRITERS = {'csv' : _CSVWriter, 'jsonl' : _JSONLWriter}
+
+class ImportReport:
+    """
+    The outcome of an import: the number of records read, imported and
+    rejected, and the reason for each rejection as (record number, message).
+    """
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.errors = []
+
+    def get_rejected(self):
+        return len(self.errors)
+
+    def __repr__(self):
+        return "ImportReport(read=%s, imported=%s, rejected=%s)" % (
+            self.read, self.imported, self.get_rejected())
+
+class BulkUserImporter:
+    """
+    Creates users from a stream of records much faster than calling
+    Authenticator.create_user for each:
+
+        - Plaintext passwords are hashed in parallel on a pool of worker
+          processes. Records exported with their password hashes, such as
+          when moving users between Authenticators, are not hashed again.
+        - Users are written in batches, through the Authenticator's
+          add_users(), with one transaction or shelf sync per batch.
+        - Account names and passwords are checked with the Authenticator's
+          rules, but duplicate checks are a set and index lookup.
+
+    Records that fail a check are skipped and reported, without stopping
+    the import.
+    """
+    def __init__(self, authenticator=None, processes=None, batch_size=1000,
+        progress=None):
+        """
+        @param authenticator: the Authenticator to fill, ESAPI.authenticator()
+            by default
+        @param processes: the number of hashing processes, the number of
+            CPUs by default
+        @param batch_size: the number of users written at once
+        @param progress: called as progress(report) after every batch
+        """
+        if authenticator is None:
+            authenticator = ESAPI.authenticator()
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.authenticator = authenticator
+        self.batch_size = batch_size
+        self.progress = progress
+        self.logger = ESAPI.logger("BulkUserImporter")
+        self._pool = PasswordHashingPool(processes, max_pending=batch_size)
+        self._hasher = password_hashing.get_password_hasher()
+        self._user_class = ESAPI.security_configuration().get_class_for_interface('user')
+
+    def import_records(self, records):
+        """
+        Imports an iterable of records, dictionaries with the keys in FIELDS.
+
+        @return: an ImportReport
+        """
+        report = ImportReport()
+        seen_names = set()
+        seen_ids = set()
+        batch = []
+        try:
+            for record in records:
+                report.read += 1
+                try:
+                    batch.append((report.read,) + self._prepare(record, seen_names, seen_ids))
+                except (EnterpriseSecurityException, ValueError, KeyError, TypeError), extra:
+                    report.errors.append((report.read, unicode(extra)))
+                if len(batch) >= self.batch_size:
+                    self._write(batch, report)
+                    batch = []
+            if batch:
+                self._write(batch, report)
+        finally:
+            self._pool.close()
+        self.logger.info( Logger.SECURITY_SUCCESS,
+            _("Bulk import of %(imported)s users, %(rejected)s rejected") %
+            {'imported' : report.imported,
+             'rejected' : report.get_rejected()} )
+        return report
+
+    def import_stream(self, stream, format='jsonl'):
+        """
+        Imports the records of a stream in format 'csv' or 'jsonl'.
+        """
+        return self.import_records(READERS[format](stream))
+
+    def _prepare(self, record, seen_names, seen_ids):
+        """
+        Checks a record and returns (user, credentials, password or None),
+        with the password hash to be filled in for plaintext passwords.
+        """
+        authenticator = self.authenticator
+        # The shelves need byte string keys; JSON gives unicode
+        account_name = str(record['account_name']).lower()
+        if account_name in seen_names or authenticator.exists(account_name):
+            raise ValueError(_("Duplicate user %(user)s") % {'user' : account_name})
+        authenticator.verify_account_name_strength(account_name)
+
+        password = record.get('password')
+        password_hash = record.get('password_hash')
+        if password_hash is not None:
+            password_hash = str(password_hash)
+        if (password is None) == (password_hash is None):
+            raise ValueError(_("Exactly one of password and password_hash is needed for %(user)s") %
+                {'user' : account_name})
+        if password is not None:
+            authenticator.verify_password_strength(password)
+        else:
+            # Fails on hashes in an unknown format
+            password_hashing.identify_hasher(password_hash)
+
+        account_id = record.get('account_id')
+        if account_id is not None:
+            account_id = int(account_id)
+            if account_id in seen_ids or authenticator.exists(account_id=account_id):
+                raise ValueError(_("Duplicate account id %(id)s") % {'id' : account_id})
+        user = self._user_class(account_name, account_id)
+        seen_names.add(account_name)
+        seen_ids.add(user.account_id)
+
+        if record.get('screen_name') is not None:
+            user.screen_name = str(record['screen_name'])
+        if record.get('roles') is not None:
+            user.add_roles([str(role) for role in _parse_list(record['roles'])])
+        if _parse_bool(record.get('enabled', False)):
+            user.enable()
+        if _parse_bool(record.get('locked', False)):
+            user.lock()
+        if record.get('expiration_time') is not None:
+            user.expiration_time = _parse_time(record['expiration_time'])
+
+        credentials = UserCredentials(account_name)
+        for old_hash in _parse_list(record.get('old_password_hashes', ())):
+            credentials.change_password(str(old_hash))
+        if password_hash is not None:
+            credentials.change_password(password_hash)
+        else:
+            user.last_password_change_time = datetime.now()
+        return user, credentials, password
+
+    def _write(self, batch, report):
+        # Hash every plaintext password of the batch in parallel
+        futures = {}
+        for number, user, credentials, password in batch:
+            if password is not None:
+                futures[number] = self._pool.hash_async(self._hasher, password, user.account_name)
+
+        # A record whose hash failed is rejected alone
+        users = []
+        for number, user, credentials, password in batch:
+            if number in futures:
+                try:
+                    credentials.change_password(futures[number].get())
+                except EnterpriseSecurityException, extra:
+                    report.errors.append((number, unicode(extra)))
+                    continue
+            users.append((user, credentials))
+        if users:
+            self.authenticator.add_users(users)
+        report.imported += len(users)
+        if self.progress is not None:
+            self.progress(report)
+
+def export_users(stream, format='jsonl', authenticator=None):
+    """
+    Writes every user of an Authenticator to a stream in format 'csv' or
+    'jsonl', with their password hashes, so that the output can be imported
+    by BulkUserImporter. The output holds password hashes and must be
+    protected like the user database itself.
+
+    @return: the number of users written
+    """
+    if authenticator is None:
+        authenticator = ESAPI.authenticator()
+    writer = WRITERS[format](stream)
+    count = 0
+    for account_name in sorted(authenticator.get_user_names()):
+        user = authenticator.get_user(account_name)
+        credentials = authenticator.get_credentials(account_name)
+        if user is None or credentials is None:
+            continue
+        hashes = [str(stored_hash) for stored_hash in credentials.get_old_password_hashes()]
+        expiration_time = None
+        if user.expiration_time != datetime.max:
+            expiration_time = user.expiration_time.isoformat()
+        writer.write({
+            'account_name' : user.account_name,
+            'account_id' : user.account_id,
+            'screen_name' : user.screen_name,
+            'roles' : list(user.roles),
+            'enabled' : user.is_enabled(),
+            'locked' : user.is_locked(),
+            'expiration_time' : expiration_time,
+            'password_hash' : hashes[-1],
+            'old_password_hashes' : hashes[:-1],
+            })
+        count += 1
+    return count
+
+def _format_for(filename):
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    return 'jsonl'
+
+def main(args):
+    """
+    Imports or exports the users of the configured Authenticator:
+        python -m esapi.reference.bulk_users import users.csv|users.jsonl
+        python -m esapi.reference.bulk_users export users.csv|users.jsonl
+    Files ending in .csv are CSV with a header row, others JSON lines.
+    """
+    if len(args) != 2 or args[0] not in ('import', 'export'):
+        print main.__doc__
+        return 2
+    command, filename = args
+    if command == 'export':
+        stream = open(filename, 'wb')
+        try:
+            count = export_users(stream, _format_for(filename))
+        finally:
+            stream.close()
+        print "Exported %s users to %s" % (count, filename)
+        return 0
+
+    def progress(report):
+        sys.stderr.write("\r%s read, %s imported, %s rejected" %
+            (report.read, report.imported, report.get_rejected()))
+    stream = open(filename, 'rb')
+    try:
+        report = BulkUserImporter(progress=progress).import_stream(stream, _format_for(filename))
+    finally:
+        stream.close()
+    sys.stderr.write("\n")
+    for number, message in report.errors:
+        print "Record %s: %s" % (number, message)
+    print report
+    ESAPI.authenticator().flush()
+    if report.errors:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -91,14 +91,17 @@ class DefaultEncryptor(Encryptor):
             iterations = self.hash_iterations
     
         try:
-            digest = hashlib.new(self.hash_algorithm)
+            empty = hashlib.new(self.hash_algorithm)
+            digest = empty.copy()
             digest.update(self.master_salt)
             digest.update(salt)
             digest.update(plaintext)
             
+            # Copying an empty hash object is cheaper than looking the
+            # algorithm up again each round
             bytes = digest.digest()
-            for i in range(self.hash_iterations):
-                digest = hashlib.new(self.hash_algorithm)
+            for i in xrange(iterations):
+                digest = empty.copy()
                 digest.update(bytes)
                 bytes = digest.digest()
                 
@@ -27,6 +27,7 @@ from esapi.core import ESAPI
 from esapi.security_configuration import SecurityConfiguration
 from esapi.translation import _
 from esapi.exceptions import ConfigurationException
+from esapi.reference.validation.validation_profile import load_profile
 
 # These will be modules set in load_configuration
 conf = None
@@ -71,6 +72,8 @@ class DefaultSecurityConfiguration(SecurityConfiguration):
         for option in dir(settings):
             if "Master" not in option and option[0] != "_":
                 self.log_special("  |   %(key)s = %(value)s" % {"key": option, "value": str(settings.__dict__[option])})
+                
+        self.check_validation_patterns()
     
     def log_special(self, text):
         logging.info(text)
@@ -146,6 +149,42 @@ class DefaultSecurityConfiguration(SecurityConfiguration):
     def get_allowed_login_attempts(self):
         return settings.Authenticator_AllowedLoginAttempts
         
+    def get_password_policy(self):
+        return settings.Authenticator_PasswordPolicy
+        
+    def get_breach_filter_false_positive_rate(self):
+        return settings.Authenticator_BreachFilterFalsePositiveRate
+        
+    def get_password_hash_algorithm(self):
+        return settings.Authenticator_PasswordHashAlgorithm
+        
+    def get_password_hash_parameters(self):
+        return settings.Authenticator_PasswordHashParameters
+        
+    def get_hashing_processes(self):
+        return settings.Authenticator_HashingProcesses
+        
+    def get_hashing_max_pending(self):
+        return settings.Authenticator_HashingMaxPending
+        
+    def get_hashing_timeout(self):
+        return settings.Authenticator_HashingTimeout
+        
+    def get_verification_cache_ttl(self):
+        return settings.Authenticator_VerificationCacheTTL
+        
+    def get_verification_cache_size(self):
+        return settings.Authenticator_VerificationCacheSize
+        
+    def get_user_flush_interval(self):
+        return settings.Authenticator_UserFlushInterval
+        
+    def get_user_cache_size(self):
+        return settings.Authenticator_UserCacheSize
+        
+    def get_user_cache_ttl(self):
+        return settings.Authenticator_UserCacheTTL
+        
     # Encryption
     def get_encryption_keys_location(self):
         return settings.Encryptor_KeysLocation
@@ -221,16 +260,69 @@ class DefaultSecurityConfiguration(SecurityConfiguration):
         
     # Validation
     def get_validation_pattern(self, key):
-        value = getattr(settings, "Validator_" + key, None)
+        value = self.validation_profile.get_pattern(key)
         if value is None: 
-            self.log_special(_("Trying to get validation pattern Validator_%(key)s failed because it doesn't exist") %
-            {'key' : key})
-            return None
+            if key not in self.validation_profile:
+                self.log_special(_("Trying to get validation pattern Validator_%(key)s failed because it doesn't exist") %
+                    {'key' : key})
+            else:
+                self.log_special(_("SecurityConfiguration for Validator_%(key)s is not a valid regex in settings. Returning None.") % 
+                    {'key' : key})
+        return value
             
-        try:
-            return re.compile(value)
-        except Exception, extra:
-            self.log_special(_("SecurityConfiguration for Validator_%(key)s is not a valid regex in settings. Returning None.") % 
-                {'key' : key})
-            return None
+    def get_validation_profile(self):
+        return self.validation_profile
+            
+    def get_validation_pattern_engine(self):
+        return settings.Validation_PatternEngine
+        
+    def get_validation_pattern_timeout(self):
+        return settings.Validation_PatternMatchTimeout
+        
+    def get_validation_pattern_processes(self):
+        return settings.Validation_PatternProcesses
+        
+    def get_validation_directory_cache_ttl(self):
+        return settings.Validation_DirectoryCacheTTL
+        
+    def get_validation_batch_threads(self):
+        return settings.Validation_BatchThreads
+        
+    def get_validation_redirect_allow_list(self):
+        return settings.Validation_RedirectAllowList
+        
+    def get_validation_metrics_enabled(self):
+        return settings.Validation_MetricsEnabled
+        
+    def get_validation_profile_cache_file(self):
+        return settings.Validation_ProfileCacheFile
+        
+    def get_validation_async_max_pending(self):
+        return settings.Validation_AsyncMaxPending
+        
+    def get_validation_json_max_depth(self):
+        return settings.Validation_JSONMaxDepth
+        
+    def get_validation_json_max_keys(self):
+        return settings.Validation_JSONMaxKeys
+        
+    def check_validation_patterns(self):
+        """
+        Compiles every Validator_ pattern in settings into the validation
+        profile. Logs a warning for every pattern that does not compile, or
+        that contains a construct which can backtrack exponentially on
+        attacker-supplied input.
+        """
+        self.validation_profile = load_profile(settings,
+            self.get_validation_profile_cache_file())
+        errors = self.validation_profile.get_errors()
+        warnings = self.validation_profile.get_warnings()
+        for key in self.validation_profile.get_names():
+            if key in errors:
+                self.log_special(_("SecurityConfiguration for %(key)s is not a valid regex in settings.") %
+                    {'key' : "Validator_" + key})
+            for warning in warnings.get(key, ()):
+                self.log_special(_("WARNING - %(key)s may be vulnerable to regular expression denial of service: %(warning)s") %
+                    {'key' : "Validator_" + key,
+                     'warning' : warning})
    
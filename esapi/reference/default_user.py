@@ -21,6 +21,7 @@
 # Some methods not implemented
 # Safe initial values
 
+import copy
 from datetime import datetime, timedelta
 
 from esapi.core import ESAPI
@@ -34,6 +35,9 @@ class DefaultUser(User):
     """
     The reference implementation of the User interface. This implementation
     is pickled/shelved into a flat file.
+    
+    The user keeps track of the fields changed since it was last stored, so
+    that the Authenticator only writes the users that changed.
     """
     
     IDLE_TIMEOUT_LENGTH = ESAPI.security_configuration().get_session_idle_timeout_length()
@@ -42,20 +46,27 @@ class DefaultUser(User):
     
     MAX_ROLE_LENGTH = 250
     
-    def __init__(self, account_name):
+    def __init__(self, account_name, account_id=None):
         """
         Instantiates a new user.
         
         @param account_name: The name of this user's account.
+        @param account_id: The account id, when restoring a user that already
+            has one. The caller must ensure it is unused. By default, a new
+            unused id is picked.
         """
         User.__init__(self)
         
+        # Names of the fields changed since the user was last stored
+        self._dirty = set()
+        
         self._account_name = None
         self._set_account_name(account_name)
         
         # Get random numbers until we find an unused account number
         # WARNING: This could cause in infinite loop if the number of users equals the keyspace of uids.
-        while True:
+        self._account_id = account_id
+        while self._account_id is None:
             id = ESAPI.randomizer().get_random_integer(1)
             if id != 0 and not ESAPI.authenticator().exists(account_id=id):
                 self._account_id = id
@@ -146,6 +157,7 @@ class DefaultUser(User):
         
     def _set_locale(self, locale):
         self._locale = locale
+        self._dirty.add('locale')
        
     locale = property( _get_locale, _set_locale )
         
@@ -164,6 +176,7 @@ class DefaultUser(User):
                             False):
             if role not in self._roles:
                 self._roles.append(role)
+                self._dirty.add('roles')
                 self.logger.info(Logger.SECURITY_SUCCESS,
                      _("Role %(role_name)s added to %(account_name)s") %
                      {'role_name' : role,
@@ -184,6 +197,7 @@ class DefaultUser(User):
             
         try:
             self._roles.remove(role)
+            self._dirty.add('roles')
             self.logger.trace(Logger.SECURITY_SUCCESS,
                 _("Role %(role_name)s removed from %(account_name)") %
                 {'role_name' : role,
@@ -203,6 +217,7 @@ class DefaultUser(User):
 
     def _set_roles(self, roles):
         self._roles = list(roles)[:]
+        self._dirty.add('roles')
         
     roles = property( _get_roles,
                       _set_roles,
@@ -227,6 +242,7 @@ class DefaultUser(User):
         
     def _set_last_password_change_time(self, time):
         self._last_password_change_time = time
+        self._dirty.add('last_password_change_time')
         self.logger.info( Logger.SECURITY_SUCCESS,
             _("Set last password change time to %(time)s for %(account_name)s") %
             {'time' : time,
@@ -239,12 +255,14 @@ class DefaultUser(User):
     # Enable/Disable
     def disable(self):
         self._enabled = False
+        self._dirty.add('enabled')
         self.logger.info( Logger.SECURITY_SUCCESS, 
             _("Account disabled: %(account_name)s") %
             {'account_name' : self.account_name})
         
     def enable(self):
         self._enabled = True
+        self._dirty.add('enabled')
         self.logger.info( Logger.SECURITY_SUCCESS,
             _("Account enabled: %(account_name)s") %
             {'account_name' : self.account_name})
@@ -266,6 +284,8 @@ class DefaultUser(User):
     def _set_account_name(self, name):
         old = self.account_name
         self._account_name = name.lower()
+        if old is not None:
+            self._dirty.add('account_name')
         if old is not None:
             if old == "":
                 old = "[nothing]"
@@ -288,6 +308,7 @@ class DefaultUser(User):
     def reset_csrf_token(self):
         self._csrf_token = ESAPI.randomizer().get_random_string(8, 
             Encoder.CHAR_ALPHANUMERICS)
+        self._dirty.add('csrf_token')
         return self.csrf_token
         
     # Expiration
@@ -296,6 +317,7 @@ class DefaultUser(User):
         
     def _set_expiration_time(self, expiration_time):
         self._expiration_time = expiration_time
+        self._dirty.add('expiration_time')
         self.logger.info( Logger.SECURITY_SUCCESS,
             _("Account expiration time was set to %(time)s for %(account_name)s") %
             {'time' : expiration_time,
@@ -314,12 +336,14 @@ class DefaultUser(User):
         
     def increment_failed_login_count(self):
         self._failed_login_count += 1
+        self._dirty.add('failed_login_count')
         
     def _get_last_failed_login_time(self):
         return self._last_failed_login_time
         
     def _set_last_failed_login_time(self, time):
         self._last_failed_login_time = time
+        self._dirty.add('last_failed_login_time')
         self.logger.info( Logger.SECURITY_SUCCESS, 
             _("Set last failed login time to %(time)s for %(user)s") %
             {'time' : time,
@@ -343,6 +367,7 @@ class DefaultUser(User):
                 {'old' : self._last_host_address,
                  'new' : address})
         self._last_host_address = address
+        self._dirty.add('last_host_address')
         
     last_host_address = property( _get_last_host_address,
                              _set_last_host_address,
@@ -354,6 +379,7 @@ class DefaultUser(User):
         
     def _set_last_login_time(self, time):
         self._last_login_time = time
+        self._dirty.add('last_login_time')
         self.logger.info( Logger.SECURITY_SUCCESS,
             _("Set last successful login time to %(time)s for %(account_name)s") %
             {'time' : time,
@@ -369,6 +395,7 @@ class DefaultUser(User):
         
     def _set_screen_name(self, new_screen_name):
         self._screen_name = new_screen_name
+        self._dirty.add('screen_name')
         self.logger.info( Logger.SECURITY_SUCCESS,
             _("ScreenName changed to %(new)s for %(account_name)s") %
             {'new' : new_screen_name,
@@ -415,6 +442,7 @@ class DefaultUser(User):
     # Locking
     def lock(self):
         self._locked = True
+        self._dirty.add('locked')
         self.logger.info( Logger.SECURITY_SUCCESS,
             _("Account locked: %(account_name)s") %
             {'account_name' : self.account_name})
@@ -422,6 +450,7 @@ class DefaultUser(User):
     def unlock(self):
         self._locked = False
         self._failed_login_count = 0
+        self._dirty.update(('locked', 'failed_login_count'))
         self.logger.info( Logger.SECURITY_SUCCESS,
             _("Account unlocked: %(account_name)s") % 
             {'account_name' : self.account_name})
@@ -429,6 +458,23 @@ class DefaultUser(User):
     def is_locked(self):
         return self._locked
         
+    # Persistence
+    def is_dirty(self):
+        return len(self._dirty) > 0
+        
+    def get_dirty_fields(self):
+        return frozenset(self._dirty)
+        
+    def clear_dirty(self):
+        self._dirty.clear()
+        
+    def copy_changes_to(self, other):
+        # Each field is kept in the attribute of the same name, with a
+        # leading underscore
+        for field in self._dirty:
+            attribute = '_' + field
+            setattr(other, attribute, copy.copy(getattr(self, attribute)))
+        
     def __getstate__(self):
         # Copy the object's state from self.__dict__ which contains
         # all our instance attributes. Always use the dict.copy()
@@ -436,11 +482,15 @@ class DefaultUser(User):
         state = self.__dict__.copy()
         # Remove the unpicklable entries.
         del state['logger']
+        # A stored user has no unsaved changes
+        state['_dirty'] = set()
         return state
 
     def __setstate__(self, state):
         """
         Restore unpickleable instance attributes like logger.
         """
+        # Users stored before dirty tracking have no _dirty field
+        self._dirty = set()
         self.__dict__.update(state)
         self.logger = ESAPI.logger("DefaultUser")
@@ -19,6 +19,7 @@
 import os.path
 
 from esapi.validator import Validator
+from esapi.validation_rule import ValidationRule
 from esapi.core import ESAPI
 from esapi.translation import _
 
@@ -28,9 +29,19 @@ from esapi.codecs.percent import PercentCodec
 from esapi.exceptions import ValidationException
 
 from esapi.reference.validation.credit_card_validation_rule import CreditCardValidationRule
+from esapi.reference.validation.directory_cache import DirectoryCache
 from esapi.reference.validation.date_validation_rule import DateValidationRule
+from esapi.reference.validation.file_content_validation_rule import FileContentValidationRule
+from esapi.reference.validation.html_validation_rule import HTMLValidationRule
+from esapi.reference.validation.json_validation_rule import JSONValidationRule
+from esapi.reference.validation.redirect_validation_rule import RedirectPolicy
+from esapi.reference.validation.redirect_validation_rule import RedirectValidationRule
 from esapi.reference.validation.number_validation_rule import NumberValidationRule
 from esapi.reference.validation.string_validation_rule import StringValidationRule
+from esapi.reference.validation.validation_metrics import enable_metrics
+from esapi.reference.validation.validation_metrics import instrumented_as
+from esapi.reference.validation.validator_registry import get_validator
+from esapi.reference.validation.validator_registry import register_validator
 
 class DefaultValidator(Validator):
     """
@@ -45,8 +56,6 @@ class DefaultValidator(Validator):
     MAX_PARAMETER_NAME_LENGTH = 100
     MAX_PARAMETER_VALUE_LENGTH = 65535
     
-    file_validator = None
-    
     def __init__(self, encoder=None):
         Validator.__init__(self)
         if encoder:
@@ -54,16 +63,18 @@ class DefaultValidator(Validator):
         else:
             self.encoder = ESAPI.encoder()
             
-        self.make_file_validator()
+        self.directory_cache = DirectoryCache(
+            ESAPI.security_configuration().get_validation_directory_cache_ttl() )
+        self.redirect_policy = None
+        if ESAPI.security_configuration().get_validation_metrics_enabled():
+            enable_metrics()
         
     def make_file_validator(self):
-        if DefaultValidator.file_validator is not None:
-            return
-        DefaultValidator.file_validator = 'fail'
-        file_codecs = [HTMLEntityCodec(), PercentCodec()]
-        encoder_class = ESAPI.security_configuration().get_class_for_interface('encoder')
-        file_encoder = encoder_class(file_codecs)
-        DefaultValidator.file_validator = DefaultValidator( file_encoder )
+        """
+        Returns the shared validator for file paths, whose encoder only 
+        decodes HTML entities and percent encoding.
+        """
+        return get_validator('file')
         
     def is_valid_input(self, context, input_, type_, max_length, allow_none):
         try:
@@ -73,6 +84,13 @@ class DefaultValidator(Validator):
             return False
             
     def get_valid_input(self, context, input_, type_, max_length, allow_none, error_list=None):
+        rvr = self.make_input_rule(type_, max_length, allow_none)
+        return rvr.get_valid(context, input_, error_list)
+        
+    def make_input_rule(self, type_, max_length, allow_none):
+        """
+        Returns the StringValidationRule used by get_valid_input.
+        """
         rvr = StringValidationRule( type_, self.encoder )
         pattern = ESAPI.security_configuration().get_validation_pattern(type_)
         if pattern is not None:
@@ -82,7 +100,7 @@ class DefaultValidator(Validator):
             
         rvr.set_maximum_length(max_length)
         rvr.set_allow_none(allow_none)
-        return rvr.get_valid(context, input_, error_list)
+        return rvr
         
     def is_valid_credit_card(self, context, input_, allow_none):
         try:
@@ -135,6 +153,7 @@ class DefaultValidator(Validator):
         except ValidationException:
             return False
             
+    @instrumented_as("directory_path")
     def get_valid_directory_path(self, context, input_, parent_dir, allow_none, errors=None):
         """
         Returns a canonicalized and validated directory path as a String. 
@@ -167,11 +186,17 @@ class DefaultValidator(Validator):
                     'parent_dir' : parent_dir},
                    context )
            
+            # Directories validated recently and unchanged since
+            cached = self.directory_cache.get(input_, parent_dir)
+            if cached is not None:
+                return cached
+                
             ################################
             
             # Canonicalize input_
+            file_validator = get_validator('file')
             canonical_input2 = os.path.realpath(input_)
-            canonical_input1 = DefaultValidator.file_validator.get_valid_input(context, canonical_input2, "DirectoryName", 255, False)
+            canonical_input1 = file_validator.get_valid_input(context, canonical_input2, "DirectoryName", 255, False)
             canonical_input = os.path.normcase(canonical_input1)
             
             # Check that canonical matches input
@@ -188,7 +213,7 @@ class DefaultValidator(Validator):
                 
             # Canonicalize parent_dir
             canonical_parent2 = os.path.realpath(parent_dir)
-            canonical_parent1 = DefaultValidator.file_validator.get_valid_input(context, canonical_parent2, "DirectoryName", 255, False)
+            canonical_parent1 = file_validator.get_valid_input(context, canonical_parent2, "DirectoryName", 255, False)
             canonical_parent = os.path.normcase(canonical_parent1)
             
             # Check that canonical matches parent_dir
@@ -236,6 +261,7 @@ class DefaultValidator(Validator):
                     'parent_dir' : canonical_parent}, 
                    context )
                 
+            self.directory_cache.put(input_, parent_dir, canonical_input)
             return canonical_input
             
         except ValidationException, extra:
@@ -251,6 +277,7 @@ class DefaultValidator(Validator):
         except ValidationException:
             return False
             
+    @instrumented_as("filename")
     def get_valid_filename( self, context, input_, allow_none, error_list=None, allowed_extensions=None):
         try:
             if self.is_empty(input_):
@@ -326,7 +353,7 @@ class DefaultValidator(Validator):
                     _("%(context)s: Invalid file content can not exceed %(max_bytes)s bytes") % 
                    {'context' : context,
                     'max_bytes' : esapi_max_bytes}, 
-                   _("Exceeded ESAPI max length of %(max_bytes) bytes by %(exceeded)s bytes") % 
+                   _("Exceeded ESAPI max length of %(max_bytes)s bytes by %(exceeded)s bytes") % 
                    {'max_bytes' : esapi_max_bytes,
                     'exceeded' : len(input_) - esapi_max_bytes}, 
                   context )
@@ -348,6 +375,31 @@ class DefaultValidator(Validator):
             else:
                 raise
                 
+    def is_valid_file_content_stream(self, context, input_, max_bytes, allow_none,
+                                           magic_numbers=None,
+                                           forbidden_patterns=None,
+                                           encoding=None):
+        try:
+            self.get_valid_file_content_stream( context, input_, max_bytes, allow_none,
+                magic_numbers, forbidden_patterns, encoding )
+            return True
+        except ValidationException:
+            return False
+            
+    def get_valid_file_content_stream(self, context, input_, max_bytes, allow_none,
+                                            magic_numbers=None,
+                                            forbidden_patterns=None,
+                                            encoding=None,
+                                            error_list=None):
+        fcvr = FileContentValidationRule("filecontent", self.encoder, max_bytes)
+        fcvr.set_allow_none(allow_none)
+        for magic_number in magic_numbers or ():
+            fcvr.add_magic_number(magic_number)
+        for pattern in forbidden_patterns or ():
+            fcvr.add_forbidden_pattern(pattern)
+        fcvr.set_encoding(encoding)
+        return fcvr.get_valid(context, input_, error_list)
+                
     def is_valid_file_upload(self, context,
                                 directory_path,
                                 parent,
@@ -383,24 +435,127 @@ class DefaultValidator(Validator):
     def assert_is_valid_http_request_parameter_set(self, context, required, optional, error_list=None):
         raise NotImplementedError()
         
+    def is_valid_json(self, context, input_, rules, max_bytes, allow_none):
+        try:
+            self.get_valid_json( context, input_, rules, max_bytes, allow_none )
+            return True
+        except ValidationException:
+            return False
+            
+    def get_valid_json(self, context, input_, rules, max_bytes, allow_none, error_list=None):
+        config = ESAPI.security_configuration()
+        jvr = JSONValidationRule("json", self.encoder, max_bytes)
+        jvr.set_allow_none(allow_none)
+        jvr.set_maximum_depth(config.get_validation_json_max_depth())
+        jvr.set_maximum_keys(config.get_validation_json_max_keys())
+        for path, rule in rules.items():
+            jvr.add_rule(path, rule)
+        return jvr.get_valid(context, input_, error_list)
+        
     def is_valid_redirect_location(self, context, input_, allow_none):
-        return self.is_valid_input( context, input_, "Redirect", 512, allow_none)
+        try:
+            self.get_valid_redirect_location( context, input_, allow_none )
+            return True
+        except ValidationException:
+            return False
         
     def get_valid_redirect_location(self, context, input_, allow_none, error_list=None):
-        return self.get_valid_input( context, input_, "Redirect", 512, allow_none, error_list )
+        policy = self.get_redirect_policy()
+        if policy is None:
+            return self.get_valid_input( context, input_, "Redirect", 512, allow_none, error_list )
+        rvr = RedirectValidationRule("redirect", self.encoder, policy)
+        rvr.set_maximum_length(512)
+        rvr.set_allow_none(allow_none)
+        return rvr.get_valid(context, input_, error_list)
+        
+    def get_redirect_policy(self):
+        """
+        Returns the RedirectPolicy compiled from the redirect allow list in
+        ESAPI.conf.settings, or None if the list is empty.
+        """
+        if self.redirect_policy is None:
+            allow_list = ESAPI.security_configuration().get_validation_redirect_allow_list()
+            if not allow_list:
+                return None
+            self.redirect_policy = RedirectPolicy(allow_list)
+        return self.redirect_policy
                                       
     def safe_read_line(self, input_stream, max_length):
         return input_stream.readline(max_length)
         
+    def safe_read_lines(self, context, input_stream, type_, max_length, allow_none, error_list=None):
+        # Build the rule once for the whole stream
+        if isinstance(type_, ValidationRule):
+            rule = type_
+        else:
+            rule = self.make_input_rule(type_, max_length, allow_none)
+            
+        line_number = 0
+        while True:
+            line, overlong = self._read_bounded_line(input_stream, max_length)
+            if line is None:
+                break
+            line_number += 1
+            line_context = "%s[%s]" % (context, line_number)
+            
+            if overlong:
+                extra = ValidationException( 
+                   _("%(context)s: Invalid input. The line is too long") %
+                   {'context' : line_context},
+                   _("Line exceeds maximum allowed length of %(max_length)s: context=%(context)s") %
+                   {'context' : line_context,
+                    'max_length' : max_length},
+                   line_context )
+                if error_list is None:
+                    raise extra
+                error_list[line_context] = extra
+                yield None
+            else:
+                yield rule.get_valid(line_context, line, error_list)
+                
+    def _read_bounded_line(self, input_stream, max_length):
+        """
+        Reads one line of at most max_length characters, not counting the
+        line terminator, which is removed. The rest of a longer line is read
+        and discarded in chunks, so memory use is bounded by max_length.
+        
+        @return: a tuple of the line, or None at the end of the stream, and 
+            True if the line was longer than max_length
+        """
+        # Room for the longest allowed line and a \r\n terminator
+        size = max_length + 2
+        line = input_stream.readline(size)
+        if not line:
+            return None, False
+            
+        if line.endswith('\r\n'):
+            line = line[:-2]
+        elif line.endswith('\n'):
+            line = line[:-1]
+        elif len(line) == size:
+            # Discard the rest of the line
+            chunk = line
+            while chunk and not chunk.endswith('\n'):
+                chunk = input_stream.readline(size)
+            return '', True
+        return line, len(line) > max_length
+        
     def is_valid_safe_html(self, context, input_, max_length, allow_none):
-        raise NotImplementedError()
+        try:
+            self.get_valid_safe_html( context, input_, max_length, allow_none )
+            return True
+        except ValidationException:
+            return False
         
     def get_valid_safe_html(self, context,
                                  input_,
                                  max_length,
                                  allow_none,
                                  error_list=None):
-        raise NotImplementedError()
+        hvr = HTMLValidationRule("safehtml", self.encoder)
+        hvr.set_maximum_length(max_length)
+        hvr.set_allow_none(allow_none)
+        return hvr.get_valid(context, input_, error_list)
                                       
     def is_empty(self, obj):
         """
@@ -413,3 +568,17 @@ class DefaultValidator(Validator):
             return True
             
         return False
+
+def _make_validator(*codec_classes):
+    """
+    Returns a factory of DefaultValidators whose encoder only decodes the
+    given codecs.
+    """
+    def factory():
+        encoder_class = ESAPI.security_configuration().get_class_for_interface('encoder')
+        return DefaultValidator( encoder_class([codec() for codec in codec_classes]) )
+    return factory
+
+# Validators for input that can only be encoded in some ways, shared by all
+# DefaultValidators and built the first time they are used
+register_validator('file', _make_validator(HTMLEntityCodec, PercentCodec))
@@ -0,0 +1,374 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: Password hashing with PBKDF2 or scrypt, storing the algorithm,
+    parameters and salt with each hash.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import time
+
+from esapi.core import ESAPI
+from esapi.translation import _
+from esapi.exceptions import EncryptionException
+
+SALT_LENGTH = 16
+
+def _encode(data):
+    return base64.b64encode(data).rstrip('=')
+
+def _decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def _bytes(password):
+    if isinstance(password, unicode):
+        return password.encode('utf-8')
+    return password
+
+class PasswordHasher:
+    """
+    Hashes passwords with one algorithm and set of parameters. Hashes are
+    stored as
+
+        $<algorithm>$<parameters>$<salt>$<hash>
+
+    with the parameters as comma separated name=value pairs, and the salt
+    and hash in base64 without padding. Hashes usually get a random salt,
+    so they are checked with verify_password() rather than by comparing
+    them.
+    """
+    algorithm = None
+
+    def hash(self, password, account_name, salt=None):
+        """
+        Returns the stored form of password.
+
+        @param password: the password to hash
+        @param account_name: the account the password belongs to
+        @param salt: the salt, as bytes. Defaults to a new random salt.
+        """
+        if salt is None:
+            salt = os.urandom(SALT_LENGTH)
+        return "$%s$%s$%s$%s" % (self.algorithm, self._format_parameters(),
+            _encode(salt), _encode(self.raw_hash(password, account_name, salt)))
+
+    def raw_hash(self, password, account_name, salt):
+        """
+        Returns the raw hash of password, as compared with the hash part of a
+        stored hash.
+        """
+        return self._derive(_bytes(password), salt)
+
+    def needs_update(self, stored_hash):
+        """
+        @return: true if stored_hash was made with another algorithm or
+            other parameters than this hasher's
+        """
+        parts = stored_hash.split('$')
+        return (len(parts) != 5 or
+            parts[1] != self.algorithm or
+            parts[2] != self._format_parameters())
+
+    @classmethod
+    def from_stored(cls, algorithm, parameters):
+        """
+        Returns a hasher for the algorithm and parameters fields of a stored
+        hash.
+        """
+        raise NotImplementedError()
+
+    def get_parameters(self):
+        """
+        @return: the parameters of this hasher as a dictionary, in the form
+            used by Authenticator_PasswordHashParameters
+        """
+        raise NotImplementedError()
+
+    def _format_parameters(self):
+        raise NotImplementedError()
+
+    def _derive(self, password, salt):
+        raise NotImplementedError()
+
+def _parse_parameters(text):
+    parameters = {}
+    for pair in text.split(','):
+        name, value = pair.split('=')
+        parameters[name] = int(value)
+    return parameters
+
+class PBKDF2PasswordHasher(PasswordHasher):
+    """
+    Hashes passwords with PBKDF2-HMAC, using hashlib.pbkdf2_hmac.
+    """
+    def __init__(self, digest='sha512', iterations=100000):
+        try:
+            hashlib.new(digest)
+        except ValueError:
+            raise EncryptionException(
+                _("Problem hashing"),
+                _("Internal Error - Can't find hash algorithm %(algorithm)s") %
+                {'algorithm' : digest} )
+        self.digest = str(digest)
+        self.iterations = iterations
+        self.algorithm = 'pbkdf2-' + digest
+
+    @classmethod
+    def from_stored(cls, algorithm, parameters):
+        return cls(algorithm.split('-', 1)[1], _parse_parameters(parameters)['i'])
+
+    def get_parameters(self):
+        return {'digest' : self.digest, 'iterations' : self.iterations}
+
+    def _format_parameters(self):
+        return "i=%d" % self.iterations
+
+    def _derive(self, password, salt):
+        return hashlib.pbkdf2_hmac(self.digest, password, salt, self.iterations)
+
+class ScryptPasswordHasher(PasswordHasher):
+    """
+    Hashes passwords with scrypt, using hashlib.scrypt. hashlib only provides
+    scrypt when Python is built against OpenSSL 1.1 or later.
+    """
+    algorithm = 'scrypt'
+
+    def __init__(self, n=16384, r=8, p=1):
+        if not hasattr(hashlib, 'scrypt'):
+            raise EncryptionException(
+                _("Problem hashing"),
+                _("Internal Error - This Python's hashlib does not provide scrypt") )
+        self.n = n
+        self.r = r
+        self.p = p
+
+    @classmethod
+    def from_stored(cls, algorithm, parameters):
+        parameters = _parse_parameters(parameters)
+        return cls(parameters['n'], parameters['r'], parameters['p'])
+
+    def get_parameters(self):
+        return {'n' : self.n, 'r' : self.r, 'p' : self.p}
+
+    def _format_parameters(self):
+        return "n=%d,r=%d,p=%d" % (self.n, self.r, self.p)
+
+    def _derive(self, password, salt):
+        # scrypt needs 128 * r * (n + p) bytes, plus some room
+        maxmem = 128 * self.r * (self.n + self.p + 2) + 1024 * 1024
+        return hashlib.scrypt(password, salt=salt, n=self.n, r=self.r,
+            p=self.p, maxmem=maxmem, dklen=64)
+
+class LegacyPasswordHasher(PasswordHasher):
+    """
+    Checks hashes made by Encryptor.hash with the account name as the salt,
+    which were stored without an algorithm prefix. It does not make new
+    hashes, so every legacy hash needs an update.
+    """
+    algorithm = 'legacy'
+
+    def hash(self, password, account_name, salt=None):
+        raise EncryptionException(
+            _("Problem hashing"),
+            _("Internal Error - Legacy password hashes are only verified") )
+
+    def raw_hash(self, password, account_name, salt):
+        # The whole stored string is the hash
+        return ESAPI.encryptor().hash(password, account_name.lower())
+
+    def needs_update(self, stored_hash):
+        return True
+
+_hashers = {
+    'pbkdf2' : PBKDF2PasswordHasher,
+    'scrypt' : ScryptPasswordHasher,
+    }
+
+def register_password_hasher(name, hasher_class):
+    """
+    Makes a PasswordHasher subclass available under name, both for the
+    Authenticator_PasswordHashAlgorithm setting and for reading stored hashes
+    whose algorithm is name, or starts with name followed by '-'.
+    """
+    _hashers[name] = hasher_class
+
+def get_password_hasher(algorithm=None, parameters=None):
+    """
+    Returns a hasher for algorithm and parameters, which default to the
+    configured Authenticator_PasswordHashAlgorithm and
+    Authenticator_PasswordHashParameters.
+    """
+    config = ESAPI.security_configuration()
+    if algorithm is None:
+        algorithm = config.get_password_hash_algorithm()
+        if parameters is None:
+            parameters = config.get_password_hash_parameters()
+    if parameters is None:
+        parameters = {}
+    try:
+        hasher_class = _hashers[algorithm]
+    except KeyError:
+        raise EncryptionException(
+            _("Problem hashing"),
+            _("Internal Error - Unknown password hash algorithm %(algorithm)s") %
+            {'algorithm' : algorithm} )
+    return hasher_class(**parameters)
+
+def _split(stored_hash):
+    """
+    Splits a stored hash into the hasher and salt that made it and the raw
+    hash to compare with. Malformed salts and hashes give a hash that
+    matches nothing.
+    """
+    if not stored_hash.startswith('$'):
+        return LegacyPasswordHasher(), None, stored_hash
+    parts = stored_hash.split('$')
+    hasher_class = None
+    if len(parts) == 5:
+        hasher_class = _hashers.get(parts[1].split('-', 1)[0])
+    if hasher_class is None:
+        raise EncryptionException(
+            _("Problem hashing"),
+            _("Internal Error - Unknown password hash format") )
+    try:
+        hasher = hasher_class.from_stored(parts[1], parts[2])
+    except (ValueError, TypeError, KeyError, IndexError):
+        raise EncryptionException(
+            _("Problem hashing"),
+            _("Internal Error - Bad password hash parameters") )
+    try:
+        return hasher, _decode(parts[3]), _decode(parts[4])
+    except TypeError:
+        return hasher, '', None
+
+def get_salt(stored_hash):
+    """
+    Returns the salt of a stored hash, as bytes, or None for legacy hashes.
+    """
+    return _split(str(stored_hash))[1]
+
+def identify_hasher(stored_hash):
+    """
+    Returns a hasher with the algorithm and parameters that made stored_hash.
+    """
+    return _split(str(stored_hash))[0]
+
+def verify_password(password, account_name, stored_hash):
+    """
+    Checks password against a stored hash of any supported format.
+
+    @return: true if the password matches
+    """
+    return verify_any(password, account_name, (stored_hash,))
+
+def verify_any(password, account_name, stored_hashes):
+    """
+    Checks password against several stored hashes, such as a password
+    history. Hashes that share their algorithm, parameters and salt are
+    checked against a single hash of password, and every hash is compared
+    in constant time, whether or not an earlier one matched.
+
+    @return: true if the password matches any of stored_hashes
+    """
+    computed = {}
+    matched = False
+    for stored_hash in stored_hashes:
+        # Hashes are ASCII, but may be read back from storage as unicode
+        stored_hash = str(stored_hash)
+        hasher, salt, expected = _split(stored_hash)
+        if expected is None:
+            continue
+        # Everything up to the hash itself: algorithm, parameters and salt
+        key = stored_hash[:stored_hash.rfind('$') + 1]
+        actual = computed.get(key)
+        if actual is None:
+            actual = hasher.raw_hash(password, account_name, salt)
+            computed[key] = actual
+        if hmac.compare_digest(actual, expected):
+            matched = True
+    return matched
+
+# Calibration
+def calibrate(algorithm, target_seconds, digest='sha512'):
+    """
+    Picks the parameters that make one hash take about target_seconds on
+    this machine.
+
+    @param algorithm: 'pbkdf2' or 'scrypt'
+    @param target_seconds: the time one password verification should take
+    @return: the parameters, in the form used by
+        Authenticator_PasswordHashParameters
+    """
+    def measure(hasher):
+        start = time.time()
+        hasher._derive('calibration password', 'calibration salt')
+        return time.time() - start
+
+    if algorithm == 'pbkdf2':
+        iterations = 1000
+        while True:
+            elapsed = measure(PBKDF2PasswordHasher(digest, iterations))
+            if elapsed >= target_seconds / 4.0 or iterations >= 1 << 30:
+                break
+            iterations *= 2
+        # PBKDF2 time grows linearly with iterations
+        iterations = int(iterations * target_seconds / max(elapsed, 1e-6))
+        return {'digest' : digest, 'iterations' : max(iterations, 1000)}
+
+    elif algorithm == 'scrypt':
+        # scrypt time and memory grow linearly with n, a power of two
+        n = 1024
+        while n < 1 << 20:
+            elapsed = measure(ScryptPasswordHasher(n * 2))
+            if elapsed > target_seconds:
+                break
+            n *= 2
+        return {'n' : n, 'r' : 8, 'p' : 1}
+
+    raise EncryptionException(
+        _("Problem hashing"),
+        _("Internal Error - Unknown password hash algorithm %(algorithm)s") %
+        {'algorithm' : algorithm} )
+
+def main(args):
+    """
+    Prints the password hashing settings for a target verification time:
+        python -m esapi.reference.password_hashing [pbkdf2|scrypt] [milliseconds]
+    """
+    if len(args) > 2:
+        print main.__doc__
+        return 2
+    algorithm = 'pbkdf2'
+    milliseconds = 250
+    if len(args) > 0:
+        algorithm = args[0]
+    if len(args) > 1:
+        milliseconds = int(args[1])
+    parameters = calibrate(algorithm, milliseconds / 1000.0)
+    hasher = get_password_hasher(algorithm, parameters)
+    start = time.time()
+    hasher.hash('calibration password', 'calibration')
+    print "# One verification takes %d ms on this machine" % (
+        (time.time() - start) * 1000)
+    print "Authenticator_PasswordHashAlgorithm = %r" % algorithm
+    print "Authenticator_PasswordHashParameters = %r" % parameters
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,273 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: Runs password hashing on a bounded pool of worker processes.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import multiprocessing
+import threading
+import time
+
+from esapi.core import ESAPI
+from esapi.translation import _
+from esapi.exceptions import AvailabilityException, EncryptionException
+from esapi.reference.password_hashing import verify_password, verify_any
+from esapi.reference.validation.async_validator import ValidationFuture
+
+def _timedelta_to_seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
+
+def _hash(hasher, password, account_name, salt):
+    return hasher.hash(password, account_name, salt)
+
+def _work(function, args):
+    """
+    Runs in a worker process. ESAPI exceptions cannot be unpickled, so
+    failures are returned as messages.
+    """
+    try:
+        return True, function(*args)
+    except Exception, extra:
+        return False, "%s: %s" % (extra.__class__.__name__, extra)
+
+class PasswordHashingPool:
+    """
+    Hashes and verifies passwords on a pool of worker processes, so that
+    hashing neither holds the GIL of the process serving requests nor ties
+    up its request threads.
+
+    At most max_pending hashes may be queued or running. Past that, calls
+    fail at once with an AvailabilityException, so that a burst of login
+    attempts, such as credential stuffing, is turned away instead of
+    starving other requests. A call that waits longer than timeout for its
+    result also fails with an AvailabilityException.
+
+    With processes set to 0, hashing runs in the calling thread, still
+    limited to max_pending at a time.
+
+    A pool that has hashes pending but has not finished any of them for
+    timeout is taken to be stuck, for example because a worker died and
+    took its hash with it, and is replaced. A pool that is only busy, with
+    calls timing out while their hashes wait in its queue, is kept. Hashes still pending in a pool that is replaced or closed
+    fail with an AvailabilityException and give back their places.
+    """
+    def __init__(self, processes=2, max_pending=32, timeout=None):
+        """
+        @param processes: the number of worker processes, or 0 to hash in
+            the calling thread
+        @param max_pending: the most hashes queued or running at once
+        @param timeout: the longest time to wait for a hash, as a timedelta,
+            or None to wait for as long as it takes
+        """
+        self.processes = processes
+        self.max_pending = max_pending
+        self.timeout = None
+        if timeout is not None:
+            self.timeout = _timedelta_to_seconds(timeout)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        # The pool of each pending future, which holds a slot
+        self._pending = {}
+        # When the current pool last finished a hash, or became busy
+        self._progress = time.time()
+        self._lock = threading.Lock()
+
+    def hash(self, hasher, password, account_name, salt=None):
+        """
+        Returns hasher.hash(password, account_name, salt).
+
+        @raises AvailabilityException: if the pool is saturated or too slow
+        """
+        return self._get(self.hash_async(hasher, password, account_name, salt))
+
+    def verify(self, password, account_name, stored_hash):
+        """
+        Returns true if password matches stored_hash.
+
+        @raises AvailabilityException: if the pool is saturated or too slow
+        """
+        return self._get(self.verify_async(password, account_name, stored_hash))
+
+    def verify_any(self, password, account_name, stored_hashes):
+        """
+        Returns true if password matches any of stored_hashes. Hashes that
+        share a salt, as in a password history, cost a single hash.
+        """
+        return self._get(self._submit(verify_any, 
+            (password, account_name, tuple(stored_hashes))))
+
+    # Asynchronous
+    def hash_async(self, hasher, password, account_name, salt=None):
+        """
+        Like hash(), but returns a L{ValidationFuture} for the stored hash.
+        Event loop servers should add a done callback to the future rather
+        than wait on it.
+
+        @raises AvailabilityException: at once, if the pool is saturated
+        """
+        return self._submit(_hash, (hasher, password, account_name, salt))
+
+    def verify_async(self, password, account_name, stored_hash):
+        """
+        Like verify(), but returns a L{ValidationFuture} for the result.
+
+        @raises AvailabilityException: at once, if the pool is saturated
+        """
+        return self._submit(verify_password, (password, account_name, stored_hash))
+
+    def close(self):
+        """
+        Stops the worker processes, failing the hashes they had pending.
+        They are started again if needed.
+        """
+        self._lock.acquire()
+        try:
+            pool = self._pool
+            self._pool = None
+        finally:
+            self._lock.release()
+        if pool is not None:
+            self._stop(pool, _("Password hashing was stopped"))
+
+    def _stop(self, pool, message):
+        """
+        Terminates pool and fails its pending futures.
+        """
+        pool.terminate()
+        self._lock.acquire()
+        try:
+            futures = [future for future, owner in self._pending.items() if owner is pool]
+            for future in futures:
+                del self._pending[future]
+                self._slots.release()
+        finally:
+            self._lock.release()
+        for future in futures:
+            future.set_result(None, AvailabilityException(
+                _("Service unavailable"), message))
+
+    def _finish(self, future):
+        """
+        Gives back the slot of future. Returns False if the future was
+        already failed by _stop.
+        """
+        self._lock.acquire()
+        try:
+            if future not in self._pending:
+                return False
+            if self._pending.pop(future) is self._pool:
+                self._progress = time.time()
+            self._slots.release()
+            return True
+        finally:
+            self._lock.release()
+
+    def _submit(self, function, args):
+        if not self._slots.acquire(False):
+            raise AvailabilityException(
+                _("Service unavailable"),
+                _("Password hashing is saturated with %(count)s pending hashes") %
+                {'count' : self.max_pending} )
+
+        future = ValidationFuture()
+        def done(outcome):
+            # Free the slot only once the worker has finished
+            if not self._finish(future):
+                return
+            succeeded, value = outcome
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_result(None, EncryptionException(
+                    _("Problem hashing"), value))
+
+        try:
+            pool = None
+            if self.processes > 0:
+                pool = self._get_pool()
+            self._lock.acquire()
+            try:
+                if pool is not None and pool not in self._pending.values():
+                    # An idle pool has not been slow so far
+                    self._progress = time.time()
+                self._pending[future] = pool
+            finally:
+                self._lock.release()
+        except:
+            self._slots.release()
+            raise
+        if pool is None:
+            done(_work(function, args))
+            return future
+        try:
+            pool.apply_async(_work, (function, args), callback=done)
+        except:
+            self._finish(future)
+            raise
+        return future
+
+    def _get(self, future):
+        try:
+            return future.get(self.timeout)
+        except multiprocessing.TimeoutError:
+            # The hash may only have waited behind others in the queue. The
+            # pool is stuck if it has not finished any hash for as long.
+            self._lock.acquire()
+            try:
+                pool = self._pending.get(future)
+                if (pool is not None and pool is self._pool and
+                    time.time() - self._progress >= self.timeout):
+                    self._pool = None
+                else:
+                    pool = None
+            finally:
+                self._lock.release()
+            if pool is not None:
+                self._stop(pool, _("Password hashing pool was stuck and replaced"))
+            raise AvailabilityException(
+                _("Service unavailable"),
+                _("Password hashing did not finish within %(timeout)s seconds") %
+                {'timeout' : self.timeout} )
+
+    def _get_pool(self):
+        self._lock.acquire()
+        try:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.processes)
+                self._progress = time.time()
+            return self._pool
+        finally:
+            self._lock.release()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_hashing_pool():
+    """
+    Returns the pool shared by the Authenticators, configured by the
+    Authenticator_Hashing settings.
+    """
+    global _pool
+    if _pool is None:
+        _pool_lock.acquire()
+        try:
+            if _pool is None:
+                config = ESAPI.security_configuration()
+                _pool = PasswordHashingPool(config.get_hashing_processes(),
+                    config.get_hashing_max_pending(),
+                    config.get_hashing_timeout())
+        finally:
+            _pool_lock.release()
+    return _pool
@@ -0,0 +1,287 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: The rules that new passwords must pass, configured with the
+    Authenticator_PasswordPolicy setting.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import hashlib
+
+from esapi.core import ESAPI
+from esapi.translation import _
+from esapi.encoder import Encoder
+from esapi.exceptions import AuthenticationCredentialsException, ConfigurationException
+from esapi.reference import bloom_filter
+
+DEFAULT_CHARACTER_CLASSES = (Encoder.CHAR_PASSWORD_LOWERS,
+                             Encoder.CHAR_PASSWORD_UPPERS,
+                             Encoder.CHAR_PASSWORD_DIGITS,
+                             Encoder.CHAR_PASSWORD_SPECIALS)
+
+# Characters of no class translate to this
+_NO_CLASS = '\xff'
+
+class CharacterClasses:
+    """
+    Counts the character classes used in passwords with tables built once,
+    instead of searching each class for each character.
+    """
+    def __init__(self, character_classes=DEFAULT_CHARACTER_CLASSES):
+        """
+        @param character_classes: a sequence of fewer than 255 strings, the
+            characters of each class
+        """
+        # Each character maps to the index of its first class, for unicode
+        # passwords, and translates to the index as a byte, for others
+        self.table = {}
+        translation = [_NO_CLASS] * 256
+        for index, characters in reversed(list(enumerate(character_classes))):
+            for character in characters:
+                self.table[unicode(character)] = index
+                if ord(character) < 256:
+                    translation[ord(character)] = chr(index)
+        self.translation = ''.join(translation)
+
+    def count(self, password):
+        """
+        Returns the number of classes used in password. Characters outside
+        of every class are not counted.
+        """
+        if isinstance(password, unicode):
+            classes = set(map(self.table.get, set(password)))
+            classes.discard(None)
+        else:
+            classes = set(password.translate(self.translation))
+            classes.discard(_NO_CLASS)
+        return len(classes)
+
+_DEFAULT_CLASSES = CharacterClasses()
+
+def count_character_classes(password):
+    """
+    Returns the number of the default character classes, lowercase and
+    uppercase letters, digits and specials, used in password.
+    """
+    return _DEFAULT_CLASSES.count(password)
+
+def substrings(text, length):
+    """
+    Returns the set of substrings of text that are length characters long.
+    """
+    return set([text[i:i+length] for i in xrange(len(text) - length + 1)])
+
+class PasswordRule:
+    """
+    A rule that new passwords must pass.
+    """
+    def get_failure(self, new_password, old_password=None):
+        """
+        @param new_password: the new password
+        @param old_password: the password it replaces, or None
+        @return: None if new_password passes the rule, or else a message
+            saying why it does not
+        """
+        raise NotImplementedError()
+
+class LengthRule(PasswordRule):
+    """
+    Requires between min_length and max_length characters.
+    """
+    def __init__(self, min_length=0, max_length=None):
+        self.min_length = min_length
+        self.max_length = max_length
+
+    def get_failure(self, new_password, old_password=None):
+        if len(new_password) < self.min_length:
+            return (_("New password must be at least %(length)s characters long") %
+                {'length' : self.min_length})
+        if self.max_length is not None and len(new_password) > self.max_length:
+            return (_("New password must be at most %(length)s characters long") %
+                {'length' : self.max_length})
+
+class CharacterClassRule(PasswordRule):
+    """
+    Requires characters from at least min_classes of character_classes,
+    which default to lowercase and uppercase letters, digits and specials.
+    """
+    def __init__(self, min_classes=3, character_classes=DEFAULT_CHARACTER_CLASSES):
+        self.min_classes = min_classes
+        self.character_classes = CharacterClasses(character_classes)
+
+    def get_failure(self, new_password, old_password=None):
+        if self.character_classes.count(new_password) < self.min_classes:
+            return (_("New password must use at least %(count)s kinds of characters") %
+                {'count' : self.min_classes})
+
+class StrengthRule(PasswordRule):
+    """
+    Requires the length of the password times the number of character
+    classes it uses to be at least min_strength.
+    """
+    def __init__(self, min_strength=16, character_classes=DEFAULT_CHARACTER_CLASSES):
+        self.min_strength = min_strength
+        self.character_classes = CharacterClasses(character_classes)
+
+    def get_failure(self, new_password, old_password=None):
+        strength = len(new_password) * self.character_classes.count(new_password)
+        if strength < self.min_strength:
+            return _("New password is not long or complex enough")
+
+class OldPasswordRule(PasswordRule):
+    """
+    Rejects new passwords that contain any length character piece of the
+    old password.
+    """
+    # Past this combined length, comparing sets of pieces is quicker than
+    # searching the new password for each piece of the old one, which
+    # takes time proportional to the product of their lengths
+    SET_THRESHOLD = 256
+
+    def __init__(self, length=3):
+        self.length = length
+
+    def get_failure(self, new_password, old_password=None):
+        if old_password is None:
+            return None
+        length = self.length
+        if len(old_password) + len(new_password) < self.SET_THRESHOLD:
+            for i in xrange(len(old_password) - length + 1):
+                if old_password[i:i+length] in new_password:
+                    return _("New password cannot contain pieces of old password.")
+        elif not substrings(old_password, length).isdisjoint(
+            substrings(new_password, length)):
+            return _("New password cannot contain pieces of old password.")
+        return None
+
+class BreachListRule(PasswordRule):
+    """
+    Rejects passwords found in a list of breached passwords. The list holds
+    the uppercase hexadecimal SHA-1 hashes of the passwords, the format in
+    which such lists are published. Lists too large for memory are turned
+    into a BloomFilter, which rejects a few good passwords too, at its
+    false positive rate. A BloomFilter is looked up through open_filter on
+    every check, so a filter rebuilt by build_filter is used without a
+    restart.
+    """
+    def __init__(self, filename=None, hashes=None):
+        """
+        @param filename: a BloomFilter, or a file with a hash on each line,
+            optionally followed by ':' and a count
+        @param hashes: a container of hashes, instead of a file
+        """
+        self.filename = None
+        if hashes is None:
+            if bloom_filter.is_bloom_filter(filename):
+                self.filename = filename
+            else:
+                hashes = self.load(filename)
+        self.hashes = hashes
+
+    def load(filename):
+        """
+        Opens a BloomFilter, or reads the hashes of a breached password file
+        into a frozenset.
+        """
+        if bloom_filter.is_bloom_filter(filename):
+            return bloom_filter.open_filter(filename)
+        breach_file = open(filename, 'rb')
+        try:
+            return frozenset(line.split(':', 1)[0].strip().upper()
+                for line in breach_file if line.strip())
+        finally:
+            breach_file.close()
+    load = staticmethod(load)
+
+    def get_failure(self, new_password, old_password=None):
+        if isinstance(new_password, unicode):
+            new_password = new_password.encode('utf-8')
+        hashes = self.hashes
+        if hashes is None:
+            # One stat, to notice a rebuilt filter
+            hashes = bloom_filter.open_filter(self.filename)
+        if hashlib.sha1(new_password).hexdigest().upper() in hashes:
+            return _("New password appears in a list of breached passwords")
+
+_rules = {}
+
+def register_password_rule(name, rule_class):
+    """
+    Makes a PasswordRule subclass available under name for the
+    Authenticator_PasswordPolicy setting.
+    """
+    _rules[name] = rule_class
+
+register_password_rule('length', LengthRule)
+register_password_rule('character_classes', CharacterClassRule)
+register_password_rule('strength', StrengthRule)
+register_password_rule('old_password', OldPasswordRule)
+register_password_rule('breach_list', BreachListRule)
+
+class PasswordPolicy:
+    """
+    Checks new passwords against a sequence of rules, stopping at the first
+    that fails.
+    """
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+
+    def add_rule(self, rule):
+        self.rules.append(rule)
+
+    def get_failure(self, new_password, old_password=None):
+        """
+        @return: None if new_password passes every rule, or else the message
+            of the first rule that it fails
+        """
+        for rule in self.rules:
+            failure = rule.get_failure(new_password, old_password)
+            if failure is not None:
+                return failure
+        return None
+
+    def is_valid(self, new_password, old_password=None):
+        """
+        Returns whether new_password passes every rule. Unlike check(), a
+        failure is not logged or counted by the intrusion detector, so this
+        suits passwords that are not a user's, such as generated ones.
+        """
+        return self.get_failure(new_password, old_password) is None
+
+    def check(self, new_password, old_password=None):
+        """
+        @raises AuthenticationCredentialsException: if new_password fails
+            a rule
+        """
+        failure = self.get_failure(new_password, old_password)
+        if failure is not None:
+            raise AuthenticationCredentialsException(_("Invalid password"), failure)
+
+def get_password_policy(rules=None):
+    """
+    Returns a PasswordPolicy for rules, a sequence of (name, parameters)
+    pairs, which default to the configured Authenticator_PasswordPolicy.
+    """
+    if rules is None:
+        rules = ESAPI.security_configuration().get_password_policy()
+    policy = PasswordPolicy()
+    for name, parameters in rules:
+        try:
+            rule_class = _rules[name]
+        except KeyError:
+            raise ConfigurationException(
+                _('There is an error in the application configuration. See the security log for more details.'),
+                _("Unknown password rule %(name)s") % {'name' : name} )
+        policy.add_rule(rule_class(**parameters))
+    return policy
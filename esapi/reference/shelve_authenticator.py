@@ -20,12 +20,17 @@
 # Fix get_user_from_remember_token after seal/unseal written
 
 import shelve
+import threading
 from datetime import datetime
 
 from esapi.core import ESAPI
 from esapi.translation import _
 from esapi.logger import Logger
-from user_credentials import UserCredentials
+from user_credentials import UserCredentials, VerificationCache
+from user_cache import UserCache
+import password_hashing
+from password_hashing_pool import get_hashing_pool
+from password_policy import get_password_policy
 from esapi.authenticator import Authenticator
 from esapi.encoder import Encoder
 from esapi.http_utilities import HTTPUtilities
@@ -36,31 +41,87 @@ class ShelveAuthenticator(Authenticator):
     """
     This implementation uses Python's shelve module to store serialized
     user objects in a binary file.
+    
+    Users that have been read are kept in a UserCache, and only the users
+    that changed are written back. Changes are
+    written in batches at the configured flush interval, at the end of each
+    request by clear_current(), or by calling flush(). Locking, disabling,
+    expiring and changing the roles of a user are written at once when the
+    user is saved, and the user stays cached.
+    
+    Passwords are hashed and verified on the shared PasswordHashingPool. When
+    the pool is saturated, logins and password changes fail with an
+    AvailabilityException rather than wait. Successful verifications are
+    remembered for a short time in a VerificationCache.
     """
     # Key for user in session
     USER = "ESAPIUserSessionKey"
     USERS_FILENAME = "users.shelf"
     CREDS_FILENAME = "creds.shelf"
+    IDS_FILENAME = "ids.shelf"
     MAX_ACCOUNT_NAME_LENGTH = 250
-    MIN_PASSWORD_STRENGTH = 16
+    # Changes to these fields are written without waiting for the next flush
+    IMMEDIATE_FIELDS = frozenset(('locked', 'enabled', 'roles', 'expiration_time'))
     
     def __init__(self):
         Authenticator.__init__(self)
         self.logger = ESAPI.logger("Authenticator")
         
         users_filename = ESAPI.security_configuration().get_resource_file(self.USERS_FILENAME)
-        self.user_shelf = shelve.open(users_filename, writeback=True)
+        self.user_shelf = shelve.open(users_filename)
         
         cred_filename = ESAPI.security_configuration().get_resource_file(self.CREDS_FILENAME)
-        self.cred_shelf = shelve.open(cred_filename, writeback=True)
+        self.cred_shelf = shelve.open(cred_filename)
+        
+        # Changed users that were saved or dropped from the cache, but not
+        # yet written
+        self._pending = {}
+        self._lock = threading.RLock()
+        config = ESAPI.security_configuration()
+        self.user_cache = UserCache(config.get_user_cache_size(),
+            config.get_user_cache_ttl(), self._evicted)
+        self.verification_cache = VerificationCache(
+            config.get_verification_cache_size(),
+            config.get_verification_cache_ttl())
+        self.password_policy = get_password_policy()
+        self._last_flush = datetime.now()
+        
+        # Index of account names by account id
+        ids_filename = ESAPI.security_configuration().get_resource_file(self.IDS_FILENAME)
+        self.id_shelf = shelve.open(ids_filename)
+        if len(self.id_shelf) != len(self.user_shelf):
+            # Users stored before the index existed, or an index left out
+            # of date by a crash or an older copy of the files
+            self.rebuild_account_id_index()
+            
         self.current_user = esapi.user.AnonymousUser()
         
     def clear_current(self):
+        self.flush()
         self.current_user = esapi.user.AnonymousUser()
         
     def clear_all_data(self):
+        self._lock.acquire()
+        try:
+            self.user_cache.clear()
+            self._pending.clear()
+        finally:
+            self._lock.release()
         self.user_shelf.clear()
         self.cred_shelf.clear()
+        self.id_shelf.clear()
+        
+    def rebuild_account_id_index(self):
+        """
+        Rebuilds the index of account names by account id from the stored
+        users. Only needed if the index file was lost or the users were
+        stored by something other than this authenticator.
+        """
+        self.flush()
+        self.id_shelf.clear()
+        for account_name, user in self.user_shelf.iteritems():
+            self.id_shelf[str(user.account_id)] = account_name
+        self.id_shelf.sync()
         
     def login(self, request=None, response=None):
         if request is None:
@@ -97,7 +158,7 @@ class ShelveAuthenticator(Authenticator):
         # anonymous users cannot login
         if user.is_anonymous():
             user.logout()
-            self.user_shelf.sync()
+            self.save_user(user)
             raise AuthenticationLoginException(
                 _("Login failed"),
                 _("Anonymous user cannot be set to current user. User: %(user)s") %
@@ -107,7 +168,7 @@ class ShelveAuthenticator(Authenticator):
             user.logout()
             user.increment_failed_login_count()
             user.last_failed_login_count = datetime.now()
-            self.user_shelf.sync()
+            self.save_user(user)
             raise AuthenticationLoginException(
                 _("Login failed"),
                 reason + _(" User: %(user)s") %
@@ -146,7 +207,7 @@ class ShelveAuthenticator(Authenticator):
         user.add_session( session )
         session[self.USER] = user
         self.current_user = user
-        self.user_shelf.sync()
+        self.save_user(user)
         
         return user
         
@@ -180,7 +241,12 @@ class ShelveAuthenticator(Authenticator):
                 _("Authentication failed because user %(user)s doesn't exist") %
                 {'user' : username} )
          
-        user.login_with_password(password)
+        try:
+            user.login_with_password(password)
+        except AuthenticationException:
+            # Keep the failed login count and any lock it caused
+            self.save_user(user)
+            raise
         
         request.headers[user.csrf_token] = 'authenticated'
         return user
@@ -220,7 +286,7 @@ class ShelveAuthenticator(Authenticator):
                 _("Logging in user with remember token: %(username)s") %
                 {'username' : user.account_name} )
             user.login_with_password(password)
-            self.user_shelf.sync()
+            self.save_user(user)
             return user
         except AuthenticationException, extra:
             self.logger.warning( Logger.SECURITY_FAILURE,
@@ -239,9 +305,10 @@ class ShelveAuthenticator(Authenticator):
         
     def verify_password(self, user, password):
         try:
-            hash = self.hash_password(password, user.account_name)
             current_hash = self.get_hashed_password(user)
-            if hash == current_hash:
+            if self._check_password(user, password, current_hash):
+                if password_hashing.get_password_hasher().needs_update(current_hash):
+                    self.upgrade_hashed_password(user, password)
                 user.last_login_time = datetime.now()
                 user.failed_login_count = 0
                 self.logger.info( Logger.SECURITY_SUCCESS,
@@ -257,9 +324,22 @@ class ShelveAuthenticator(Authenticator):
             {'user' : user.account_name} )
         return False
         
+    def _check_password(self, user, password, current_hash):
+        """
+        Checks password against the current hash, skipping the hash if the
+        same password was verified recently.
+        """
+        if current_hash is None or password is None:
+            return False
+        if self.verification_cache.check(user.account_name, password, current_hash):
+            return True
+        if get_hashing_pool().verify(password, user.account_name, current_hash):
+            self.verification_cache.add(user.account_name, password, current_hash)
+            return True
+        return False
+        
     def get_hashed_password(self, user):
-        key = user.account_name
-        credentials = self.cred_shelf.get(key, None)
+        credentials = self.get_credentials(user.account_name)
         if credentials is None:
             return None
             
@@ -267,12 +347,24 @@ class ShelveAuthenticator(Authenticator):
         
     def set_hashed_password(self, user, new_hash):
         key = user.account_name
-        credentials = self.cred_shelf.get(key, None)
+        credentials = self.get_credentials(key)
         if credentials is None:
-            self.cred_shelf[key] = UserCredentials(key)
-            credentials = self.cred_shelf.get(key, None)
+            credentials = UserCredentials(key)
         
         credentials.change_password(new_hash)
+        self.save_credentials(credentials)
+        
+    def upgrade_hashed_password(self, user, password):
+        """
+        Rehashes the verified password of a user with the configured
+        algorithm and parameters, replacing the stored hash.
+        """
+        credentials = self.get_credentials(user.account_name)
+        credentials.update_hashed_password(self.hash_password(password, user.account_name))
+        self.save_credentials(credentials)
+        self.logger.info( Logger.SECURITY_SUCCESS,
+            _("Upgraded password hash for %(user)s") %
+            {'user' : user.account_name} )
         
     def logout(self, user=None):
         if user is None:
@@ -331,7 +423,8 @@ class ShelveAuthenticator(Authenticator):
         user = klass(account_name)
         
         try:
-            self.set_hashed_password(user, self.hash_password(password1, account_name))
+            credentials = UserCredentials(account_name)
+            credentials.change_password(self.hash_password(password1, account_name))
             user.last_password_change_time = datetime.now()
         except EncryptionException, extra:
             raise AuthenticationException(
@@ -340,12 +433,13 @@ class ShelveAuthenticator(Authenticator):
                 {'user' : account_name},
                 extra )
                 
-        self.user_shelf[account_name] = user
+        # The user and its credentials are written together, so a failure
+        # leaves neither behind
+        self.add_users([(user, credentials)])
         self.logger.info( Logger.SECURITY_SUCCESS,
             _("New user created: %(user)s") %
             {'user' : account_name} )
-        self.user_shelf.sync()  
-        return self.user_shelf[account_name]
+        return self.get_user(account_name)
         
     def generate_strong_password(self):
         """
@@ -362,22 +456,17 @@ class ShelveAuthenticator(Authenticator):
                 Encoder.CHAR_PASSWORD_ALL )
             
         new_password = gen_password()
-        # Verify we meet password complexity requirements
-        success = False
-        while not success:
-            try:
-                self.verify_password_strength(new_password)
-                success = True
-            except AuthenticationCredentialsException:
-                new_password = gen_password()
+        # Verify we meet password complexity requirements. Rejected
+        # candidates are not the user's, so they are not logged.
+        while not self.password_policy.is_valid(new_password):
+            new_password = gen_password()
                 
         return new_password
         
     def change_password(self, user, current_password, new_password1, new_password2):
         try:
             current_hash = self.get_hashed_password(user)
-            verify_hash = self.hash_password(current_password, user.account_name)
-            if current_hash != verify_hash:
+            if not self._check_password(user, current_password, current_hash):
                 raise AuthenticationCredentialsException(
                     _("Password change failed"),
                     _("Authentication failed for password change on user: %(user)s") %
@@ -394,14 +483,23 @@ class ShelveAuthenticator(Authenticator):
             self.verify_password_strength(new_password1, current_password)
             user.last_password_change_time = datetime.now()
             
-            new_hash = self.hash_password(new_password1, user.account_name)
-            if new_hash in self.get_old_password_hashes(user.account_name):
+            credentials = self.get_credentials(user.account_name)
+            pool = get_hashing_pool()
+            if pool.verify_any(new_password1, user.account_name, 
+                credentials.get_old_password_hashes()):
                 raise AuthenticationCredentialsException(
                     _("Password change failed"),
                     _("Password matches a recent password for user: %(user)s") %
                     {'user' : user.account_name} )
                     
-            self.set_hashed_password(user, new_hash)
+            # Keep the current password in the history under the salt of the
+            # older ones, so the next change checks them all with one hash
+            hasher = password_hashing.get_password_hasher()
+            credentials.update_hashed_password(pool.hash(hasher, current_password,
+                user.account_name, credentials.get_history_salt(hasher)))
+            credentials.change_password(self.hash_password(new_password1, user.account_name))
+            self.save_credentials(credentials)
+            self.invalidate_user(user.account_name)
             self.logger.info( Logger.SECURITY_SUCCESS,
                 _("Password changed for user: %(user)s") %
                 {'user' : user.account_name} )
@@ -416,19 +514,46 @@ class ShelveAuthenticator(Authenticator):
     def get_user(self, account_name=None, account_id=None):
         if account_name is not None:
             account_name = account_name.lower()
-            return self.user_shelf.get(account_name, None)
+            self._lock.acquire()
+            try:
+                user = self.user_cache.get(account_name)
+                if user is None:
+                    user = self._pending.get(account_name, None)
+                    if user is None:
+                        user = self.user_shelf.get(account_name, None)
+                        if user is None:
+                            return None
+                    self.user_cache.put(account_name, user)
+                return user
+            finally:
+                self._lock.release()
             
         elif account_id is not None:
-            # This is a bad nieve search and should be changed according to your system.
-            # SQL can do this much better
-            for user in self.user_shelf.values():
-                if user.account_id == account_id:
-                    return user
-            return None
+            key = str(account_id)
+            account_name = self.id_shelf.get(key, None)
+            if account_name is None:
+                return None
+            user = self.get_user(account_name)
+            if user is not None and user.account_id == account_id:
+                return user
+            
+            # A stale index entry. Drop it, and index the user found by
+            # name under its own id. Other stale entries are repaired by the
+            # rebuild at startup.
+            self._lock.acquire()
+            try:
+                if self.id_shelf.get(key, None) == account_name:
+                    del self.id_shelf[key]
+                if user is not None:
+                    self.id_shelf[str(user.account_id)] = user.account_name
+                self.id_shelf.sync()
+            finally:
+                self._lock.release()
+            return None
     
     def hash_password(self, password, account_name):
-        salt = account_name.lower()
-        return ESAPI.encryptor().hash(password, salt)
+        return get_hashing_pool().hash(password_hashing.get_password_hasher(), 
+            password, account_name.lower())
         
     def remove_user(self, account_name):
         account_name = account_name.lower()
@@ -439,11 +564,10 @@ class ShelveAuthenticator(Authenticator):
                 _("Can't remove invalid account_name: %(user)s") %
                 {'user' : account_name} )
         
-        del self.user_shelf[account_name]
+        self.delete_user(user)
         self.logger.info( Logger.SECURITY_SUCCESS,
             _("User successfully removed: %(user)s") %
             {'user' : account_name} )
-        self.user_shelf.sync()
         
     def verify_account_name_strength(self, account_name):
         if account_name is None:
@@ -467,35 +591,7 @@ class ShelveAuthenticator(Authenticator):
             raise AuthenticationCredentialsException(
                 _("Invalid password"),
                 _("New password cannot be None") )
-                
-        # Can't change to a password that contains any 3 character substring 
-        # of old password
-        if old_password is not None:
-            for i in range( 0, len(old_password) - 2 ):
-                sub = old_password[i:i+3]
-                if sub in new_password:
-                    raise AuthenticationCredentialsException(
-                        _("Invalid password"),
-                        _("New password cannot contain pieces of old password.") )
-                        
-        # new password must have enough character sets and length
-        num_charsets = 0
-        charsets = [Encoder.CHAR_PASSWORD_LOWERS, 
-                    Encoder.CHAR_PASSWORD_UPPERS,
-                    Encoder.CHAR_PASSWORD_DIGITS,
-                    Encoder.CHAR_PASSWORD_SPECIALS]
-        for charset in charsets:
-            for c in new_password:
-                if c in charset:
-                    num_charsets += 1
-                    break
-                    
-        # calculate strength = length * charsets
-        strength = len(new_password) * num_charsets
-        if strength < self.MIN_PASSWORD_STRENGTH:
-            raise AuthenticationCredentialsException(
-                _("Invalid password"),
-                _("New password is not long or complex enough") )
+        self.password_policy.check(new_password, old_password)
         
     def exists(self, account_name=None, account_id=None):     
         if account_name is not None:
@@ -503,18 +599,154 @@ class ShelveAuthenticator(Authenticator):
             return self.user_shelf.has_key(account_name)
             
         elif account_id is not None:
-            # This is a bad nieve search and should be changed according to your system.
-            # SQL can do this much better
-            for user_name in self.user_shelf.keys():
-                user = self.user_shelf[user_name]
-                if user.account_id == account_id:
-                    return True
-            return False
+            # The index is only written along with the user, but an entry
+            # may be stale, so it is checked against the user
+            return self.get_user(account_id=account_id) is not None
         
     def get_old_password_hashes(self, account_name):
-        if self.exists(account_name):
-            return self.cred_shelf[account_name].get_old_password_hashes()
+        credentials = self.get_credentials(account_name)
+        if credentials is not None:
+            return credentials.get_old_password_hashes()
         else:
             return []
     
+    # Storage
+    # Subclasses that store users elsewhere override these and get_user,
+    # exists and clear_all_data
+    def add_user(self, user):
+        """
+        Stores a new user.
+        """
+        self._lock.acquire()
+        try:
+            self.user_shelf[user.account_name] = user
+            self.id_shelf[str(user.account_id)] = user.account_name
+            self.user_shelf.sync()  
+            self.id_shelf.sync()
+            user.clear_dirty()
+            self.user_cache.put(user.account_name, user)
+        finally:
+            self._lock.release()
+        
+    def add_users(self, entries):
+        """
+        Stores many new users and their credentials at once, writing the
+        shelves once for the whole batch. The users are not cached.
+        
+        @param entries: a sequence of (user, credentials) pairs
+        """
+        self._lock.acquire()
+        try:
+            for user, credentials in entries:
+                self.user_shelf[user.account_name] = user
+                self.id_shelf[str(user.account_id)] = user.account_name
+                self.cred_shelf[credentials.uid] = credentials
+                user.clear_dirty()
+            self.user_shelf.sync()
+            self.id_shelf.sync()
+            self.cred_shelf.sync()
+        finally:
+            self._lock.release()
+        
+    def get_user_names(self):
+        """
+        Returns the account names of all stored users.
+        """
+        self.flush()
+        return self.user_shelf.keys()
+        
+    def delete_user(self, user):
+        account_name = user.account_name
+        self._lock.acquire()
+        try:
+            self.user_cache.invalidate(account_name)
+            self._pending.pop(account_name, None)
+        finally:
+            self._lock.release()
+        del self.user_shelf[account_name]
+        key = str(user.account_id)
+        if self.id_shelf.get(key, None) == account_name:
+            del self.id_shelf[key]
+        self.user_shelf.sync()
+        self.id_shelf.sync()
+        
+    def save_user(self, user):
+        """
+        Writes the changes made to a stored user. Unless they must be written
+        at once, the changes are written with the next batch.
+        """
+        if not user.is_dirty():
+            return
+        self._lock.acquire()
+        try:
+            self._pending[user.account_name] = user
+            if user.get_dirty_fields() & self.IMMEDIATE_FIELDS:
+                # The user stays cached, so this object remains the one
+                # that get_user() returns
+                self.flush()
+                return
+            interval = ESAPI.security_configuration().get_user_flush_interval()
+            if datetime.now() - self._last_flush >= interval:
+                self.flush()
+        finally:
+            self._lock.release()
+            
+    def invalidate_user(self, account_name):
+        """
+        Writes the changes to a user and drops it from the cache, so that the
+        next get_user() reads it from storage.
+        """
+        self._lock.acquire()
+        try:
+            self.user_cache.invalidate(account_name.lower())
+            self.flush()
+        finally:
+            self._lock.release()
+            
+    def flush(self):
+        """
+        Writes every user that changed since it was last stored. Only the
+        changed fields are written, onto the stored user, so that changes
+        saved through another copy of the user, such as one read after the
+        cached copy expired, are not undone.
+        
+        @return: the number of users written
+        """
+        self._lock.acquire()
+        try:
+            written = 0
+            for users in (self._pending.items(), self.user_cache.users()):
+                for account_name, user in users:
+                    if user.is_dirty():
+                        stored = self.user_shelf.get(account_name, None)
+                        if stored is None or stored.account_id != user.account_id:
+                            stored = user
+                        else:
+                            user.copy_changes_to(stored)
+                        self.user_shelf[account_name] = stored
+                        user.clear_dirty()
+                        written += 1
+            self._pending.clear()
+            if written > 0:
+                self.user_shelf.sync()
+            self._last_flush = datetime.now()
+            return written
+        finally:
+            self._lock.release()
+            
+    def _evicted(self, account_name, user):
+        # Keep users with unsaved changes until the next flush
+        if user.is_dirty():
+            self._pending[account_name] = user
+        
+    def get_credentials(self, account_name):
+        """
+        Returns the UserCredentials of the account, or None.
+        """
+        return self.cred_shelf.get(account_name.lower(), None)
+        
+    def save_credentials(self, credentials):
+        self.cred_shelf[credentials.uid] = credentials
+        self.cred_shelf.sync()
     
+
@@ -0,0 +1,443 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: An Authenticator that stores users and credentials in SQLite.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import pickle
+import shelve
+import sqlite3
+import sys
+import threading
+import weakref
+
+from esapi.core import ESAPI
+from esapi.translation import _
+from esapi.logger import Logger
+from esapi.authenticator import Authenticator
+from esapi.reference.shelve_authenticator import ShelveAuthenticator
+from esapi.reference.user_credentials import UserCredentials, VerificationCache
+from esapi.reference.user_cache import UserCache
+from esapi.reference.password_policy import get_password_policy
+import esapi.user
+from esapi.exceptions import AuthenticationAccountsException
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS users (
+        account_name TEXT PRIMARY KEY,
+        account_id INTEGER NOT NULL UNIQUE,
+        data BLOB NOT NULL )""",
+    """CREATE TABLE IF NOT EXISTS credentials (
+        account_name TEXT PRIMARY KEY,
+        hashed_password TEXT NOT NULL )""",
+    """CREATE TABLE IF NOT EXISTS old_password_hashes (
+        account_name TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        hashed_password TEXT NOT NULL,
+        PRIMARY KEY (account_name, position) )""",
+    )
+
+# The statements are constants, so each connection prepares them once and
+# reuses them from its statement cache
+SELECT_USER = "SELECT data FROM users WHERE account_name = ?"
+SELECT_USER_BY_ID = "SELECT account_name, data FROM users WHERE account_id = ?"
+USER_EXISTS = "SELECT 1 FROM users WHERE account_name = ?"
+USER_ID_EXISTS = "SELECT 1 FROM users WHERE account_id = ?"
+INSERT_USER = "INSERT INTO users (account_name, account_id, data) VALUES (?, ?, ?)"
+REPLACE_USER = "INSERT OR REPLACE INTO users (account_name, account_id, data) VALUES (?, ?, ?)"
+UPDATE_USER = "UPDATE users SET data = ? WHERE account_name = ?"
+DELETE_USER = "DELETE FROM users WHERE account_name = ?"
+SELECT_PASSWORD = "SELECT hashed_password FROM credentials WHERE account_name = ?"
+SELECT_OLD_PASSWORDS = "SELECT hashed_password FROM old_password_hashes WHERE account_name = ? ORDER BY position"
+REPLACE_PASSWORD = "INSERT OR REPLACE INTO credentials (account_name, hashed_password) VALUES (?, ?)"
+DELETE_PASSWORD = "DELETE FROM credentials WHERE account_name = ?"
+INSERT_OLD_PASSWORD = "INSERT INTO old_password_hashes (account_name, position, hashed_password) VALUES (?, ?, ?)"
+DELETE_OLD_PASSWORDS = "DELETE FROM old_password_hashes WHERE account_name = ?"
+SELECT_USER_NAMES = "SELECT account_name FROM users"
+
+class SQLiteAuthenticator(ShelveAuthenticator):
+    """
+    This implementation stores users and credentials in a SQLite database,
+    with the same login, password and account policies as the
+    ShelveAuthenticator.
+
+    Users are pickled into an indexed users table, and the current and old
+    password hashes of each account are kept in their own tables. The
+    database is opened in WAL mode, so that readers in any process do not
+    block the writer, and each thread uses its own connection.
+
+    It shares the policies of the ShelveAuthenticator by inheritance, but
+    none of its storage: every method that uses the shelves is overridden.
+
+    Each row is cheap to write, so save_user() writes a changed user at
+    once instead of batching it. Only the changed fields are written, onto
+    the stored user, so that changes saved by other processes in the
+    meantime are kept. flush() writes the loaded users that changed without
+    being saved. Recently used users are kept in a UserCache, and within one
+    process, get_user() returns the same object for a user for as long as
+    the object is in use. Changed users dropped from the cache are kept
+    until the next flush.
+    """
+    DATABASE_FILENAME = "users.db"
+
+    def __init__(self, filename=None):
+        """
+        @param filename: the database file. Defaults to users.db in the
+            resource directory.
+        """
+        Authenticator.__init__(self)
+        self.logger = ESAPI.logger("Authenticator")
+
+        if filename is None:
+            filename = ESAPI.security_configuration().get_resource_file(self.DATABASE_FILENAME)
+        self.filename = filename
+        self._local = threading.local()
+        self._users = weakref.WeakValueDictionary()
+        self._unsaved = {}
+        self._users_lock = threading.Lock()
+        config = ESAPI.security_configuration()
+        self.user_cache = UserCache(config.get_user_cache_size(),
+            config.get_user_cache_ttl(), self._evicted)
+        self.verification_cache = VerificationCache(
+            config.get_verification_cache_size(),
+            config.get_verification_cache_ttl())
+        self.password_policy = get_password_policy()
+
+        connection = self._connection()
+        # WAL mode is kept in the database file, for every connection
+        connection.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.commit()
+
+        self.current_user = esapi.user.AnonymousUser()
+
+    def _connection(self):
+        """
+        Returns the connection of the calling thread, opening it if needed.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.filename, timeout=30,
+                cached_statements=32)
+            # In WAL mode, this is safe against crashes of the application
+            # and only syncs to disk at checkpoints
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        """
+        Closes the connection of the calling thread.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _remember(self, account_name, data):
+        """
+        Returns the user already loaded under account_name, or unpickles it.
+        """
+        self._users_lock.acquire()
+        try:
+            user = self._users.get(account_name)
+            if user is None:
+                user = pickle.loads(str(data))
+                self._users[account_name] = user
+            return user
+        finally:
+            self._users_lock.release()
+
+    def rebuild_account_id_index(self):
+        """
+        Does nothing. The account id is a column of the users table with
+        its own index, which the database keeps up to date.
+        """
+        pass
+
+    def clear_all_data(self):
+        connection = self._connection()
+        try:
+            connection.execute("DELETE FROM users")
+            connection.execute("DELETE FROM credentials")
+            connection.execute("DELETE FROM old_password_hashes")
+        except:
+            connection.rollback()
+            raise
+        connection.commit()
+        self.user_cache.clear()
+        self._users_lock.acquire()
+        try:
+            self._users.clear()
+            self._unsaved.clear()
+        finally:
+            self._users_lock.release()
+
+    def get_user(self, account_name=None, account_id=None):
+        if account_name is not None:
+            account_name = account_name.lower()
+            user = self.user_cache.get(account_name)
+            if user is not None:
+                return user
+            user = self._users.get(account_name)
+            if user is None:
+                row = self._connection().execute(SELECT_USER, (account_name,)).fetchone()
+                if row is None:
+                    return None
+                user = self._remember(account_name, row[0])
+            self.user_cache.put(account_name, user)
+            return user
+
+        elif account_id is not None:
+            row = self._connection().execute(SELECT_USER_BY_ID, (account_id,)).fetchone()
+            if row is None:
+                return None
+            user = self._remember(row[0], row[1])
+            self.user_cache.put(row[0], user)
+            return user
+
+    def exists(self, account_name=None, account_id=None):
+        connection = self._connection()
+        if account_name is not None:
+            row = connection.execute(USER_EXISTS, (account_name.lower(),)).fetchone()
+        elif account_id is not None:
+            row = connection.execute(USER_ID_EXISTS, (account_id,)).fetchone()
+        else:
+            return False
+        return row is not None
+
+    # Storage
+    def add_user(self, user):
+        connection = self._connection()
+        try:
+            connection.execute(INSERT_USER,
+                (user.account_name, user.account_id, self._dump(user)))
+        except sqlite3.IntegrityError, extra:
+            connection.rollback()
+            raise self._duplicate(user, extra)
+        except:
+            connection.rollback()
+            raise
+        connection.commit()
+        user.clear_dirty()
+
+    def add_users(self, entries):
+        """
+        Stores new users and their credentials in one transaction, so that
+        either all of them are stored or none are.
+        """
+        connection = self._connection()
+        try:
+            for user, credentials in entries:
+                try:
+                    connection.execute(INSERT_USER,
+                        (user.account_name, user.account_id, self._dump(user)))
+                except sqlite3.IntegrityError, extra:
+                    raise self._duplicate(user, extra)
+                hashes = credentials.get_old_password_hashes()
+                connection.execute(DELETE_OLD_PASSWORDS, (credentials.uid,))
+                connection.executemany(INSERT_OLD_PASSWORD,
+                    [(credentials.uid, position, hashed_password)
+                     for position, hashed_password in enumerate(hashes[:-1])])
+                connection.execute(REPLACE_PASSWORD, (credentials.uid, hashes[-1]))
+        except:
+            connection.rollback()
+            raise
+        connection.commit()
+        for user, credentials in entries:
+            user.clear_dirty()
+            
+    def _duplicate(self, user, cause):
+        return AuthenticationAccountsException(
+            _("Account creation failed"),
+            _("Duplicate user creation denied for %(user)s") %
+            {'user' : user.account_name},
+            cause )
+            
+    def get_user_names(self):
+        return [row[0] for row in self._connection().execute(SELECT_USER_NAMES)]
+        
+    def delete_user(self, user):
+        connection = self._connection()
+        try:
+            connection.execute(DELETE_USER, (user.account_name,))
+            connection.execute(DELETE_PASSWORD, (user.account_name,))
+            connection.execute(DELETE_OLD_PASSWORDS, (user.account_name,))
+        except:
+            connection.rollback()
+            raise
+        connection.commit()
+        self._forget(user.account_name)
+
+    def save_user(self, user):
+        """
+        Writes the changed fields of a user onto the stored user, within one
+        write transaction, so that changes saved by another process since
+        this copy was read, such as a lock, are not undone.
+        """
+        if not user.is_dirty():
+            return
+        connection = self._connection()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(SELECT_USER, (user.account_name,)).fetchone()
+            if row is not None:
+                stored = pickle.loads(str(row[0]))
+                # A different user of the same name replaced this one, and
+                # the changes of the old user are dropped
+                if stored.account_id == user.account_id:
+                    user.copy_changes_to(stored)
+                    connection.execute(UPDATE_USER, (self._dump(stored), user.account_name))
+        except:
+            connection.rollback()
+            raise
+        connection.commit()
+        user.clear_dirty()
+        self._users_lock.acquire()
+        try:
+            self._unsaved.pop(user.account_name, None)
+        finally:
+            self._users_lock.release()
+            
+    def invalidate_user(self, account_name):
+        account_name = account_name.lower()
+        user = self._users.get(account_name)
+        if user is not None:
+            self.save_user(user)
+        self._forget(account_name)
+        
+    def _forget(self, account_name):
+        """
+        Drops a user from the cache and the identity map, so that the next
+        get_user() reads it from the database.
+        """
+        self.user_cache.invalidate(account_name)
+        self._users_lock.acquire()
+        try:
+            self._users.pop(account_name, None)
+            self._unsaved.pop(account_name, None)
+        finally:
+            self._users_lock.release()
+        
+    def _evicted(self, account_name, user):
+        # A changed user that was never saved, such as one locked by failed
+        # logins, would otherwise only be held by the identity map and be
+        # lost. Keep it until the next flush.
+        if user.is_dirty():
+            self._users_lock.acquire()
+            try:
+                self._unsaved[account_name] = user
+            finally:
+                self._users_lock.release()
+        
+    def flush(self):
+        written = 0
+        for user in self._users.values():
+            if user.is_dirty():
+                self.save_user(user)
+                written += 1
+        self._users_lock.acquire()
+        try:
+            self._unsaved.clear()
+        finally:
+            self._users_lock.release()
+        return written
+
+    def get_credentials(self, account_name):
+        account_name = account_name.lower()
+        connection = self._connection()
+        row = connection.execute(SELECT_PASSWORD, (account_name,)).fetchone()
+        if row is None:
+            return None
+        credentials = UserCredentials(account_name)
+        for old in connection.execute(SELECT_OLD_PASSWORDS, (account_name,)):
+            credentials.change_password(old[0])
+        credentials.change_password(row[0])
+        return credentials
+
+    def save_credentials(self, credentials):
+        hashes = credentials.get_old_password_hashes()
+        connection = self._connection()
+        try:
+            connection.execute(DELETE_OLD_PASSWORDS, (credentials.uid,))
+            connection.executemany(INSERT_OLD_PASSWORD,
+                [(credentials.uid, position, hashed_password)
+                 for position, hashed_password in enumerate(hashes[:-1])])
+            connection.execute(REPLACE_PASSWORD, (credentials.uid, hashes[-1]))
+        except:
+            connection.rollback()
+            raise
+        connection.commit()
+
+    def _dump(self, user):
+        return buffer(pickle.dumps(user, pickle.HIGHEST_PROTOCOL))
+
+    # Migration
+    def import_shelves(self, users_filename, creds_filename):
+        """
+        Copies the users and credentials of a ShelveAuthenticator into the
+        database. Users that already exist in the database are replaced.
+
+        @param users_filename: the path of users.shelf
+        @param creds_filename: the path of creds.shelf
+        @return: the number of users imported
+        """
+        user_shelf = shelve.open(users_filename, flag='r')
+        cred_shelf = shelve.open(creds_filename, flag='r')
+        count = 0
+        try:
+            connection = self._connection()
+            try:
+                for account_name, user in user_shelf.iteritems():
+                    connection.execute(REPLACE_USER,
+                        (account_name, user.account_id, self._dump(user)))
+                    count += 1
+            except:
+                connection.rollback()
+                raise
+            connection.commit()
+
+            for account_name, credentials in cred_shelf.iteritems():
+                if credentials.get_hashed_password() is not None:
+                    self.save_credentials(credentials)
+        finally:
+            user_shelf.close()
+            cred_shelf.close()
+
+        self.logger.info( Logger.SECURITY_SUCCESS,
+            _("Imported %(count)s users from %(filename)s") %
+            {'count' : count,
+             'filename' : users_filename} )
+        return count
+
+def main(args):
+    """
+    Imports the users of a ShelveAuthenticator:
+        python -m esapi.reference.sqlite_authenticator users.shelf creds.shelf [users.db]
+    """
+    if len(args) not in (2, 3):
+        print main.__doc__
+        return 2
+    filename = None
+    if len(args) == 3:
+        filename = args[2]
+    authenticator = SQLiteAuthenticator(filename)
+    print "Imported %s users into %s" % (
+        authenticator.import_shelves(args[0], args[1]), authenticator.filename)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: A bounded cache of users, used by the Authenticators in front of
+    their storage.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+class UserCache:
+    """
+    Keeps recently used users by account name, so that an Authenticator does
+    not read and unpickle a user from storage on every get_user().
+
+    The cache holds at most max_size users, dropping the least recently used
+    first. A user is dropped once it has been in the cache for longer than
+    ttl, so that changes stored by other processes are seen within that time.
+    The Authenticator drops a user explicitly with invalidate() when the
+    account is removed or its security state changes.
+
+    on_evict(account_name, user), if given, is called for every user the
+    cache drops, with the cache's lock held. The ShelveAuthenticator uses it
+    to keep changed users until they are written.
+    """
+    def __init__(self, max_size, ttl=None, on_evict=None):
+        """
+        @param max_size: the most users to keep
+        @param ttl: a timedelta, or None to keep users until they are evicted
+        @param on_evict: a function called with each user dropped
+        """
+        self.max_size = max_size
+        if ttl is None:
+            self._ttl = None
+        else:
+            self._ttl = ttl.days * 86400 + ttl.seconds + ttl.microseconds / 1000000.0
+        self._on_evict = on_evict
+        # account name -> (user, time loaded), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.reset_statistics()
+
+    def get(self, account_name):
+        """
+        Returns the cached user, or None if it is not cached or has expired.
+        """
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(account_name, None)
+            if entry is None:
+                self._misses += 1
+                return None
+            user, loaded = entry
+            if self._ttl is not None and time.time() - loaded >= self._ttl:
+                self._expirations += 1
+                self._misses += 1
+                self._evicted(account_name, user)
+                return None
+            self._entries[account_name] = entry
+            self._hits += 1
+            return user
+        finally:
+            self._lock.release()
+
+    def put(self, account_name, user):
+        """
+        Caches a user just read from storage, evicting the least recently
+        used users if the cache is full.
+        """
+        self._lock.acquire()
+        try:
+            old = self._entries.pop(account_name, None)
+            if old is not None and old[0] is not user:
+                self._evicted(account_name, old[0])
+            self._entries[account_name] = (user, time.time())
+            while len(self._entries) > self.max_size:
+                name, entry = self._entries.popitem(last=False)
+                self._evictions += 1
+                self._evicted(name, entry[0])
+        finally:
+            self._lock.release()
+
+    def invalidate(self, account_name):
+        """
+        Drops a user, so that the next get_user() reads it from storage.
+
+        @return: true if the user was cached
+        """
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(account_name, None)
+            if entry is None:
+                return False
+            self._invalidations += 1
+            self._evicted(account_name, entry[0])
+            return True
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """
+        Drops every user, without calling on_evict.
+        """
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+    def users(self):
+        """
+        @return: a list of the cached (account_name, user) pairs
+        """
+        self._lock.acquire()
+        try:
+            return [(name, entry[0]) for name, entry in self._entries.items()]
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evicted(self, account_name, user):
+        if self._on_evict is not None:
+            self._on_evict(account_name, user)
+
+    # Statistics
+    def get_statistics(self):
+        """
+        Returns the counts kept since the cache was created or the statistics
+        were reset, as a dictionary with the keys size, hits, misses,
+        hit_rate, evictions, expirations and invalidations. hit_rate is
+        between 0.0 and 1.0.
+        """
+        self._lock.acquire()
+        try:
+            lookups = self._hits + self._misses
+            if lookups > 0:
+                hit_rate = float(self._hits) / lookups
+            else:
+                hit_rate = 0.0
+            return {'size' : len(self._entries),
+                    'hits' : self._hits,
+                    'misses' : self._misses,
+                    'hit_rate' : hit_rate,
+                    'evictions' : self._evictions,
+                    'expirations' : self._expirations,
+                    'invalidations' : self._invalidations}
+        finally:
+            self._lock.release()
+
+    def reset_statistics(self):
+        self._lock.acquire()
+        try:
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+            self._expirations = 0
+            self._invalidations = 0
+        finally:
+            self._lock.release()
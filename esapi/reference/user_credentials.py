@@ -19,6 +19,15 @@
 
 # Todo
 
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from esapi.reference import password_hashing
+
 class UserCredentials():
     """
     The UserCredentials class holds the credentials used to authenticate
@@ -60,9 +69,98 @@ class UserCredentials():
         """
         self._password_hashes.append(new_hash)
     
+    def update_hashed_password(self, new_hash):
+        """
+        Replaces the hash of the current password with new_hash, a hash of
+        the same password in another format, without adding to the history.
+        """
+        self._password_hashes[-1] = new_hash
+    
     def get_old_password_hashes(self):
         """
         Returns a tuple of old password hashes.
         """
         return tuple(self._password_hashes)
         
+    def get_history_salt(self, hasher):
+        """
+        Returns the salt of the newest old password hash that hasher made, or
+        a new random salt. The Authenticator rehashes a password with this
+        salt when it is replaced, so that the whole history shares one salt
+        and a new password is checked against it with a single hash.
+        """
+        for stored_hash in reversed(self._password_hashes[:-1]):
+            if not hasher.needs_update(stored_hash):
+                return password_hashing.get_salt(stored_hash)
+        return os.urandom(password_hashing.SALT_LENGTH)
+
+class VerificationCache:
+    """
+    Remembers successful password verifications for a short time, so that
+    logins that present the same password again, such as logins with a
+    remember token on every request, skip the slow password hash.
+    
+    Entries are keyed by an HMAC of the account name, password and stored
+    hash under a random key made for this process. The cache therefore holds
+    nothing that could be checked against a password outside the process,
+    and a password change makes the old entries unreachable.
+    """
+    def __init__(self, max_size, ttl):
+        """
+        @param max_size: the most verifications to remember
+        @param ttl: how long to remember a verification, as a timedelta
+        """
+        self.max_size = max_size
+        self.ttl = ttl.days * 86400 + ttl.seconds + ttl.microseconds / 1000000.0
+        self._key = os.urandom(32)
+        # HMAC -> expiry time, oldest first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def _entry_key(self, account_name, password, stored_hash):
+        if isinstance(password, unicode):
+            password = password.encode('utf-8')
+        message = '\0'.join((account_name.lower().encode('utf-8'), password,
+            str(stored_hash)))
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+        
+    def check(self, account_name, password, stored_hash):
+        """
+        @return: true if password was verified against stored_hash recently
+        """
+        key = self._entry_key(account_name, password, stored_hash)
+        self._lock.acquire()
+        try:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires <= time.time():
+                del self._entries[key]
+                return False
+            return True
+        finally:
+            self._lock.release()
+            
+    def add(self, account_name, password, stored_hash):
+        """
+        Remembers that password matched stored_hash.
+        """
+        if self.max_size <= 0:
+            return
+        key = self._entry_key(account_name, password, stored_hash)
+        self._lock.acquire()
+        try:
+            self._entries.pop(key, None)
+            self._entries[key] = time.time() + self.ttl
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        finally:
+            self._lock.release()
+            
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+        
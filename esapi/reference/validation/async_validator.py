@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: A Validator facade for event-driven servers, which returns futures
+    and keeps blocking checks off the calling thread.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import threading
+from multiprocessing import TimeoutError
+
+from esapi.core import ESAPI
+from esapi.translation import _
+from esapi.reference.validation.validation_batch import get_validation_pool
+
+from esapi.exceptions import ValidationAvailabilityException
+
+class ValidationFuture:
+    """
+    The pending result of an AsyncValidator call.
+
+    An event loop should not wait with get(). Instead, add a callback with
+    add_done_callback() that hands the future back to the loop through its
+    thread-safe entry point, such as reactor.callFromThread in Twisted or
+    IOLoop.add_callback in Tornado. The callback runs in the thread that
+    finished the validation.
+    """
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._error = None
+
+    def set_result(self, result, error=None):
+        self._lock.acquire()
+        try:
+            self._result = result
+            self._error = error
+            self._done.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        finally:
+            self._lock.release()
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """
+        Calls callback(future) when the validation finishes, or at once if
+        it already has.
+        """
+        self._lock.acquire()
+        try:
+            if not self._done.isSet():
+                self._callbacks.append(callback)
+                return
+        finally:
+            self._lock.release()
+        callback(self)
+
+    def ready(self):
+        return self._done.isSet()
+
+    def successful(self):
+        """
+        Returns True if the validation finished without raising.
+        """
+        return self._done.isSet() and self._error is None
+
+    def get(self, timeout=None):
+        """
+        Waits for the validation and returns its result.
+
+        @param timeout: the longest time to wait, in seconds
+        @raises TimeoutError: if the validation did not finish in time
+        @raises ValidationException: if the validation failed
+        """
+        self._done.wait(timeout)
+        if not self._done.isSet():
+            raise TimeoutError()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+def _run(future, function, args, kwargs, release):
+    result = error = None
+    try:
+        try:
+            result = function(*args, **kwargs)
+        except Exception, extra:
+            error = extra
+    finally:
+        # Free the slot first, so that whoever sees the result can submit
+        # another check
+        if release is not None:
+            release()
+    future.set_result(result, error)
+
+def _inline(name):
+    def method(self, *args, **kwargs):
+        return self._call(False, name, getattr(self.validator, name), args, kwargs)
+    method.__name__ = name
+    return method
+
+def _offloaded(name):
+    def method(self, *args, **kwargs):
+        return self._call(True, name, getattr(self.validator, name), args, kwargs)
+    method.__name__ = name
+    return method
+
+def _pattern(name):
+    def method(self, *args, **kwargs):
+        return self._call(self.offload_patterns, name, getattr(self.validator, name), args, kwargs)
+    method.__name__ = name
+    return method
+
+class AsyncValidator:
+    """
+    Wraps a Validator for servers built around an event loop. Every
+    get_valid method takes the same arguments as the Validator method and
+    returns a L{ValidationFuture}.
+
+    Checks that are cheap run in the calling thread and return a future
+    that is already done. Checks that touch the filesystem, read streams
+    or can take long on large input run on an executor:
+        - get_valid_directory_path
+        - get_valid_file_content and get_valid_file_content_stream
+        - get_valid_safe_html
+        - safe_read_line and safe_read_lines, which reads every line and
+          returns a list
+    Pattern checks also run on the executor when Validation_PatternEngine
+    is 'process', because the calling thread then waits for a worker
+    process.
+
+    Backpressure: at most max_pending checks wait for or run on the
+    executor. Past that, a check fails at once with a
+    ValidationAvailabilityException, instead of queuing without bound.
+    """
+    def __init__(self, validator=None, pool=None, max_pending=None):
+        """
+        @param validator: the Validator to wrap. Defaults to ESAPI.validator().
+        @param pool: the executor, any object with the apply_async method
+            of multiprocessing.pool.ThreadPool. Defaults to the pool shared
+            by ValidationBatches.
+        @param max_pending: the most checks waiting for or running on the
+            executor. Defaults to Validation_AsyncMaxPending in
+            ESAPI.conf.settings.
+        """
+        config = ESAPI.security_configuration()
+        if validator is None:
+            validator = ESAPI.validator()
+        if pool is None:
+            pool = get_validation_pool()
+        if max_pending is None:
+            max_pending = config.get_validation_async_max_pending()
+
+        self.validator = validator
+        self.pool = pool
+        self.max_pending = max_pending
+        self.offload_patterns = config.get_validation_pattern_engine() == 'process'
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    def _call(self, offload, name, function, args, kwargs):
+        future = ValidationFuture()
+        if not offload or self.pool is None:
+            _run(future, function, args, kwargs, None)
+            return future
+
+        if not self._pending.acquire(False):
+            context = None
+            if args and isinstance(args[0], basestring):
+                context = args[0]
+            future.set_result(None, ValidationAvailabilityException(
+                _("%(context)s: Validation is unavailable. Try again later.") %
+                {'context' : context},
+                _("Too many pending asynchronous validations: context=%(context)s, check=%(check)s, limit=%(limit)s") %
+                {'context' : context,
+                 'check' : name,
+                 'limit' : self.max_pending},
+                None,
+                context ))
+            return future
+
+        try:
+            self.pool.apply_async(_run, (future, function, args, kwargs, self._pending.release))
+        except:
+            self._pending.release()
+            raise
+        return future
+
+    def safe_read_lines(self, *args, **kwargs):
+        """
+        Reads and validates every line of the stream on the executor.
+
+        @return: a ValidationFuture of the list of validated lines
+        """
+        def read_lines(*args, **kwargs):
+            return list(self.validator.safe_read_lines(*args, **kwargs))
+        return self._call(True, 'safe_read_lines', read_lines, args, kwargs)
+
+    get_valid_input = _pattern('get_valid_input')
+    get_valid_credit_card = _pattern('get_valid_credit_card')
+    get_valid_redirect_location = _pattern('get_valid_redirect_location')
+    get_valid_filename = _pattern('get_valid_filename')
+    get_valid_date = _inline('get_valid_date')
+    get_valid_number = _inline('get_valid_number')
+    get_valid_directory_path = _offloaded('get_valid_directory_path')
+    get_valid_file_content = _offloaded('get_valid_file_content')
+    get_valid_file_content_stream = _offloaded('get_valid_file_content_stream')
+    get_valid_safe_html = _offloaded('get_valid_safe_html')
+    safe_read_line = _offloaded('safe_read_line')
@@ -16,16 +16,74 @@
 @author: Craig Younkins (craig.younkins@owasp.org)
 """
 
+from itertools import islice
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from esapi.core import ESAPI
 from esapi.translation import _
 
 from esapi.reference.validation.base_validation_rule import BaseValidationRule
+from esapi.reference.validation.validation_metrics import instrumented
 from esapi.reference.validation.string_validation_rule import StringValidationRule
 
 from esapi.exceptions import ValidationException
 
 CC_MAX_LENGTH = 19
 
+# Value of each digit, and of each digit after the Luhn doubling step
+LUHN_DIGITS = dict([(str(d), d) for d in range(10)])
+LUHN_DOUBLED = dict([(str(d), d * 2 - 9 if d > 4 else d * 2) for d in range(10)])
+
+# None of the codecs decode these characters, so input made only of them is
+# already canonical.
+PLAIN_CHARS = frozenset('0123456789 -')
+
+# Number of inputs validated together by validate_many
+BATCH_SIZE = 4096
+
+def luhn_valid(digits):
+    """
+    Returns True if the string of digits passes the Luhn test.
+    """
+    reverse = digits[::-1]
+    total = 0
+    for digit in reverse[0::2]:
+        total += LUHN_DIGITS[digit]
+    for digit in reverse[1::2]:
+        total += LUHN_DOUBLED[digit]
+    return total % 10 == 0
+
+def luhn_valid_many(digit_strings):
+    """
+    Returns a list of booleans, one for each string of digits, that are True
+    where the string passes the Luhn test. Uses NumPy when it is installed.
+    """
+    if numpy is None:
+        return [luhn_valid(digits) for digits in digit_strings]
+
+    # Group by length so each group is a rectangular array of digits
+    by_length = {}
+    for index, digits in enumerate(digit_strings):
+        by_length.setdefault(len(digits), []).append(index)
+
+    doubled = numpy.array([LUHN_DOUBLED[str(d)] for d in range(10)], dtype=numpy.uint8)
+    results = [False] * len(digit_strings)
+    for length, indexes in by_length.items():
+        if length == 0:
+            continue
+        joined = ''.join([digit_strings[i] for i in indexes]).encode('ascii')
+        table = numpy.frombuffer(joined, dtype=numpy.uint8).reshape(len(indexes), length) - 48
+        totals = table[:, length - 1::-2].sum(axis=1, dtype=numpy.int64)
+        if length > 1:
+            totals += doubled[table[:, length - 2::-2]].sum(axis=1, dtype=numpy.int64)
+        for index, valid in zip(indexes, (totals % 10) == 0):
+            results[index] = bool(valid)
+    return results
+
 class CreditCardValidationRule(BaseValidationRule):
     """
     This validator is used to perform syntax and semantic validation of a credit
@@ -42,44 +100,16 @@ class CreditCardValidationRule(BaseValidationRule):
         ccr.set_allow_none(False)
         return ccr
         
+    @instrumented
     def get_valid(self, context, input_, error_list=None):
         try:
-            # check null
-            if input_ is None or len(input_) == 0:
-                if self.allow_none:
-                    return None
-                raise ValidationException( 
-                   _("%(context)s: Input credit card required") % 
-                   {'context' : context}, 
-                   _("Input credit card required: context=%(context)s, input=%(input)s") % 
-                   {'context' : context,
-                    'input' : input_}, 
-                   context )
-                        
-            # canonicalize
-            canonical = self.ccrule.get_valid(context, input_)
-            
-            digits_only = ''.join([char for char in canonical if char.isdigit()])
+            digits_only = self._get_digits(context, input_)
+            if digits_only is None:
+                return None
             
             # Luhn alogrithm checking
-            sum_ = 0
-            times_two = False
-            for digit in reversed(digits_only):
-                digit = int(digit)
-                assert 0 <= digit <= 9
-                if times_two:
-                    digit *= 2
-                    if digit > 9:
-                        digit -= 9
-                sum_ += digit
-                times_two = not times_two
-            if (sum_ % 10) != 0:
-                raise ValidationException( 
-                   _("%(context)s: Invalid credit card input") % 
-                   {'context' : context}, 
-                   _("Invalid credit card input. Credit card number did not pass Luhn test: context=%(context)s") % 
-                   {'context' : context}, 
-                  context )
+            if not luhn_valid(digits_only):
+                raise self._luhn_exception(context)
                 
             return digits_only
         except ValidationException, extra:
@@ -90,3 +120,105 @@ class CreditCardValidationRule(BaseValidationRule):
             
         return None
         
+    def validate_many(self, context, inputs, error_list=None):
+        """
+        Validates an iterable of credit card numbers, with the same rules as
+        get_valid(). Inputs are consumed lazily in batches, so any number of
+        them can be streamed through with constant memory.
+
+        @param context: A descriptive name of the inputs. The error for the
+            input at position i is stored in error_list under the key
+            "context[i]".
+        @param inputs: An iterable of credit card numbers.
+        @param error_list: If error_list exists, any errors will be captured
+            in the list and None will be yielded for the invalid input.
+            Otherwise, the first error is raised, and no inputs after it are
+            checked, so each call raises at most one exception.
+
+        @return: A generator yielding, in order, the digits of each valid
+            credit card number.
+        """
+        iterator = iter(inputs)
+        offset = 0
+        while True:
+            batch = list(islice(iterator, BATCH_SIZE))
+            if not batch:
+                break
+
+            # Syntax checks first, then the Luhn test on the whole batch.
+            # Without an error list the batch is cut at the first failure, so
+            # no exceptions are built for the inputs that follow it.
+            results = []
+            digit_strings = []
+            for index, input_ in enumerate(batch):
+                item_context = "%s[%s]" % (context, offset + index)
+                try:
+                    digits_only = self._get_digits(item_context, input_)
+                    results.append(digits_only)
+                    if digits_only is not None:
+                        digit_strings.append((index, digits_only))
+                except ValidationException, extra:
+                    results.append(extra)
+                    if error_list is None:
+                        break
+
+            checks = luhn_valid_many([digits for index, digits in digit_strings])
+            for (index, digits), valid in zip(digit_strings, checks):
+                if not valid:
+                    results[index] = self._luhn_exception("%s[%s]" % (context, offset + index))
+                    if error_list is None:
+                        del results[index + 1:]
+                        break
+
+            for index, result in enumerate(results):
+                if isinstance(result, ValidationException):
+                    if error_list is None:
+                        raise result
+                    error_list["%s[%s]" % (context, offset + index)] = result
+                    yield None
+                else:
+                    yield result
+            offset += len(batch)
+
+    def _get_digits(self, context, input_):
+        """
+        Returns the digits of the canonicalized input, or None if the input
+        is empty and that is allowed.
+        """
+        # check null
+        if input_ is None or len(input_) == 0:
+            if self.allow_none:
+                return None
+            raise ValidationException(
+               _("%(context)s: Input credit card required") %
+               {'context' : context},
+               _("Input credit card required: context=%(context)s, input=%(input)s") %
+               {'context' : context,
+                'input' : input_},
+               context )
+
+        # Plain input skips canonicalization but not the length and pattern
+        # checks of the ccrule
+        if (len(input_) <= CC_MAX_LENGTH and
+            PLAIN_CHARS.issuperset(input_) and
+            self._matches_cc_patterns(context, input_)):
+            canonical = input_
+        else:
+            # canonicalize
+            canonical = self.ccrule.get_valid(context, input_)
+
+        return ''.join([char for char in canonical if char.isdigit()])
+
+    def _matches_cc_patterns(self, context, input_):
+        for pattern in self.ccrule.whitelist_patterns:
+            if not self.ccrule.match(context, pattern, input_):
+                return False
+        return True
+
+    def _luhn_exception(self, context):
+        return ValidationException(
+           _("%(context)s: Invalid credit card input") %
+           {'context' : context},
+           _("Invalid credit card input. Credit card number did not pass Luhn test: context=%(context)s") %
+           {'context' : context},
+          context )
@@ -16,19 +16,202 @@
 @author: Craig Younkins (craig.younkins@owasp.org)
 """
 
+import calendar
+import locale
+import re
+import threading
 from datetime import datetime
 
 from esapi.reference.validation.base_validation_rule import BaseValidationRule
+from esapi.reference.validation.validation_metrics import instrumented
 from esapi.translation import _
 
 from esapi.exceptions import ValidationException
 from esapi.exceptions import EncodingException
 
+# Regular expressions for the supported directives. These are the same ones
+# used by Python's strptime, so both accept exactly the same input.
+_DIRECTIVES = {
+    'Y' : r"(?P<Y>\d\d\d\d)",
+    'y' : r"(?P<y>\d\d)",
+    'm' : r"(?P<m>1[0-2]|0[1-9]|[1-9])",
+    'd' : r"(?P<d>3[01]|[12]\d|0[1-9]|[1-9]| [1-9])",
+    'H' : r"(?P<H>2[0-3]|[0-1]\d|\d)",
+    'M' : r"(?P<M>[0-5]\d|\d)",
+    'S' : r"(?P<S>6[0-1]|[0-5]\d|\d)",
+    'f' : r"(?P<f>[0-9]{1,6})",
+    }
+
+# Directives that match month names, which depend on the locale
+_NAME_DIRECTIVES = ('B', 'b')
+
+# The datetime field set by each directive
+_FIELDS = {
+    'Y' : 'year', 'y' : 'year',
+    'm' : 'month', 'B' : 'month', 'b' : 'month',
+    'd' : 'day', 'H' : 'hour', 'M' : 'minute', 'S' : 'second',
+    'f' : 'microsecond',
+    }
+
+_WHITESPACE = re.compile(r"\s+")
+
+_parsers = {}
+_parsers_lock = threading.Lock()
+
+def get_date_parser(format_):
+    """
+    Returns the DateParser for a strptime format string, or None if the
+    format uses directives that DateParser does not support. Parsers are
+    compiled once and shared.
+    """
+    try:
+        return _parsers[format_]
+    except KeyError:
+        pass
+    parser = DateParser.compile(format_)
+    _parsers_lock.acquire()
+    try:
+        _parsers[format_] = parser
+    finally:
+        _parsers_lock.release()
+    return parser
+
+class DateParser:
+    """
+    A compiled strptime format string. Parsing with a DateParser gives the
+    same results as datetime.strptime, without parsing the format again or
+    taking the lock that strptime takes on every call.
+
+    The supported directives are %Y, %y, %m, %B, %b, %d, %H, %M, %S, %f
+    and %%.
+    """
+    def __init__(self, format_, tokens):
+        self.format = format_
+        self.tokens = tokens
+        self.uses_names = False
+        for kind, value in tokens:
+            if kind == 'directive' and value in _NAME_DIRECTIVES:
+                self.uses_names = True
+        self.compiled = None
+        self._build()
+
+    def compile(cls, format_):
+        """
+        Returns a DateParser for format_, or None if format_ has a directive
+        that is not supported or sets the same field twice.
+        """
+        tokens = []
+        fields = set()
+        index = 0
+        while index < len(format_):
+            char = format_[index]
+            if char == '%':
+                if index + 1 >= len(format_):
+                    return None
+                directive = format_[index + 1]
+                index += 2
+                if directive == '%':
+                    tokens.append(('literal', '%'))
+                    continue
+                if directive not in _FIELDS:
+                    return None
+                field = _FIELDS[directive]
+                if field in fields:
+                    return None
+                fields.add(field)
+                tokens.append(('directive', directive))
+            else:
+                match = _WHITESPACE.match(format_, index)
+                if match:
+                    tokens.append(('whitespace', None))
+                    index = match.end()
+                else:
+                    tokens.append(('literal', char))
+                    index += 1
+        return cls(format_, tokens)
+    compile = classmethod(compile)
+
+    def _build(self):
+        lang = None
+        month_names = None
+        if self.uses_names:
+            lang = locale.getlocale(locale.LC_TIME)
+            full = [name.lower() for name in calendar.month_name]
+            abbr = [name.lower() for name in calendar.month_abbr]
+            month_names = {'B' : full, 'b' : abbr}
+
+        parts = []
+        for kind, value in self.tokens:
+            if kind == 'whitespace':
+                parts.append(r"\s+")
+            elif kind == 'literal':
+                parts.append(re.escape(value))
+            elif value in _NAME_DIRECTIVES:
+                names = [name for name in month_names[value] if name]
+                names.sort(key=len, reverse=True)
+                parts.append("(?P<%s>%s)" % (value, '|'.join([re.escape(name) for name in names])))
+            else:
+                parts.append(_DIRECTIVES[value])
+
+        # Replaced in one assignment, so other threads never see a regex
+        # with the month names of another locale
+        self.compiled = (lang, re.compile(''.join(parts), re.IGNORECASE), month_names)
+
+    def parse(self, string):
+        """
+        Returns the datetime represented by string.
+
+        @raises ValueError: if string does not match the format or is not a
+            valid date
+        """
+        if self.uses_names and locale.getlocale(locale.LC_TIME) != self.compiled[0]:
+            self._build()
+        lang, regex, month_names = self.compiled
+
+        found = regex.match(string)
+        if found is None:
+            raise ValueError("time data %r does not match format %r" %
+                (string, self.format))
+        if found.end() != len(string):
+            raise ValueError("unconverted data remains: %s" %
+                string[found.end():])
+
+        year = 1900
+        month = day = 1
+        hour = minute = second = microsecond = 0
+        for key, value in found.groupdict().iteritems():
+            if key == 'Y':
+                year = int(value)
+            elif key == 'y':
+                year = int(value)
+                if year <= 68:
+                    year += 2000
+                else:
+                    year += 1900
+            elif key == 'm':
+                month = int(value)
+            elif key in _NAME_DIRECTIVES:
+                month = month_names[key].index(value.lower())
+            elif key == 'd':
+                day = int(value)
+            elif key == 'H':
+                hour = int(value)
+            elif key == 'M':
+                minute = int(value)
+            elif key == 'S':
+                second = int(value)
+            elif key == 'f':
+                microsecond = int(value + '0' * (6 - len(value)))
+        return datetime(year, month, day, hour, minute, second, microsecond)
+
 class DateValidationRule(BaseValidationRule):
     """
     This date validator makes use of Python's 
     U{datetime.strptime<http://docs.python.org/library/datetime.html>}
     to validate that given dates conform to a format string.
+
+    Common formats are compiled once into a L{DateParser}, and the rest are
+    passed to datetime.strptime.
     """
     def __init__(self, type_name, encoder, new_format):
         """
@@ -36,6 +219,7 @@ class DateValidationRule(BaseValidationRule):
                to Python's U{datetime.strptime<http://docs.python.org/library/datetime.html>}.
         """
         self.format = None
+        self.parser = None
         
         BaseValidationRule.__init__(self, type_name, encoder)
         self.set_date_format(new_format)
@@ -49,7 +233,9 @@ class DateValidationRule(BaseValidationRule):
         if new_format is None:
             raise RuntimeError("DateValidationRule.set_date_format requires a non-null DateFormat")
         self.format = new_format
+        self.parser = get_date_parser(new_format)
         
+    @instrumented
     def get_valid(self, context, input_, error_list=None):
         try:
             # check null
@@ -76,7 +262,10 @@ class DateValidationRule(BaseValidationRule):
                    context )
                 
             try:
-                date = datetime.strptime(canonical, self.format)
+                if self.parser is not None:
+                    date = self.parser.parse(canonical)
+                else:
+                    date = datetime.strptime(canonical, self.format)
                 return date
             except Exception, extra:
                 raise ValidationException( 
@@ -96,4 +285,23 @@ class DateValidationRule(BaseValidationRule):
             else:
                 raise
             
-        return None
\ No newline at end of file
+        return None
+
+    def validate_many(self, context, inputs, error_list=None):
+        """
+        Validates an iterable of dates, such as a column of a log file or an
+        import, with the same rules as get_valid(). Inputs are consumed
+        lazily.
+
+        @param context: A descriptive name of the inputs. The error for the
+            input at position i is stored in error_list under the key
+            "context[i]".
+        @param inputs: An iterable of date strings.
+        @param error_list: If error_list exists, any errors will be captured
+            in the list and None will be yielded for the invalid input.
+            Otherwise, the first error is raised.
+
+        @return: A generator yielding, in order, a datetime for each input.
+        """
+        for index, input_ in enumerate(inputs):
+            yield self.get_valid("%s[%s]" % (context, index), input_, error_list)
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: A time-bounded cache of validated directory paths.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import os
+import stat
+import threading
+import time
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = None
+
+def _timedelta_to_seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
+
+def _stamp(path):
+    """
+    Returns what identifies the directory at path and its last change, or
+    None if it is gone or no longer a directory.
+    """
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode):
+        return None
+    return (info.st_dev, info.st_ino, info.st_mtime)
+
+class DirectoryCache:
+    """
+    Remembers directory paths that passed validation, so that validating
+    the same directory again does not canonicalize it again. Each entry
+    lives for at most ttl. It is forgotten early if a stat of the directory
+    or of its parent shows a different device, inode or modification time,
+    which happens when either is deleted, replaced or has entries added or
+    removed.
+
+    The stamps do not cover the components between the parent and the
+    directory, so a hit still resolves both paths again and is forgotten
+    if either no longer resolves to itself, for example when a component
+    was replaced by a symlink. A hit costs the realpath walks and two stat
+    calls instead of the pattern checks and the isdir calls of a full
+    validation.
+    """
+
+    def __init__(self, ttl, max_entries=1024):
+        """
+        @param ttl: how long an entry lives, as a timedelta. A ttl of zero
+            turns the cache off.
+        @param max_entries: the number of entries kept. The oldest entry is
+            dropped to make room for a new one.
+        """
+        self.ttl = _timedelta_to_seconds(ttl)
+        self.max_entries = max_entries
+        if OrderedDict is not None:
+            self._entries = OrderedDict()
+        else:
+            self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, input_, parent_dir):
+        """
+        Returns the canonical path cached for input_ inside parent_dir, or
+        None if there is no valid entry.
+        """
+        if self.ttl <= 0:
+            return None
+        key = (input_, parent_dir)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        canonical_input, input_stamp, parent_stamp, expires = entry
+        if (time.time() >= expires or
+            _stamp(canonical_input) != input_stamp or
+            _stamp(parent_dir) != parent_stamp or
+            os.path.normcase(os.path.realpath(input_)) != canonical_input or
+            os.path.normcase(os.path.realpath(parent_dir)) != os.path.normcase(parent_dir)):
+            self._remove(key, entry)
+            return None
+        return canonical_input
+
+    def put(self, input_, parent_dir, canonical_input):
+        """
+        Caches canonical_input as the validated path of input_ inside
+        parent_dir.
+        """
+        if self.ttl <= 0:
+            return
+        input_stamp = _stamp(canonical_input)
+        parent_stamp = _stamp(parent_dir)
+        if input_stamp is None or parent_stamp is None:
+            return
+
+        entry = (canonical_input, input_stamp, parent_stamp, time.time() + self.ttl)
+        self._lock.acquire()
+        try:
+            self._entries.pop((input_, parent_dir), None)
+            while len(self._entries) >= self.max_entries:
+                if OrderedDict is not None:
+                    self._entries.popitem(last=False)
+                else:
+                    self._entries.popitem()
+            self._entries[(input_, parent_dir)] = entry
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key, entry):
+        self._lock.acquire()
+        try:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        finally:
+            self._lock.release()
@@ -0,0 +1,298 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: A ValidationRule for the content of files too large to hold in
+    memory.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import codecs
+import mmap
+import os
+import stat
+
+from esapi.core import ESAPI
+from esapi.translation import _
+
+from esapi.reference.validation.base_validation_rule import BaseValidationRule
+from esapi.reference.validation.validation_metrics import instrumented
+
+from esapi.exceptions import ValidationException
+
+# Number of bytes checked at a time
+CHUNK_SIZE = 64 * 1024
+
+class FileContentValidationRule(BaseValidationRule):
+    """
+    This validator checks the content of a file, given as a path or a file
+    object, without reading the whole file into memory. Regular files are
+    memory mapped, and anything else, such as wsgi.input, is read in chunks
+    of CHUNK_SIZE bytes. Checking stops at the first violation.
+
+    The content is checked against:
+        - the size limit, which is the smaller of the maximum bytes of the
+          rule and HttpUtilities_MaxUploadFileBytes in ESAPI.conf.settings
+        - the allowed magic numbers, one of which the content must start with
+        - the forbidden byte patterns, none of which may appear anywhere
+        - the encoding, which the whole content must be valid in
+    """
+    def __init__(self, type_name, encoder=None, max_bytes=None):
+        self.max_bytes = None
+        self.magic_numbers = []
+        self.forbidden_patterns = []
+        self.encoding = None
+
+        BaseValidationRule.__init__(self, type_name, encoder)
+        self.set_maximum_bytes(max_bytes)
+
+    def set_maximum_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+
+    def add_magic_number(self, magic_number):
+        """
+        Adds a byte string that the content may start with. If any magic
+        numbers are added, the content must start with one of them.
+        """
+        if not magic_number:
+            raise RuntimeError("Magic number cannot be empty")
+        self.magic_numbers.append(magic_number)
+
+    def add_forbidden_pattern(self, pattern):
+        """
+        Adds a byte string that must not appear in the content.
+        """
+        if not pattern:
+            raise RuntimeError("Forbidden pattern cannot be empty")
+        self.forbidden_patterns.append(pattern)
+
+    def set_encoding(self, encoding):
+        """
+        Sets the encoding that the content must be valid in, such as
+        'utf-8'. None, the default, allows any bytes.
+        """
+        if encoding is not None:
+            # Raises LookupError for an unknown encoding
+            codecs.getincrementaldecoder(encoding)
+        self.encoding = encoding
+
+    @instrumented
+    def get_valid(self, context, input_, error_list=None):
+        """
+        @param input_: the path of the file, or a file object positioned at
+            the start of the content
+        @return: the number of bytes of valid content, or None if the content
+            is empty and that is allowed
+        """
+        try:
+            if input_ is None:
+                return self._empty(context, input_)
+
+            if isinstance(input_, basestring):
+                try:
+                    file_ = open(input_, 'rb')
+                except IOError, extra:
+                    raise ValidationException(
+                        _("%(context)s: Invalid file content") %
+                        {'context' : context},
+                        _("Unable to open file: context=%(context)s, input=%(input)s") %
+                        {'context' : context,
+                         'input' : input_},
+                        extra,
+                        context )
+                try:
+                    return self._check(context, file_)
+                finally:
+                    file_.close()
+            return self._check(context, input_)
+
+        except ValidationException, extra:
+            if error_list is not None:
+                error_list[context] = extra
+            else:
+                raise
+
+        return None
+
+    def _check(self, context, file_):
+        limit = ESAPI.security_configuration().get_allowed_file_upload_size()
+        if self.max_bytes is not None:
+            limit = min(limit, self.max_bytes)
+
+        # The size of a regular file is known before reading any of it
+        size = self._get_size(file_)
+        if size is not None:
+            if size == 0:
+                return self._empty(context, file_)
+            if size > limit:
+                raise self._too_large(context, limit, size)
+
+        scanner = _ContentScanner(self, context, limit)
+        mapped = self._map(file_, size)
+        if mapped is not None:
+            try:
+                for start in xrange(0, size, CHUNK_SIZE):
+                    scanner.feed(mapped[start:start + CHUNK_SIZE])
+            finally:
+                mapped.close()
+        else:
+            while True:
+                chunk = file_.read(min(CHUNK_SIZE, limit - scanner.total + 1))
+                if not chunk:
+                    break
+                scanner.feed(chunk)
+
+        if scanner.total == 0:
+            return self._empty(context, file_)
+        scanner.close()
+        return scanner.total
+
+    def _get_size(self, file_):
+        """
+        Returns the number of bytes left in a regular file, or None if it
+        cannot be known without reading.
+        """
+        try:
+            info = os.fstat(file_.fileno())
+            if not stat.S_ISREG(info.st_mode):
+                return None
+            return info.st_size - file_.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            return None
+
+    def _map(self, file_, size):
+        """
+        Returns a read-only memory map of the file, or None if the file
+        cannot be mapped from its current position.
+        """
+        if not size:
+            return None
+        try:
+            if file_.tell() != 0:
+                return None
+            return mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, EnvironmentError, ValueError):
+            return None
+
+    def _empty(self, context, input_):
+        if self.allow_none:
+            return None
+        raise ValidationException( _("%(context)s: Input required") %
+           {'context' : context},
+           _("Input required: context=%(context)s, input=%(input)s") %
+           {'context' : context,
+            'input' : input_},
+           context )
+
+    def _too_large(self, context, limit, size):
+        return ValidationException(
+            _("%(context)s: Invalid file content can not exceed %(max_bytes)s bytes") %
+           {'context' : context,
+            'max_bytes' : limit},
+           _("Exceeded max_bytes of %(max_bytes)s bytes: context=%(context)s, size=%(size)s") %
+           {'context' : context,
+            'max_bytes' : limit,
+            'size' : size},
+           context )
+
+class _ContentScanner:
+    """
+    Checks content fed to it one chunk at a time. Only the last few bytes of
+    the previous chunk are kept, so that forbidden patterns split between
+    two chunks are still found.
+    """
+    def __init__(self, rule, context, limit):
+        self.rule = rule
+        self.context = context
+        self.limit = limit
+        self.total = 0
+
+        self.head = ''
+        self.head_length = 0
+        if rule.magic_numbers:
+            self.head_length = max([len(magic) for magic in rule.magic_numbers])
+
+        self.tail = ''
+        self.overlap = 0
+        if rule.forbidden_patterns:
+            self.overlap = max([len(pattern) for pattern in rule.forbidden_patterns]) - 1
+
+        self.decoder = None
+        if rule.encoding is not None:
+            self.decoder = codecs.getincrementaldecoder(rule.encoding)('strict')
+
+    def feed(self, chunk):
+        offset = self.total
+        self.total += len(chunk)
+        if self.total > self.limit:
+            raise self.rule._too_large(self.context, self.limit, "more than %s" % self.limit)
+
+        if self.head_length and len(self.head) < self.head_length:
+            self.head += chunk[:self.head_length - len(self.head)]
+            if len(self.head) == self.head_length:
+                self._check_magic()
+
+        if self.rule.forbidden_patterns:
+            window = self.tail + chunk
+            window_offset = offset - len(self.tail)
+            for pattern in self.rule.forbidden_patterns:
+                index = window.find(pattern)
+                if index != -1:
+                    raise ValidationException(
+                        _("%(context)s: Invalid file content") %
+                        {'context' : self.context},
+                        _("Forbidden pattern found in file content: context=%(context)s, pattern=%(pattern)r, offset=%(offset)s") %
+                        {'context' : self.context,
+                         'pattern' : pattern,
+                         'offset' : window_offset + index},
+                        self.context )
+            if self.overlap:
+                self.tail = window[-self.overlap:]
+
+        if self.decoder is not None:
+            self._decode(chunk, False, offset)
+
+    def close(self):
+        """
+        Runs the checks that need the end of the content.
+        """
+        if self.head_length and len(self.head) < self.head_length:
+            self._check_magic()
+        if self.decoder is not None:
+            self._decode('', True, self.total)
+
+    def _check_magic(self):
+        for magic in self.rule.magic_numbers:
+            if self.head.startswith(magic):
+                return
+        raise ValidationException(
+            _("%(context)s: Invalid file content") %
+            {'context' : self.context},
+            _("File content does not start with an allowed magic number: context=%(context)s, head=%(head)r") %
+            {'context' : self.context,
+             'head' : self.head},
+            self.context )
+
+    def _decode(self, chunk, final, offset):
+        try:
+            self.decoder.decode(chunk, final)
+        except UnicodeDecodeError, extra:
+            raise ValidationException(
+                _("%(context)s: Invalid file content") %
+                {'context' : self.context},
+                _("File content is not valid %(encoding)s: context=%(context)s, offset=%(offset)s") %
+                {'context' : self.context,
+                 'encoding' : self.rule.encoding,
+                 'offset' : offset + extra.start},
+                extra,
+                self.context )
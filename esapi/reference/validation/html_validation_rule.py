@@ -11,20 +11,311 @@
     The ESAPI is published by OWASP under the BSD license. You should read and 
     accept the LICENSE before you use, modify, and/or redistribute this software.
     
-@summary: An HTML validator using OWASP's AntiSamy.
+@summary: An HTML validator that cleans markup against a whitelist policy.
 @copyright: Copyright (c) 2009 - The OWASP Foundation
 @author: Craig Younkins (craig.younkins@owasp.org)
 """
 
 import re
+from htmlentitydefs import name2codepoint
+from HTMLParser import HTMLParser
+from HTMLParser import HTMLParseError
 
 from esapi.reference.validation.base_validation_rule import BaseValidationRule
-from esapi.reference.default_encoder import DefaultEncoder
+from esapi.reference.validation.validation_metrics import instrumented
+from esapi.translation import _
 
 from esapi.exceptions import ValidationException
-from esapi.exceptions import EncodingException
+
+# Number of characters fed to the tokenizer at a time
+CHUNK_SIZE = 8192
+
+# Characters that browsers ignore inside a URL scheme, as in "java\tscript:"
+_IGNORED_IN_URL = re.compile(r"[\x00-\x20\x7f]+")
+_URL_SCHEME = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*):")
+_CHARREF = re.compile(r"^(?:[0-9]{1,7}|[xX][0-9a-fA-F]{1,6})$")
+
+class HTMLPolicy:
+    """
+    A whitelist of the markup allowed in user-supplied HTML, compiled into
+    lookup tables so that checking a tag or attribute is a single dictionary
+    or set lookup.
+    """
+    def __init__(self, tags,
+                       global_attributes=(),
+                       url_attributes=(),
+                       url_schemes=(),
+                       void_tags=(),
+                       drop_content_tags=()):
+        """
+        @param tags: a dictionary of the allowed tags, each mapped to a list
+            of the attributes allowed on it
+        @param global_attributes: attributes allowed on every allowed tag
+        @param url_attributes: attributes whose values are URLs. A URL with
+            a scheme is only allowed if the scheme is in url_schemes.
+        @param url_schemes: the allowed URL schemes, such as 'http'
+        @param void_tags: allowed tags that have no end tag, such as 'br'
+        @param drop_content_tags: tags that are removed along with
+            everything inside them, such as 'script'. Other tags that are
+            not allowed are removed, but their text is kept.
+        """
+        self.attributes = {}
+        for tag, attributes in tags.items():
+            self.attributes[tag.lower()] = frozenset(
+                [name.lower() for name in list(attributes) + list(global_attributes)])
+        self.url_attributes = frozenset([name.lower() for name in url_attributes])
+        self.url_schemes = frozenset([scheme.lower() for scheme in url_schemes])
+        self.void_tags = frozenset([tag.lower() for tag in void_tags])
+        self.drop_content_tags = frozenset([tag.lower() for tag in drop_content_tags])
+
+    def is_allowed_url(self, url):
+        """
+        Returns True if url is relative or has an allowed scheme.
+        """
+        found = _URL_SCHEME.match(_IGNORED_IN_URL.sub('', url))
+        if found is None:
+            # Relative URL, unless a colon comes before any path character
+            return ':' not in url.split('/', 1)[0].split('?', 1)[0].split('#', 1)[0]
+        return found.group(1).lower() in self.url_schemes
+
+DEFAULT_POLICY = HTMLPolicy(
+    tags = {
+        'a' : ['href'],
+        'abbr' : [], 'acronym' : [],
+        'b' : [], 'big' : [], 'blockquote' : ['cite'], 'br' : [],
+        'caption' : [], 'cite' : [], 'code' : [],
+        'dd' : [], 'del' : [], 'dfn' : [], 'div' : [], 'dl' : [], 'dt' : [],
+        'em' : [],
+        'h1' : [], 'h2' : [], 'h3' : [], 'h4' : [], 'h5' : [], 'h6' : [],
+        'hr' : [],
+        'i' : [], 'img' : ['src', 'alt', 'width', 'height'], 'ins' : [],
+        'kbd' : [],
+        'li' : [],
+        'ol' : [],
+        'p' : [], 'pre' : [],
+        'q' : ['cite'],
+        's' : [], 'samp' : [], 'small' : [], 'span' : [], 'strike' : [],
+        'strong' : [], 'sub' : [], 'sup' : [],
+        'table' : [], 'tbody' : [], 'td' : ['colspan', 'rowspan'],
+        'tfoot' : [], 'th' : ['colspan', 'rowspan'], 'thead' : [], 'tr' : [],
+        'tt' : [],
+        'u' : [], 'ul' : [],
+        'var' : [],
+        },
+    global_attributes = ['title', 'lang', 'dir'],
+    url_attributes = ['href', 'src', 'cite'],
+    url_schemes = ['http', 'https', 'mailto'],
+    void_tags = ['br', 'hr', 'img'],
+    drop_content_tags = ['script', 'style', 'iframe', 'object', 'applet',
+        'noscript', 'noframes', 'noembed', 'title', 'textarea', 'select',
+        'xmp', 'template'],
+    )
+
+class _OutputTooLong(Exception):
+    pass
+
+class _Sanitizer(HTMLParser):
+    """
+    Writes the allowed markup of the HTML fed to it, as it is tokenized.
+    """
+    def __init__(self, policy, max_length):
+        HTMLParser.__init__(self)
+        self.policy = policy
+        self.max_length = max_length
+        self.out = []
+        self.length = 0
+        self.open_tags = []
+        # Number of open elements of each tag, so end tags are checked
+        # without scanning the stack
+        self.open_counts = {}
+        self.skip_depth = 0
+
+    def _write(self, text):
+        self.length += len(text)
+        if self.max_length is not None and self.length > self.max_length:
+            raise _OutputTooLong()
+        self.out.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, False)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, True)
+
+    def _start(self, tag, attrs, self_closing):
+        if tag in self.policy.drop_content_tags:
+            if not self_closing:
+                self.skip_depth += 1
+            return
+        if self.skip_depth:
+            return
+        allowed = self.policy.attributes.get(tag)
+        if allowed is None:
+            return
+
+        parts = ['<', tag]
+        seen = set()
+        for name, value in attrs:
+            if name not in allowed or name in seen:
+                continue
+            seen.add(name)
+            if value is None:
+                value = ''
+            if name in self.policy.url_attributes and not self.policy.is_allowed_url(value):
+                continue
+            parts.append(' %s="%s"' % (name, _escape_attribute(value)))
+
+        if tag in self.policy.void_tags:
+            parts.append(' />')
+        else:
+            parts.append('>')
+            if self_closing:
+                parts.append('</%s>' % tag)
+            else:
+                self.open_tags.append(tag)
+                self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+        self._write(''.join(parts))
+
+    def handle_endtag(self, tag):
+        if tag in self.policy.drop_content_tags:
+            if self.skip_depth:
+                self.skip_depth -= 1
+            return
+        if self.skip_depth or not self.open_counts.get(tag):
+            return
+        # Close any tags left open inside this one
+        while True:
+            open_tag = self.open_tags.pop()
+            self.open_counts[open_tag] -= 1
+            self._write('</%s>' % open_tag)
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self._write(_escape_text(data))
+
+    def handle_entityref(self, name):
+        if self.skip_depth:
+            return
+        if name in name2codepoint:
+            self._write('&%s;' % name)
+        else:
+            self._write('&amp;%s' % name)
+
+    def handle_charref(self, name):
+        if self.skip_depth:
+            return
+        if _CHARREF.match(name):
+            self._write('&#%s;' % name)
+        else:
+            self._write('&amp;#%s' % name)
+
+    def finish(self):
+        """
+        Tokenizes what is left, closes the open tags and returns the output.
+        """
+        self.close()
+        while self.open_tags:
+            self._write('</%s>' % self.open_tags.pop())
+        return ''.join(self.out)
+
+def _escape_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def _escape_attribute(value):
+    return _escape_text(value).replace('"', '&quot;')
 
 class HTMLValidationRule(BaseValidationRule):
     """
-    This validator performs syntax validation of strings.
+    This validator cleans HTML from an untrusted source, keeping only the
+    tags, attributes and URL schemes allowed by an L{HTMLPolicy}. The input
+    is tokenized once, in chunks, and the output is written as each token is
+    read, so input that produces too much output is rejected as soon as it
+    passes the maximum length.
+
+    Comments, declarations and processing instructions are removed. Tags
+    that are not allowed are removed, and so is the content of tags such as
+    script and style. Tags left open are closed at the end.
     """
+    def __init__(self, type_name, encoder=None, policy=None):
+        self.max_length = None
+        self.policy = None
+
+        BaseValidationRule.__init__(self, type_name, encoder)
+        if policy is None:
+            policy = DEFAULT_POLICY
+        self.set_policy(policy)
+
+    def set_policy(self, policy):
+        self.policy = policy
+
+    def set_maximum_length(self, length):
+        self.max_length = length
+
+    @instrumented
+    def get_valid(self, context, input_, error_list=None):
+        """
+        @return: the cleaned HTML, or None if the input is empty and that
+            is allowed
+        """
+        try:
+            # check null
+            if input_ is None or len(input_) == 0:
+                if self.allow_none:
+                    return None
+                raise ValidationException(
+                   _("%(context)s: Input HTML required") %
+                   {'context' : context},
+                   _("Input HTML required: context=%(context)s, input=%(input)s") %
+                   {'context' : context,
+                    'input' : input_},
+                   context )
+
+            # check length
+            if self.max_length is not None and len(input_) > self.max_length:
+                raise self._too_long(context)
+
+            return self.sanitize(context, input_)
+
+        except ValidationException, extra:
+            if error_list is not None:
+                error_list[context] = extra
+            else:
+                raise
+
+        return None
+
+    def sanitize(self, context, input_):
+        """
+        Returns the HTML cleaned against the policy.
+
+        @raises ValidationException: if the cleaned HTML is longer than the
+            maximum length, or the input cannot be tokenized
+        """
+        sanitizer = _Sanitizer(self.policy, self.max_length)
+        try:
+            for start in xrange(0, len(input_), CHUNK_SIZE):
+                sanitizer.feed(input_[start:start + CHUNK_SIZE])
+            return sanitizer.finish()
+        except _OutputTooLong:
+            raise self._too_long(context)
+        except (HTMLParseError, UnicodeError), extra:
+            raise ValidationException(
+               _("%(context)s: Invalid HTML input") %
+               {'context' : context},
+               _("Unable to parse HTML: context=%(context)s, error=%(error)s") %
+               {'context' : context,
+                'error' : extra},
+               extra,
+               context )
+
+    def _too_long(self, context):
+        return ValidationException(
+           _("%(context)s: Invalid HTML. The maximum length of %(max_length)s characters was exceeded") %
+           {'context' : context,
+            'max_length' : self.max_length},
+           _("HTML exceeds maximum allowed length of %(max_length)s: context=%(context)s") %
+           {'context' : context,
+            'max_length' : self.max_length},
+           context )
@@ -0,0 +1,401 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: A ValidationRule that reads a JSON body as a stream and validates
+    each value as it is read.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import re
+
+try:
+    from json.decoder import scanstring
+except ImportError:
+    from simplejson.decoder import scanstring
+
+from esapi.reference.validation.base_validation_rule import BaseValidationRule
+from esapi.reference.validation.validation_metrics import instrumented
+from esapi.translation import _
+
+from esapi.exceptions import ValidationException
+
+# Number of bytes read from a stream at a time
+CHUNK_SIZE = 8192
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?")
+_NUMBER_CHARS = re.compile(r"[-+.eE0-9]*")
+# The body of a string up to its closing quote, without decoding it
+_STRING_BODY = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+_LITERALS = {'true' : True, 'false' : False, 'null' : None}
+
+class _SyntaxError(Exception):
+    pass
+
+class _TooLarge(Exception):
+    pass
+
+class _Lexer:
+    """
+    Splits JSON text, read from a stream as needed, into tokens. A token
+    that is split across reads is completed by reading more, and the read
+    size grows with the unfinished token, so long strings are scanned a
+    bounded number of times.
+    """
+    def __init__(self, read, max_bytes):
+        self.read = read
+        self.max_bytes = max_bytes
+        self.buffer = ''
+        self.pos = 0
+        self.total = 0
+        self.eof = False
+
+    def _more(self):
+        """
+        Reads more input, and returns False at the end of the stream.
+        """
+        if self.eof:
+            return False
+        size = max(CHUNK_SIZE, len(self.buffer) - self.pos)
+        if self.max_bytes is not None:
+            # One byte more than allowed is enough to tell it is too large
+            size = min(size, self.max_bytes + 1 - self.total)
+        data = self.read(size)
+        if not data:
+            self.eof = True
+            return False
+        self.total += len(data)
+        if self.max_bytes is not None and self.total > self.max_bytes:
+            raise _TooLarge()
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def next_token(self):
+        """
+        Returns a tuple of the kind of the next token, which is one of
+        '{}[]:,', 'string', 'number', 'literal' or 'end', and its value.
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self._more():
+                break
+        if self.pos >= len(self.buffer):
+            return 'end', None
+
+        char = self.buffer[self.pos]
+        if char in '{}[]:,':
+            self.pos += 1
+            return char, None
+        if char == '"':
+            return 'string', self._string()
+        if char == '-' or '0' <= char <= '9':
+            return 'number', self._number()
+        return 'literal', self._literal()
+
+    def _string(self):
+        while True:
+            found = _STRING_BODY.match(self.buffer, self.pos + 1)
+            if found is not None:
+                break
+            if not self._more():
+                raise _SyntaxError("unterminated string")
+        try:
+            value, self.pos = scanstring(self.buffer, self.pos + 1, 'utf-8', True)
+        except ValueError, extra:
+            raise _SyntaxError(str(extra))
+        # Plain ASCII strings are returned as str, like the rest of ESAPI
+        try:
+            return value.encode('ascii')
+        except UnicodeError:
+            return value
+
+    def _number(self):
+        # Read until the run of number characters ends, then check the run
+        # is one number, so that "1.2.3" is not read as 1.2 and then .3
+        while True:
+            end = _NUMBER_CHARS.match(self.buffer, self.pos).end()
+            if end < len(self.buffer) or not self._more():
+                break
+        found = _NUMBER.match(self.buffer, self.pos, end)
+        if found is None or found.end() != end:
+            raise _SyntaxError("invalid number")
+        self.pos = end
+        return found.group()
+
+    def _literal(self):
+        while len(self.buffer) - self.pos < 5 and self._more():
+            pass
+        for text, value in _LITERALS.items():
+            if self.buffer.startswith(text, self.pos):
+                self.pos += len(text)
+                return text
+        raise _SyntaxError("unexpected character %r" % self.buffer[self.pos])
+
+class _Frame:
+    """
+    An object or array being read.
+    """
+    def __init__(self, kind, path, context, value):
+        self.kind = kind
+        self.path = path
+        self.context = context
+        self.value = value
+        self.key = None
+        self.count = 0
+        # What may come next: 'key', 'colon', 'value', 'comma', or 'first'
+        # for a value or key, or the end of an empty container
+        self.state = 'first'
+
+class JSONValidationRule(BaseValidationRule):
+    """
+    This validator reads a JSON body as a stream of tokens and checks each
+    value as soon as it is read, with the rule added for its path. Reading
+    stops at the first violation, so a hostile body is not read, or kept in
+    memory, past that point.
+
+    A path names the keys from the top of the document, joined by dots,
+    with [] for the elements of an array. For example, the rule for
+    "items[].price" checks the price of every element of the items array.
+    String values are given to their rule as they are, numbers as their
+    JSON text, true and false as 'true' and 'false', and null as None, so
+    that set_allow_none of the rule decides whether null is allowed. The
+    context a value is checked in, used in error messages, is the context
+    of the body followed by the path with the index of each element, such
+    as "order.items[3].price".
+
+    The body is also rejected if it is not valid JSON, is longer than the
+    maximum bytes, is nested deeper than the maximum depth, has an object
+    with more than the maximum keys or a duplicate key, or has an object or
+    array where a rule expects a value.
+    """
+    def __init__(self, type_name, encoder=None, max_bytes=None):
+        self.max_bytes = None
+        self.max_depth = 32
+        self.max_keys = 1000
+        self.rules = {}
+
+        BaseValidationRule.__init__(self, type_name, encoder)
+        self.set_maximum_bytes(max_bytes)
+
+    def set_maximum_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+
+    def set_maximum_depth(self, depth):
+        self.max_depth = depth
+
+    def set_maximum_keys(self, count):
+        """
+        Sets the maximum number of keys in any one object.
+        """
+        self.max_keys = count
+
+    def add_rule(self, path, rule):
+        """
+        Checks the values at path with rule, a ValidationRule such as a
+        StringValidationRule or NumberValidationRule.
+        """
+        self.rules[path] = rule
+
+    @instrumented
+    def get_valid(self, context, input_, error_list=None):
+        """
+        @param input_: the JSON text, or a file object to read it from
+        @return: the document, with every value that has a rule replaced by
+            the value returned by the rule, or None if the body is empty
+            and that is allowed
+        """
+        try:
+            if isinstance(input_, basestring):
+                text = [input_]
+                def read(size):
+                    if text:
+                        return text.pop()
+                    return ''
+            elif input_ is None:
+                read = None
+            else:
+                read = input_.read
+
+            lexer = None
+            token = 'end'
+            if read is not None:
+                lexer = _Lexer(read, self.max_bytes)
+                token, value = self._next(context, lexer)
+            if token == 'end':
+                if self.allow_none:
+                    return None
+                raise ValidationException(
+                   _("%(context)s: Input JSON required") %
+                   {'context' : context},
+                   _("Input JSON required: context=%(context)s") %
+                   {'context' : context},
+                   context )
+
+            return self._parse(context, lexer, token, value)
+
+        except ValidationException, extra:
+            if error_list is not None:
+                error_list[context] = extra
+            else:
+                raise
+
+        return None
+
+    def _next(self, context, lexer):
+        try:
+            return lexer.next_token()
+        except _SyntaxError, extra:
+            raise self._invalid(context, lexer, str(extra))
+        except _TooLarge:
+            raise ValidationException(
+               _("%(context)s: Invalid JSON. The maximum size of %(max_bytes)s bytes was exceeded") %
+               {'context' : context,
+                'max_bytes' : self.max_bytes},
+               _("JSON exceeds maximum allowed size of %(max_bytes)s bytes: context=%(context)s") %
+               {'context' : context,
+                'max_bytes' : self.max_bytes},
+               context )
+
+    def _parse(self, context, lexer, token, value):
+        stack = []
+        root = []
+        while True:
+            if stack:
+                frame = stack[-1]
+                path = frame.path
+                value_context = frame.context
+                state = frame.state
+            else:
+                frame = None
+                path = ''
+                value_context = context
+                if root:
+                    state = 'end'
+                else:
+                    state = 'value'
+
+            if state == 'end':
+                if token != 'end':
+                    raise self._invalid(context, lexer, "data after the document")
+                return root[0]
+
+            closing = frame is not None and state in ('first', 'comma') and (
+                (frame.kind == 'object' and token == '}') or
+                (frame.kind == 'array' and token == ']'))
+            if closing:
+                stack.pop()
+                self._add(stack, root, frame.value)
+            elif state == 'comma':
+                if token != ',':
+                    raise self._invalid(context, lexer, "expected , or the end of the %s" % frame.kind)
+                if frame.kind == 'object':
+                    frame.state = 'key'
+                else:
+                    frame.state = 'value'
+            elif frame is not None and frame.kind == 'object' and state in ('first', 'key'):
+                if token != 'string':
+                    raise self._invalid(context, lexer, "expected a key")
+                frame.count += 1
+                if frame.count > self.max_keys:
+                    raise self._limit(context, value_context,
+                        _("more than %(max_keys)s keys") % {'max_keys' : self.max_keys})
+                if value in frame.value:
+                    raise self._limit(context, value_context,
+                        _("duplicate key %(key)r") % {'key' : value})
+                frame.key = value
+                frame.state = 'colon'
+            elif state == 'colon':
+                if token != ':':
+                    raise self._invalid(context, lexer, "expected :")
+                frame.state = 'value'
+            else:
+                # A value, as an object member, an array element, or the
+                # whole document
+                if frame is not None:
+                    if frame.kind == 'object':
+                        path = self._join(path, frame.key)
+                        value_context = self._join(value_context, frame.key)
+                    else:
+                        path = path + '[]'
+                        value_context = '%s[%s]' % (value_context, len(frame.value))
+                    frame.state = 'comma'
+
+                if token in ('{', '['):
+                    if path in self.rules:
+                        raise self._limit(context, value_context, _("expected a value"))
+                    if len(stack) >= self.max_depth:
+                        raise self._limit(context, value_context,
+                            _("nested deeper than %(max_depth)s") % {'max_depth' : self.max_depth})
+                    if token == '{':
+                        stack.append(_Frame('object', path, value_context, {}))
+                    else:
+                        stack.append(_Frame('array', path, value_context, []))
+                elif token in ('string', 'number', 'literal'):
+                    self._add(stack, root, self._check_value(path, value_context, token, value))
+                else:
+                    raise self._invalid(context, lexer, "expected a value")
+
+            token, value = self._next(context, lexer)
+
+    def _add(self, stack, root, value):
+        if not stack:
+            root.append(value)
+            return
+        frame = stack[-1]
+        if frame.kind == 'object':
+            frame.value[frame.key] = value
+        else:
+            frame.value.append(value)
+
+    def _check_value(self, path, value_context, token, value):
+        rule = self.rules.get(path)
+        if token == 'literal':
+            if value == 'null':
+                value = None
+            elif rule is None:
+                return _LITERALS[value]
+        elif token == 'number' and rule is None:
+            if value.isdigit() or (value[1:].isdigit() and value[0] == '-'):
+                return int(value)
+            return float(value)
+        if rule is None:
+            return value
+        # Raises ValidationException, which ends the reading of the body
+        return rule.get_valid(value_context, value)
+
+    def _join(self, path, key):
+        if path:
+            return '%s.%s' % (path, key)
+        return key
+
+    def _invalid(self, context, lexer, reason):
+        return ValidationException(
+           _("%(context)s: Invalid JSON") %
+           {'context' : context},
+           _("Invalid JSON at byte %(offset)s: %(reason)s: context=%(context)s") %
+           {'context' : context,
+            'offset' : lexer.total - len(lexer.buffer) + lexer.pos,
+            'reason' : reason},
+           context )
+
+    def _limit(self, context, value_context, reason):
+        return ValidationException(
+           _("%(context)s: Invalid JSON") %
+           {'context' : context},
+           _("Invalid JSON at %(path)s: %(reason)s: context=%(context)s") %
+           {'context' : context,
+            'path' : value_context,
+            'reason' : reason},
+           context )
@@ -16,12 +16,20 @@
 @author: Craig Younkins (craig.younkins@owasp.org)
 """
 
+import re
+
 from esapi.reference.validation.base_validation_rule import BaseValidationRule
+from esapi.reference.validation.validation_metrics import instrumented
 from esapi.translation import _
 
 from esapi.exceptions import ValidationException
 from esapi.exceptions import EncodingException
 
+# Numbers written only with ASCII digits, an optional sign and an optional
+# decimal point. None of the codecs decode these characters, so such input
+# is already canonical.
+PLAIN_NUMBER = re.compile(r"^[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)$")
+
 class NumberValidationRule(BaseValidationRule):
     def __init__(self, type_name, num_type, encoder, min_value, max_value):
         BaseValidationRule.__init__(self, type_name, encoder)
@@ -30,6 +38,7 @@ class NumberValidationRule(BaseValidationRule):
         self.min_value = min_value
         self.max_value = max_value
         
+    @instrumented
     def get_valid(self, context, input_, error_list=None):
         try:        
             # check for none
@@ -44,16 +53,19 @@ class NumberValidationRule(BaseValidationRule):
                     'input' : input_}, 
                    context )
                         
-            # canonicalize
-            try:
-                canonical = self.encoder.canonicalize( input_ )
-            except EncodingException, extra:
-                raise ValidationException( 
-                   _("%(context)s: Invalid number input. Encoding problem detected.") %
-                   {'context' : context}, 
-                   _("Error canonicalizing user input"), 
-                   extra, 
-                   context )
+            # canonicalize, unless the input is plainly a number
+            if PLAIN_NUMBER.match(input_):
+                canonical = input_
+            else:
+                try:
+                    canonical = self.encoder.canonicalize( input_ )
+                except EncodingException, extra:
+                    raise ValidationException( 
+                       _("%(context)s: Invalid number input. Encoding problem detected.") %
+                       {'context' : context}, 
+                       _("Error canonicalizing user input"), 
+                       extra, 
+                       context )
                 
             if self.min_value > self.max_value:
                 raise ValidationException( 
@@ -99,4 +111,22 @@ class NumberValidationRule(BaseValidationRule):
             else:
                 raise
             
-        return None
\ No newline at end of file
+        return None
+        
+    def validate_many(self, context, inputs, error_list=None):
+        """
+        Validates an iterable of numbers, such as a column of an import, 
+        with the same rules as get_valid(). Inputs are consumed lazily.
+
+        @param context: A descriptive name of the inputs. The error for the
+            input at position i is stored in error_list under the key
+            "context[i]".
+        @param inputs: An iterable of numbers as strings.
+        @param error_list: If error_list exists, any errors will be captured
+            in the list and None will be yielded for the invalid input.
+            Otherwise, the first error is raised.
+
+        @return: A generator yielding, in order, the value of each input.
+        """
+        for index, input_ in enumerate(inputs):
+            yield self.get_valid("%s[%s]" % (context, index), input_, error_list)
\ No newline at end of file
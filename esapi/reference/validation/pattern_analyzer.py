@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: Static analysis of validation patterns for constructs that cause
+    exponential backtracking.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import sre_parse
+from sre_constants import MAXREPEAT
+
+from esapi.translation import _
+
+# Character sets are approximated over this range of code points. This is
+# enough to find overlaps between the classes used in validation patterns.
+_ALPHABET = frozenset(range(256))
+_NEWLINE = ord('\n')
+_CATEGORIES = {
+    'category_digit' : frozenset(range(ord('0'), ord('9') + 1)),
+    'category_space' : frozenset([ord(c) for c in ' \t\n\r\f\v']),
+    'category_word' : frozenset([ord(c) for c in
+        'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_']),
+    }
+_CATEGORIES['category_not_digit'] = _ALPHABET - _CATEGORIES['category_digit']
+_CATEGORIES['category_not_space'] = _ALPHABET - _CATEGORIES['category_space']
+_CATEGORIES['category_not_word'] = _ALPHABET - _CATEGORIES['category_word']
+
+def analyze_pattern(pattern_string):
+    """
+    Looks for regular expression constructs that can backtrack
+    exponentially, such as nested quantifiers like (a+)+ and quantified
+    alternations with overlapping branches like (a|ab)*.
+
+    The analysis is conservative rather than exact: it approximates
+    character classes, so a reported construct should be reviewed by hand.
+
+    @param pattern_string: the regular expression to analyze
+    @return: a list of descriptions of the dangerous constructs found. An
+        empty list means no problem was detected.
+    @raises re.error: if the pattern does not compile
+    """
+    parsed = sre_parse.parse(pattern_string)
+    warnings = []
+    _check(list(parsed), False, warnings)
+    return warnings
+
+def is_safe_pattern(pattern_string):
+    """
+    Returns True if analyze_pattern() found no dangerous constructs.
+    """
+    return len(analyze_pattern(pattern_string)) == 0
+
+def _check(items, in_unbounded_repeat, warnings):
+    for op, av in items:
+        if op in ('max_repeat', 'min_repeat'):
+            min_, max_, body = av
+            body = list(body)
+            unbounded = max_ == MAXREPEAT
+            if unbounded:
+                _check_repeat_body(body, warnings)
+            _check(body, in_unbounded_repeat or unbounded, warnings)
+        elif op == 'subpattern':
+            _check(list(av[1]), in_unbounded_repeat, warnings)
+        elif op == 'branch':
+            for branch in av[1]:
+                _check(list(branch), in_unbounded_repeat, warnings)
+        elif op in ('assert', 'assert_not'):
+            _check(list(av[1]), in_unbounded_repeat, warnings)
+
+def _check_repeat_body(body, warnings):
+    """
+    body is repeated an unbounded number of times. It is dangerous if the
+    same text can be split between iterations in more than one way.
+    """
+    first = _first_chars(body)
+
+    # Nested quantifier whose characters can also start a new iteration
+    for inner in _inner_repeats(body):
+        if inner & first:
+            warnings.append(_("Nested quantifier can match the same input in many ways"))
+            break
+
+    # Alternation whose branches can start with the same character
+    for op, av in _unwrap(body):
+        if op == 'branch':
+            seen = set()
+            for branch in av[1]:
+                branch_first = _first_chars(list(branch))
+                if seen & branch_first:
+                    warnings.append(_("Quantified alternation has overlapping branches"))
+                    break
+                seen |= branch_first
+
+def _unwrap(items):
+    """
+    Yields the items of a sequence, looking through capturing groups.
+    """
+    for op, av in items:
+        if op == 'subpattern':
+            for item in _unwrap(list(av[1])):
+                yield item
+        else:
+            yield op, av
+
+def _inner_repeats(items):
+    """
+    Yields the set of characters matched by each repeat, with a maximum
+    greater than one, nested anywhere inside items.
+    """
+    for op, av in items:
+        if op in ('max_repeat', 'min_repeat'):
+            min_, max_, body = av
+            if max_ > 1:
+                yield _all_chars(list(body))
+            for inner in _inner_repeats(list(body)):
+                yield inner
+        elif op == 'subpattern':
+            for inner in _inner_repeats(list(av[1])):
+                yield inner
+        elif op == 'branch':
+            for branch in av[1]:
+                for inner in _inner_repeats(list(branch)):
+                    yield inner
+
+def _all_chars(items):
+    chars = set()
+    for op, av in items:
+        chars |= _item_chars(op, av, _all_chars)
+    return chars
+
+def _first_chars(items):
+    chars = set()
+    for op, av in items:
+        chars |= _item_chars(op, av, _first_chars)
+        if not _nullable(op, av):
+            break
+    return chars
+
+def _item_chars(op, av, recurse):
+    if op == 'literal':
+        return set([av])
+    elif op == 'not_literal':
+        return set(_ALPHABET - frozenset([av]))
+    elif op == 'any':
+        return set(_ALPHABET - frozenset([_NEWLINE]))
+    elif op == 'in':
+        return _class_chars(av)
+    elif op in ('max_repeat', 'min_repeat'):
+        return recurse(list(av[2]))
+    elif op == 'subpattern':
+        return recurse(list(av[1]))
+    elif op == 'branch':
+        chars = set()
+        for branch in av[1]:
+            chars |= recurse(list(branch))
+        return chars
+    elif op == 'groupref':
+        return set(_ALPHABET)
+    return set()
+
+def _class_chars(items):
+    chars = set()
+    negate = False
+    for op, av in items:
+        if op == 'negate':
+            negate = True
+        elif op == 'literal':
+            chars.add(av)
+        elif op == 'range':
+            chars.update(range(av[0], av[1] + 1))
+        elif op == 'category':
+            chars |= _CATEGORIES.get(av, _ALPHABET)
+    if negate:
+        return set(_ALPHABET - chars)
+    return chars & _ALPHABET
+
+def _nullable(op, av):
+    """
+    Returns True if the item can match the empty string.
+    """
+    if op in ('at', 'assert', 'assert_not'):
+        return True
+    elif op in ('max_repeat', 'min_repeat'):
+        min_, max_, body = av
+        return min_ == 0 or all([_nullable(o, a) for o, a in body])
+    elif op == 'subpattern':
+        return all([_nullable(o, a) for o, a in av[1]])
+    elif op == 'branch':
+        for branch in av[1]:
+            if all([_nullable(o, a) for o, a in branch]):
+                return True
+        return False
+    return False
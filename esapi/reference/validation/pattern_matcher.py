@@ -0,0 +1,331 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: Runs validation patterns against untrusted input with an optional
+    time budget, and keeps timing statistics for every pattern.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import multiprocessing
+import Queue
+import re
+import threading
+import time
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+from esapi.core import ESAPI
+from esapi.translation import _
+from esapi.exceptions import ConfigurationException
+
+def _timedelta_to_seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
+
+def _worker_main(connection, parent_connection):
+    """
+    Runs in a worker process, matching one pattern at a time. Compiled
+    patterns are cached by the re module, so repeated patterns are only
+    compiled once per worker.
+    """
+    parent_connection.close()
+    while True:
+        try:
+            pattern, flags, input_ = connection.recv()
+        except EOFError:
+            return
+        try:
+            result = re.compile(pattern, flags).match(input_) is not None
+        except Exception, extra:
+            result = extra
+        connection.send(result)
+
+class _Worker:
+    """
+    A worker process and the pipe to it.
+    """
+    def __init__(self, generation):
+        self.generation = generation
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_main,
+            args=(child_connection, self.connection))
+        self.process.daemon = True
+        self.process.start()
+        child_connection.close()
+
+    def terminate(self):
+        self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+class PatternTimeoutError(Exception):
+    """
+    Raised when a pattern does not finish matching within its time budget.
+    """
+    pass
+
+class PatternStatistics:
+    """
+    Timing statistics for a single pattern.
+    """
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.calls = 0
+        self.timeouts = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def get_average_time(self):
+        if self.calls == 0:
+            return 0.0
+        return self.total_time / self.calls
+
+    def __repr__(self):
+        return ("PatternStatistics(%r, calls=%s, timeouts=%s, avg=%.6fs, max=%.6fs)" %
+            (self.pattern, self.calls, self.timeouts,
+             self.get_average_time(), self.max_time))
+
+class PatternMatcher:
+    """
+    Matches validation patterns against input using one of these engines:
+
+        - inline: Python's re module in the calling thread. There is no time
+          budget, because the re module cannot be interrupted while matching.
+        - process: Python's re module in a set of worker processes. The time
+          budget starts when a worker receives the match, not while it waits
+          for a free worker. A match that exceeds it is abandoned and only
+          that worker is killed and replaced.
+        - re2: Google's linear-time RE2 engine, through the optional re2
+          module. Patterns that RE2 does not support, such as those with
+          backreferences or lookarounds, fall back to the process engine.
+
+    Threads are not offered as an engine because the re module holds the
+    GIL for the entire match, so a timer thread could never fire.
+    """
+
+    ENGINES = ('inline', 'process', 're2')
+
+    def __init__(self, engine='inline', timeout=None, processes=1):
+        """
+        @param engine: one of PatternMatcher.ENGINES
+        @param timeout: the time budget of a single match, as a timedelta.
+            Ignored by the inline engine.
+        @param processes: the number of worker processes for the process
+            engine
+        """
+        if engine not in self.ENGINES:
+            raise ConfigurationException(
+                _('There is an error in the application configuration. See the security log for more details.'),
+                _("Unknown pattern engine: %(engine)s") %
+                {'engine' : engine} )
+        if engine == 're2' and re2 is None:
+            raise ConfigurationException(
+                _('There is an error in the application configuration. See the security log for more details.'),
+                _("The re2 pattern engine requires the re2 module") )
+
+        self.engine = engine
+        self.timeout = None
+        if timeout is not None:
+            self.timeout = _timedelta_to_seconds(timeout)
+        self.processes = processes
+
+        # Idle workers, and the number started in this generation. close()
+        # starts a new generation, so busy workers are not reused.
+        self._idle = Queue.Queue()
+        self._started = 0
+        self._generation = 0
+        self._re2_cache = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def match(self, pattern, input_):
+        """
+        Returns True if the compiled pattern matches at the start of input_.
+
+        @raises PatternTimeoutError: if the match exceeded the time budget
+        """
+        start = time.time()
+        timed_out = False
+        try:
+            try:
+                if self.engine == 're2':
+                    compiled = self._get_re2(pattern)
+                    if compiled is not None:
+                        return compiled.match(input_) is not None
+                    return self._match_in_pool(pattern, input_)
+                elif self.engine == 'process':
+                    return self._match_in_pool(pattern, input_)
+                else:
+                    return pattern.match(input_) is not None
+            except PatternTimeoutError:
+                timed_out = True
+                raise
+        finally:
+            self._record(pattern.pattern, time.time() - start, timed_out)
+
+    def _match_in_pool(self, pattern, input_):
+        worker = self._acquire_worker()
+        try:
+            worker.connection.send((pattern.pattern, pattern.flags, input_))
+            # The worker was idle, so it starts matching now
+            if self.timeout is not None and not worker.connection.poll(self.timeout):
+                raise PatternTimeoutError(pattern.pattern)
+            result = worker.connection.recv()
+        except:
+            # The worker is stuck backtracking, or died. Kill it so it does
+            # not hold a CPU, and start another in its place.
+            self._replace_worker(worker)
+            raise
+        self._release_worker(worker)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _acquire_worker(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+                if worker.generation == self._generation:
+                    return worker
+                worker.terminate()
+                continue
+            except Queue.Empty:
+                pass
+            self._lock.acquire()
+            try:
+                start = self._started < self.processes
+                if start:
+                    self._started += 1
+                    generation = self._generation
+            finally:
+                self._lock.release()
+            if start:
+                return _Worker(generation)
+            # Wait for a worker to be released. The wait is cut short now
+            # and then in case close() started a new generation.
+            try:
+                worker = self._idle.get(True, 0.1)
+            except Queue.Empty:
+                continue
+            if worker.generation == self._generation:
+                return worker
+            worker.terminate()
+
+    def _release_worker(self, worker):
+        if worker.generation == self._generation:
+            self._idle.put(worker)
+        else:
+            worker.terminate()
+
+    def _replace_worker(self, worker):
+        worker.terminate()
+        if worker.generation == self._generation:
+            self._idle.put(_Worker(worker.generation))
+
+    def _get_re2(self, pattern):
+        key = (pattern.pattern, pattern.flags)
+        try:
+            return self._re2_cache[key]
+        except KeyError:
+            pass
+        try:
+            compiled = re2.compile(pattern.pattern, pattern.flags)
+        except Exception:
+            compiled = None
+        self._re2_cache[key] = compiled
+        return compiled
+
+    def _record(self, pattern_string, elapsed, timed_out):
+        self._lock.acquire()
+        try:
+            stats = self._stats.get(pattern_string)
+            if stats is None:
+                stats = PatternStatistics(pattern_string)
+                self._stats[pattern_string] = stats
+            stats.calls += 1
+            stats.total_time += elapsed
+            if elapsed > stats.max_time:
+                stats.max_time = elapsed
+            if timed_out:
+                stats.timeouts += 1
+        finally:
+            self._lock.release()
+
+    def get_statistics(self):
+        """
+        Returns a list of PatternStatistics, slowest average first.
+        """
+        self._lock.acquire()
+        try:
+            stats = self._stats.values()
+        finally:
+            self._lock.release()
+        stats.sort(key=lambda s: s.get_average_time(), reverse=True)
+        return stats
+
+    def reset_statistics(self):
+        self._lock.acquire()
+        try:
+            self._stats.clear()
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """
+        Terminates the idle worker processes. Busy workers are terminated
+        when their match finishes.
+        """
+        self._lock.acquire()
+        try:
+            self._generation += 1
+            self._started = 0
+        finally:
+            self._lock.release()
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except Queue.Empty:
+                break
+            worker.terminate()
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+def get_pattern_matcher():
+    """
+    Returns the shared PatternMatcher, configured from the
+    SecurityConfiguration the first time it is requested.
+    """
+    global _matcher
+    if _matcher is None:
+        _matcher_lock.acquire()
+        try:
+            if _matcher is None:
+                config = ESAPI.security_configuration()
+                _matcher = PatternMatcher(
+                    config.get_validation_pattern_engine(),
+                    config.get_validation_pattern_timeout(),
+                    config.get_validation_pattern_processes() )
+        finally:
+            _matcher_lock.release()
+    return _matcher
+
+def set_pattern_matcher(matcher):
+    """
+    Replaces the shared PatternMatcher.
+    """
+    global _matcher
+    _matcher = matcher
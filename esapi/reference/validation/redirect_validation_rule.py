@@ -0,0 +1,258 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: A ValidationRule for redirect locations, checked against an
+    allow list of hosts and paths.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import re
+from urlparse import urlsplit
+
+from esapi.reference.validation.base_validation_rule import BaseValidationRule
+from esapi.reference.validation.validation_metrics import instrumented
+from esapi.translation import _
+
+from esapi.exceptions import ValidationException
+from esapi.exceptions import EncodingException
+
+_HOST = re.compile(r"^[a-z0-9]([a-z0-9-]*[a-z0-9])?(\.[a-z0-9]([a-z0-9-]*[a-z0-9])?)*$")
+_PORT = re.compile(r"^[0-9]{1,5}$")
+# Control characters, which browsers strip or mangle, and backslashes,
+# which browsers treat as slashes
+_UNSAFE = re.compile(r"[\x00-\x1f\x7f\\]")
+
+# Key in a trie node that marks the end of an entry
+_END = None
+
+class _PathIndex:
+    """
+    A character trie of path prefixes. Finding whether a path starts with
+    any of the prefixes takes one step per character of the path. Prefixes
+    match whole path segments, so /app allows /app and /app/x, but not
+    /application.
+    """
+    def __init__(self):
+        self.root = {}
+        self.allow_all = False
+
+    def add(self, prefix):
+        if not prefix:
+            self.allow_all = True
+            return
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[_END] = True
+
+    def matches(self, path):
+        if self.allow_all:
+            return True
+        node = self.root
+        last = len(path) - 1
+        for position, char in enumerate(path):
+            node = node.get(char)
+            if node is None:
+                return False
+            if _END in node and (char == '/' or position == last or
+                                 path[position + 1] == '/'):
+                return True
+        return False
+
+class RedirectPolicy:
+    """
+    An allow list of redirect locations, compiled so that checking a
+    location costs time proportional to its length, however many entries
+    the allow list has.
+
+    Entries have one of these forms:
+        - C{example.com}: any path on exactly that host
+        - C{.example.com}: any path on that host or any of its subdomains
+        - C{example.com/app/}: paths on the host starting with /app/. A
+          leading dot can be combined with a path.
+        - C{/account/}: relative locations starting with /account/
+
+    Hosts are kept in a trie of their labels, last label first, so that
+    subdomain entries are found while walking the labels of the location's
+    host. Paths are kept in a character trie for each host.
+    """
+    def __init__(self, entries, schemes=('http', 'https')):
+        """
+        @param entries: the allowed locations, in the forms listed above
+        @param schemes: the URL schemes allowed in absolute locations
+        """
+        self.schemes = frozenset([scheme.lower() for scheme in schemes])
+        self.hosts = {}
+        self.relative = _PathIndex()
+        self.has_relative = False
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        entry = entry.strip()
+        if entry.startswith('/'):
+            self.relative.add(entry)
+            self.has_relative = True
+            return
+
+        subdomains = entry.startswith('.')
+        if subdomains:
+            entry = entry[1:]
+        host, slash, path = entry.partition('/')
+        host = self._normalize_host(host)
+        if host is None:
+            raise ValueError("Invalid host in redirect allow list entry: %r" % entry)
+
+        node = self.hosts
+        for label in reversed(host.split('.')):
+            node = node.setdefault(label, {})
+        if subdomains:
+            key = 'subdomains'
+        else:
+            key = 'exact'
+        index = node.get((_END, key))
+        if index is None:
+            index = _PathIndex()
+            node[(_END, key)] = index
+        index.add(slash + path)
+
+    def is_allowed(self, location):
+        """
+        Returns True if the canonicalized location is allowed.
+        """
+        if _UNSAFE.search(location) or location != location.strip():
+            return False
+        try:
+            parts = urlsplit(location)
+        except ValueError:
+            return False
+
+        path = parts.path
+        if '..' in path.split('/'):
+            return False
+        # Browsers resolve "///host" and "/\host" to another host, while
+        # urlsplit sees a path. Backslashes are refused above as unsafe.
+        if location.startswith('//') or path.startswith('//'):
+            return False
+
+        if not parts.netloc:
+            # Relative location. "host/path" without a leading slash is not
+            # a relative location that a browser would resolve predictably.
+            if parts.scheme or not path.startswith('/'):
+                return False
+            return self.has_relative and self.relative.matches(path)
+
+        if parts.scheme.lower() not in self.schemes:
+            return False
+        if '@' in parts.netloc:
+            return False
+        host, colon, port = parts.netloc.partition(':')
+        if colon and not _PORT.match(port):
+            return False
+        host = self._normalize_host(host)
+        if host is None:
+            return False
+
+        if not path:
+            path = '/'
+        labels = host.split('.')
+        node = self.hosts
+        for position in range(len(labels) - 1, -1, -1):
+            node = node.get(labels[position])
+            if node is None:
+                return False
+            # Subdomain entries match hosts with labels left over
+            index = node.get((_END, 'subdomains'))
+            if index is not None and index.matches(path):
+                return True
+        index = node.get((_END, 'exact'))
+        return index is not None and index.matches(path)
+
+    def _normalize_host(self, host):
+        host = host.lower()
+        if host.endswith('.'):
+            host = host[:-1]
+        if not _HOST.match(host):
+            return None
+        return host
+
+class RedirectValidationRule(BaseValidationRule):
+    """
+    This validator canonicalizes a redirect location once and checks it
+    against a L{RedirectPolicy}.
+    """
+    def __init__(self, type_name, encoder, policy):
+        self.max_length = None
+        self.policy = policy
+
+        BaseValidationRule.__init__(self, type_name, encoder)
+
+    def set_maximum_length(self, length):
+        self.max_length = length
+
+    @instrumented
+    def get_valid(self, context, input_, error_list=None):
+        try:
+            # check null
+            if input_ is None or len(input_) == 0:
+                if self.allow_none:
+                    return None
+                raise ValidationException(
+                   _("%(context)s: Input redirect location required") %
+                   {'context' : context},
+                   _("Input redirect location required: context=%(context)s, input=%(input)s") %
+                   {'context' : context,
+                    'input' : input_},
+                   context )
+
+            # check length
+            if self.max_length is not None and len(input_) > self.max_length:
+                raise ValidationException(
+                   _("%(context)s: Invalid redirect location. The maximum length of %(max_length)s characters was exceeded") %
+                   {'context' : context,
+                    'max_length' : self.max_length},
+                   _("Redirect location exceeds maximum allowed length of %(max_length)s: context=%(context)s, input=%(input)s") %
+                   {'context' : context,
+                    'max_length' : self.max_length,
+                    'input' : input_},
+                   context )
+
+            # canonicalize
+            try:
+                canonical = self.encoder.canonicalize( input_ )
+            except EncodingException, extra:
+                raise ValidationException(
+                   _("%(context)s: Invalid redirect location. Encoding problem detected.") %
+                   {'context' : context},
+                   _("Error canonicalizing user input"),
+                   extra,
+                   context )
+
+            if not self.policy.is_allowed(canonical):
+                raise ValidationException(
+                   _("%(context)s: Invalid redirect location") %
+                   {'context' : context},
+                   _("Redirect location is not in the allow list: context=%(context)s, input=%(input)s") %
+                   {'context' : context,
+                    'input' : input_},
+                   context )
+            return canonical
+
+        except ValidationException, extra:
+            if error_list is not None:
+                error_list[context] = extra
+            else:
+                raise
+
+        return None
@@ -20,8 +20,12 @@ import re
 
 from esapi.translation import _
 from esapi.reference.validation.base_validation_rule import BaseValidationRule
+from esapi.reference.validation.validation_metrics import instrumented
+
+from esapi.reference.validation.pattern_matcher import get_pattern_matcher, PatternTimeoutError
 
 from esapi.exceptions import ValidationException
+from esapi.exceptions import ValidationAvailabilityException
 from esapi.exceptions import EncodingException
 
 from esapi.conf.constants import MAX_INTEGER, MIN_INTEGER
@@ -67,6 +71,27 @@ class StringValidationRule(BaseValidationRule):
     def set_maximum_length(self, length):
         self.max_length = length
         
+    def match(self, context, pattern, canonical):
+        """
+        Matches a pattern using the shared PatternMatcher, which enforces the
+        configured time budget.
+        
+        @raises ValidationAvailabilityException: if the match took too long
+        """
+        try:
+            return get_pattern_matcher().match(pattern, canonical)
+        except PatternTimeoutError, extra:
+            raise ValidationAvailabilityException(
+                _("%(context)s: Invalid input. Validation took too long.") %
+                { 'context' : context, },
+                _("Pattern match exceeded its time budget: context=%(context)s, type=%(type)s, pattern=%(pattern)s") %
+                { 'context' : context,
+                  'type' : self.get_type_name(),
+                  'pattern' : pattern.pattern, },
+                extra,
+                context )
+        
+    @instrumented
     def get_valid(self, context, input_, error_list=None):
         try:
             # check none
@@ -121,7 +146,7 @@ class StringValidationRule(BaseValidationRule):
                 
             # check whitelist patterns
             for pattern in self.whitelist_patterns:
-                if not pattern.match(canonical):
+                if not self.match(context, pattern, canonical):
                     raise ValidationException(
                         _("%(context)s: Invalid input. Please conform to regex %(regex)s%(optional)s") %
                         { 'context' : context,
@@ -136,7 +161,7 @@ class StringValidationRule(BaseValidationRule):
                           
             # check blacklist patterns
             for pattern in self.blacklist_patterns:
-                if pattern.match(canonical):
+                if self.match(context, pattern, canonical):
                     raise ValidationException(
                         _("%(context)s: Invalid input. Dangerous input matching %(pattern)s detected.") %
                         { 'context' : context,
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: Validates independent fields in parallel on a shared thread pool.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from esapi.core import ESAPI
+from esapi.translation import _
+
+from esapi.exceptions import ValidationException
+
+# Whether the current thread is running a validation of a batch
+_local = threading.local()
+
+def _run_task(function, context, args, kwargs):
+    """
+    Runs in a pool thread. Returns the result or the ValidationException,
+    and the time taken.
+    """
+    in_batch = getattr(_local, 'in_batch', False)
+    _local.in_batch = True
+    start = time.time()
+    try:
+        try:
+            result = function(context, *args, **kwargs)
+        except ValidationException, extra:
+            result = extra
+    finally:
+        _local.in_batch = in_batch
+    return result, time.time() - start
+
+class ValidationBatch:
+    """
+    Collects the validations of independent fields, such as those of a
+    large multi-part form, and runs them together on a shared, bounded
+    thread pool. Expensive validations, such as directory paths that touch
+    the filesystem or large text bodies, then overlap instead of running
+    one after the other.
+
+    Any function that takes the context as its first argument and raises
+    ValidationException can be added, including the get_valid methods of
+    the Validator and of validation rules::
+
+        batch = ValidationBatch(errors)
+        batch.add("name", validator.get_valid_input, name, "AccountName", 20, False)
+        batch.add("dir", validator.get_valid_directory_path, path, parent, False)
+        results = batch.run()
+
+    The size of the pool is Validation_BatchThreads in ESAPI.conf.settings.
+    With a size of zero, fields are validated in the calling thread. So are
+    the fields of a batch run from within the validation of another batch,
+    which could otherwise wait forever on a pool whose threads are all
+    waiting for it.
+    Threads rather than processes are used, because validators and rules
+    hold encoders and compiled patterns that cannot be sent to another
+    process.
+    """
+    def __init__(self, error_list=None, pool=None):
+        """
+        @param error_list: If error_list exists, the errors of all fields are
+            stored in it by context. Otherwise, run() raises the error of the
+            first failed field, in the order they were added.
+        @param pool: the ThreadPool to run on. Defaults to the shared pool.
+        """
+        self.error_list = error_list
+        self.pool = pool
+        self.tasks = []
+        self.contexts = set()
+        self.timings = {}
+
+    def add(self, context, function, *args, **kwargs):
+        """
+        Adds the validation function(context, *args, **kwargs) to the batch.
+        """
+        if context in self.contexts:
+            raise RuntimeError(_("Context %(context)s already exists, must be unique") %
+                {'context' : context})
+        self.contexts.add(context)
+        self.tasks.append((context, function, args, kwargs))
+
+    def run(self):
+        """
+        Runs every validation in the batch and waits for all of them.
+
+        @return: a dictionary of the validated value of each field by
+            context. The value of a field that failed validation is None.
+        """
+        pool = self.pool
+        if pool is None:
+            pool = get_validation_pool()
+
+        if pool is None or getattr(_local, 'in_batch', False):
+            outcomes = [_run_task(function, context, args, kwargs)
+                for context, function, args, kwargs in self.tasks]
+        else:
+            pending = [pool.apply_async(_run_task, (function, context, args, kwargs))
+                for context, function, args, kwargs in self.tasks]
+            outcomes = [result.get() for result in pending]
+
+        # Merge in the order the fields were added, so errors are reported
+        # the same way whichever thread finished first
+        results = {}
+        first_error = None
+        for (context, function, args, kwargs), (result, elapsed) in zip(self.tasks, outcomes):
+            self.timings[context] = elapsed
+            if isinstance(result, ValidationException):
+                results[context] = None
+                if self.error_list is not None:
+                    self.error_list[context] = result
+                elif first_error is None:
+                    first_error = result
+            else:
+                results[context] = result
+        self.tasks = []
+
+        if first_error is not None:
+            raise first_error
+        return results
+
+    def get_timings(self):
+        """
+        Returns a list of (context, seconds) for every field validated so
+        far, slowest first.
+        """
+        timings = self.timings.items()
+        timings.sort(key=lambda item: item[1], reverse=True)
+        return timings
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_validation_pool():
+    """
+    Returns the ThreadPool shared by all ValidationBatches, or None if
+    Validation_BatchThreads is zero.
+    """
+    global _pool
+    if _pool is None:
+        _pool_lock.acquire()
+        try:
+            if _pool is None:
+                threads = ESAPI.security_configuration().get_validation_batch_threads()
+                if threads <= 0:
+                    return None
+                _pool = ThreadPool(threads)
+        finally:
+            _pool_lock.release()
+    return _pool
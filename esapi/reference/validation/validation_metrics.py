@@ -0,0 +1,230 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: Counters and latency histograms of validation, by type and context.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import inspect
+import re
+import threading
+import time
+from bisect import bisect_left
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from esapi.exceptions import ValidationException
+from esapi.exceptions import EncodingException
+from esapi.exceptions import IntrusionException
+
+# Upper bounds of the latency histogram buckets, in seconds. The last bucket
+# counts everything slower.
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01,
+                   0.05, 0.1, 0.5, 1.0)
+
+# Contexts beyond this many are counted together under OTHER_CONTEXT, so
+# that input-derived context names cannot grow the registry without bound
+MAX_CONTEXTS = 1000
+OTHER_CONTEXT = '(other)'
+
+# validate_many names each input "context[index]"; they are counted together
+_INDEX_SUFFIX = re.compile(r"\[\d+\]$")
+
+class ValidationStatistics:
+    """
+    Counters and a latency histogram for one validation type or context.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.passes = 0
+        self.failures = 0
+        self.encoding_failures = 0
+        self.total_time = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, elapsed, outcome):
+        self.calls += 1
+        if outcome == 'pass':
+            self.passes += 1
+        else:
+            self.failures += 1
+            if outcome == 'encoding':
+                self.encoding_failures += 1
+        self.total_time += elapsed
+        self.histogram[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def to_dict(self):
+        buckets = []
+        for bound, count in zip(LATENCY_BUCKETS + (None,), self.histogram):
+            buckets.append({'le' : bound, 'count' : count})
+        return {
+            'calls' : self.calls,
+            'passes' : self.passes,
+            'failures' : self.failures,
+            'encoding_failures' : self.encoding_failures,
+            'total_time' : self.total_time,
+            'latency' : buckets,
+            }
+
+class ValidationMetrics:
+    """
+    An in-process registry of validation statistics by type name and by
+    context. Use snapshot() to scrape it, or to_json() to dump it.
+    """
+    def __init__(self):
+        self._types = {}
+        self._contexts = {}
+        self._lock = threading.Lock()
+
+    def record(self, type_name, context, elapsed, outcome):
+        """
+        Records one validation.
+
+        @param outcome: 'pass', 'fail', or 'encoding' for a rejection caused
+            by canonicalization
+        """
+        if context is not None:
+            if not isinstance(context, basestring):
+                context = unicode(context)
+            context = _INDEX_SUFFIX.sub('', context)
+        self._lock.acquire()
+        try:
+            stats = self._types.get(type_name)
+            if stats is None:
+                stats = self._types[type_name] = ValidationStatistics()
+            stats.add(elapsed, outcome)
+
+            stats = self._contexts.get(context)
+            if stats is None:
+                if len(self._contexts) >= MAX_CONTEXTS:
+                    context = OTHER_CONTEXT
+                    stats = self._contexts.get(context)
+                if stats is None:
+                    stats = self._contexts[context] = ValidationStatistics()
+            stats.add(elapsed, outcome)
+        finally:
+            self._lock.release()
+
+    def snapshot(self):
+        """
+        Returns a dictionary with the statistics of every type and context.
+        """
+        self._lock.acquire()
+        try:
+            types = dict([(key, stats.to_dict()) for key, stats in self._types.items()])
+            contexts = dict([(key, stats.to_dict()) for key, stats in self._contexts.items()])
+        finally:
+            self._lock.release()
+        return {'types' : types, 'contexts' : contexts}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), sort_keys=True)
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._types.clear()
+            self._contexts.clear()
+        finally:
+            self._lock.release()
+
+_metrics = None
+
+def get_metrics():
+    """
+    Returns the shared ValidationMetrics, or None if metrics are disabled.
+    """
+    return _metrics
+
+def enable_metrics():
+    """
+    Starts recording validation metrics, and returns the registry.
+    """
+    global _metrics
+    if _metrics is None:
+        _metrics = ValidationMetrics()
+    return _metrics
+
+def disable_metrics():
+    global _metrics
+    _metrics = None
+
+def _outcome(extra):
+    if isinstance(extra, IntrusionException):
+        return 'encoding'
+    if isinstance(extra.get_cause(), (EncodingException, IntrusionException)):
+        return 'encoding'
+    return 'fail'
+
+def instrumented(get_valid):
+    """
+    Decorates the get_valid method of a validation rule to record metrics
+    under the rule's type name. When metrics are disabled, the only cost is
+    one global lookup.
+    """
+    def wrapper(self, context, input_, error_list=None):
+        metrics = _metrics
+        if metrics is None:
+            return get_valid(self, context, input_, error_list)
+        return _measure(metrics, self.get_type_name(), context, error_list,
+            get_valid, (self, context, input_, error_list), {})
+    wrapper.__name__ = get_valid.__name__
+    wrapper.__doc__ = get_valid.__doc__
+    return wrapper
+
+def instrumented_as(type_name):
+    """
+    Like instrumented, for the get_valid_* methods of a Validator, which take
+    other arguments than a rule's get_valid. Metrics are recorded under
+    type_name, and the error list is the method's errors or error_list
+    argument.
+    """
+    def decorator(get_valid):
+        names = inspect.getargspec(get_valid)[0][1:]
+        error_list_name = [name for name in names if name in ('errors', 'error_list')][0]
+        error_list_index = names.index(error_list_name)
+        def wrapper(self, context, *args, **kwargs):
+            metrics = _metrics
+            if metrics is None:
+                return get_valid(self, context, *args, **kwargs)
+            if len(args) >= error_list_index:
+                error_list = args[error_list_index - 1]
+            else:
+                error_list = kwargs.get(error_list_name)
+            return _measure(metrics, type_name, context, error_list,
+                get_valid, (self, context) + args, kwargs)
+        wrapper.__name__ = get_valid.__name__
+        wrapper.__doc__ = get_valid.__doc__
+        return wrapper
+    return decorator
+
+def _measure(metrics, type_name, context, error_list, get_valid, args, kwargs):
+    # With an error list, a failure shows up as a new entry in it
+    had_error = error_list is not None and context in error_list
+    start = time.time()
+    try:
+        result = get_valid(*args, **kwargs)
+    except (ValidationException, IntrusionException), extra:
+        metrics.record(type_name, context, time.time() - start, _outcome(extra))
+        raise
+    elapsed = time.time() - start
+    if not had_error and error_list is not None and context in error_list:
+        outcome = _outcome(error_list[context])
+    else:
+        outcome = 'pass'
+    metrics.record(type_name, context, elapsed, outcome)
+    return result
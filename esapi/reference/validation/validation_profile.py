@@ -0,0 +1,213 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: The Validator_ patterns of the settings, compiled and checked once
+    at startup.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import os
+import pickle
+import re
+import tempfile
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from esapi.translation import _
+from esapi.reference.validation.pattern_analyzer import analyze_pattern
+
+# Prefix of the settings that hold validation patterns
+PREFIX = "Validator_"
+
+# Bumped whenever the layout of the cache file changes
+CACHE_FORMAT = 1
+
+def get_pattern_sources(settings):
+    """
+    Returns a dictionary of the source of every Validator_ pattern in the
+    settings module, by name without the prefix.
+    """
+    sources = {}
+    for option in dir(settings):
+        if option.startswith(PREFIX):
+            sources[option[len(PREFIX):]] = getattr(settings, option)
+    return sources
+
+def get_fingerprint(sources):
+    """
+    Returns a digest of the pattern sources, used to tell whether a cached
+    profile still matches the settings.
+    """
+    digest = sha1()
+    for name in sorted(sources.keys()):
+        digest.update(repr((name, sources[name])))
+    return digest.hexdigest()
+
+def _restore(sources, warnings, errors):
+    """
+    Rebuilds a pickled profile without analyzing the patterns again.
+    """
+    return ValidationProfile(sources, warnings, errors)
+
+class ValidationProfile(object):
+    """
+    An immutable table of compiled validation patterns, built once from
+    the Validator_ entries of the settings. Every pattern is compiled and
+    analyzed for catastrophic backtracking when the profile is built, so
+    looking up a pattern while validating is a single dictionary lookup.
+
+    Build the profile before a server forks its workers, and the workers
+    share it instead of each compiling the patterns again. A profile can
+    also be pickled to a cache file with save(); load_profile() reuses
+    the file for as long as the patterns in the settings are unchanged.
+    Python cannot serialize compiled patterns, so unpickling compiles every
+    pattern again; only the analysis is skipped.
+    """
+    __slots__ = ('_sources', '_patterns', '_warnings', '_errors', 'fingerprint')
+
+    def __init__(self, sources, warnings=None, errors=None):
+        """
+        @param sources: a dictionary of pattern sources by name
+        @param warnings: the analysis warnings of each pattern by name, if
+            they are already known. The patterns are analyzed otherwise.
+        @param errors: the compile error of each invalid pattern by name.
+            Only used along with warnings.
+        """
+        patterns = {}
+        analyze = warnings is None
+        if analyze:
+            warnings = {}
+            errors = {}
+        for name, source in sources.items():
+            if name in errors:
+                continue
+            try:
+                patterns[name] = re.compile(source)
+            except Exception, extra:
+                errors[name] = str(extra)
+                continue
+            if analyze:
+                # A pattern the analyzer cannot handle is still usable
+                try:
+                    found = analyze_pattern(source)
+                except Exception, extra:
+                    found = [_("Pattern could not be analyzed: %(error)s") %
+                        {'error' : extra}]
+                if found:
+                    warnings[name] = tuple(found)
+
+        object.__setattr__(self, '_sources', dict(sources))
+        object.__setattr__(self, '_patterns', patterns)
+        object.__setattr__(self, '_warnings', dict(warnings))
+        object.__setattr__(self, '_errors', dict(errors))
+        object.__setattr__(self, 'fingerprint', get_fingerprint(sources))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ValidationProfile is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("ValidationProfile is immutable")
+
+    def __reduce__(self):
+        return (_restore, (self._sources, self._warnings, self._errors))
+
+    def __contains__(self, name):
+        return name in self._sources
+
+    def __len__(self):
+        return len(self._sources)
+
+    def get_pattern(self, name):
+        """
+        Returns the compiled pattern, or None if it does not exist or is
+        not a valid regular expression.
+        """
+        return self._patterns.get(name)
+
+    def get_names(self):
+        return sorted(self._sources.keys())
+
+    def get_warnings(self):
+        """
+        Returns a dictionary of the patterns that may backtrack
+        exponentially, each mapped to a tuple of descriptions.
+        """
+        return dict(self._warnings)
+
+    def get_errors(self):
+        """
+        Returns a dictionary of the patterns that do not compile, each mapped
+        to the error message.
+        """
+        return dict(self._errors)
+
+    def save(self, filename):
+        """
+        Pickles the profile to a cache file. The file is replaced atomically,
+        so workers starting at the same time never read a partial file.
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        handle, temp_name = tempfile.mkstemp(dir=directory)
+        try:
+            stream = os.fdopen(handle, 'wb')
+            try:
+                pickle.dump((CACHE_FORMAT, self.fingerprint, self), stream,
+                    pickle.HIGHEST_PROTOCOL)
+            finally:
+                stream.close()
+            os.rename(temp_name, filename)
+        except:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+
+def load_profile(settings, cache_filename=None):
+    """
+    Returns the ValidationProfile of the settings module.
+
+    @param cache_filename: a file the profile is pickled to. If it holds a
+        profile of the same patterns, that profile is returned, with its
+        patterns compiled again but not analyzed. Otherwise a new profile
+        is built and saved to it. The file must only be writable by the
+        application, since unpickling runs code.
+    """
+    sources = get_pattern_sources(settings)
+    if cache_filename is None:
+        return ValidationProfile(sources)
+
+    try:
+        stream = open(cache_filename, 'rb')
+        try:
+            format_, fingerprint, profile = pickle.load(stream)
+        finally:
+            stream.close()
+        if (format_ == CACHE_FORMAT and
+            fingerprint == get_fingerprint(sources) and
+            isinstance(profile, ValidationProfile)):
+            return profile
+    except Exception:
+        # Missing or damaged, and a damaged pickle can raise nearly anything.
+        # It is rebuilt below.
+        pass
+
+    profile = ValidationProfile(sources)
+    try:
+        profile.save(cache_filename)
+    except (IOError, OSError):
+        # A read-only location only costs the compilation next time
+        pass
+    return profile
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@license: OWASP Enterprise Security API (ESAPI)
+
+    This file is part of the Open Web Application Security Project (OWASP)
+    Enterprise Security API (ESAPI) project. For details, please see
+    U{http://www.owasp.org/index.php/ESAPI<http://www.owasp.org/index.php/ESAPI>}.
+
+    The ESAPI is published by OWASP under the BSD license. You should read and
+    accept the LICENSE before you use, modify, and/or redistribute this software.
+
+@summary: Shared validators for special kinds of input, such as file paths,
+    built once on first use.
+@copyright: Copyright (c) 2009 - The OWASP Foundation
+@author: Craig Younkins (craig.younkins@owasp.org)
+"""
+
+import threading
+
+from esapi.translation import _
+
+class ValidatorRegistry:
+    """
+    Holds validators that are set up for one kind of input, such as a
+    validator whose encoder only decodes the encodings found in file
+    paths. Each is built by its factory the first time it is asked for,
+    and shared after that.
+
+    Looking up a validator that is already built is a dictionary lookup
+    without locking. Building one holds a lock, so threads that ask for
+    the same validator at the same time get the same instance. The lock is
+    reentrant, so a factory may itself look up other validators.
+    """
+    def __init__(self):
+        self._factories = {}
+        self._validators = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, factory):
+        """
+        Registers factory(), which returns a Validator, under name. A
+        validator already built under that name is replaced the next time
+        it is asked for.
+        """
+        self._lock.acquire()
+        try:
+            self._factories[name] = factory
+            self._validators.pop(name, None)
+        finally:
+            self._lock.release()
+
+    def get(self, name):
+        """
+        Returns the validator registered under name, building it if needed.
+
+        @raises KeyError: if no factory is registered under name
+        """
+        validator = self._validators.get(name)
+        if validator is not None:
+            return validator
+
+        self._lock.acquire()
+        try:
+            validator = self._validators.get(name)
+            if validator is None:
+                try:
+                    factory = self._factories[name]
+                except KeyError:
+                    raise KeyError(_("No validator is registered as %(name)s") %
+                        {'name' : name})
+                validator = factory()
+                self._validators[name] = validator
+            return validator
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """
+        Forgets the validators built so far. They are built again the next
+        time they are asked for.
+        """
+        self._lock.acquire()
+        try:
+            self._validators.clear()
+        finally:
+            self._lock.release()
+
+_registry = ValidatorRegistry()
+
+def get_validator(name):
+    """
+    Returns the shared validator registered under name.
+    """
+    return _registry.get(name)
+
+def register_validator(name, factory):
+    _registry.register(name, factory)
+
+def get_registry():
+    return _registry
@@ -204,6 +204,111 @@ class SecurityConfiguration:
         """
         raise NotImplementedError()
         
+    def get_password_policy(self):
+        """
+        Gets the rules that new passwords must pass, as a sequence of
+        (name, parameters) pairs.
+        
+        @return: the password policy rules
+        """
+        raise NotImplementedError()
+        
+    def get_breach_filter_false_positive_rate(self):
+        """
+        Gets the share of passwords that a Bloom filter of breached 
+        passwords is built to wrongly reject.
+        
+        @return: the false positive rate, between 0 and 1
+        """
+        raise NotImplementedError()
+        
+    def get_password_hash_algorithm(self):
+        """
+        Gets the name of the algorithm used to hash passwords, such as
+        'pbkdf2' or 'scrypt'.
+        
+        @return: the password hashing algorithm
+        """
+        raise NotImplementedError()
+        
+    def get_password_hash_parameters(self):
+        """
+        Gets the parameters of the password hashing algorithm, as a 
+        dictionary of keyword arguments for its hasher.
+        
+        @return: the password hashing parameters
+        """
+        raise NotImplementedError()
+        
+    def get_hashing_processes(self):
+        """
+        Gets the number of worker processes that hash passwords, or 0 to
+        hash them in the calling thread.
+        
+        @return: the number of password hashing processes
+        """
+        raise NotImplementedError()
+        
+    def get_hashing_max_pending(self):
+        """
+        Gets the most password hashes that may wait or run at once before
+        further logins are rejected as unavailable.
+        
+        @return: the password hashing queue limit
+        """
+        raise NotImplementedError()
+        
+    def get_hashing_timeout(self):
+        """
+        Gets the longest time, as a timedelta, to wait for a password hash.
+        
+        @return: the password hashing timeout, or None to wait indefinitely
+        """
+        raise NotImplementedError()
+        
+    def get_verification_cache_ttl(self):
+        """
+        Gets how long, as a timedelta, a successful password verification is
+        remembered.
+        
+        @return: the time to live of remembered verifications
+        """
+        raise NotImplementedError()
+        
+    def get_verification_cache_size(self):
+        """
+        Gets the most password verifications remembered at once.
+        
+        @return: the size of the verification cache
+        """
+        raise NotImplementedError()
+        
+    def get_user_flush_interval(self):
+        """
+        Gets the longest time, as a timedelta, that the Authenticator may
+        keep changes to a user before writing them to storage.
+        
+        @return: the flush interval for changed users
+        """
+        raise NotImplementedError()
+        
+    def get_user_cache_size(self):
+        """
+        Gets the number of users the Authenticator keeps in memory.
+        
+        @return: the maximum number of cached users
+        """
+        raise NotImplementedError()
+        
+    def get_user_cache_ttl(self):
+        """
+        Gets how long, as a timedelta, the Authenticator keeps a user in
+        memory before reading it from storage again.
+        
+        @return: the time to live of cached users, or None for no limit
+        """
+        raise NotImplementedError()
+        
     # Encryption
     def get_encryption_keys_location(self):
         """
@@ -398,3 +503,84 @@ class SecurityConfiguration:
         Returns the validation pattern for a particular type.
         """
         raise NotImplementedError()
+        
+    def get_validation_profile(self):
+        """
+        Returns the ValidationProfile holding every validation pattern,
+        compiled when the configuration was loaded.
+        """
+        raise NotImplementedError()
+        
+    def get_validation_pattern_engine(self):
+        """
+        Returns the name of the engine used to match validation patterns
+        against input. See PatternMatcher.ENGINES for the choices.
+        """
+        raise NotImplementedError()
+        
+    def get_validation_pattern_timeout(self):
+        """
+        Returns the time budget of a single validation pattern match, as a
+        timedelta.
+        """
+        raise NotImplementedError()
+
+    def get_validation_pattern_processes(self):
+        """
+        Returns the number of worker processes of the 'process' pattern
+        engine.
+        """
+        raise NotImplementedError()
+
+    def get_validation_directory_cache_ttl(self):
+        """
+        Returns how long a validated directory path is cached, as a
+        timedelta.
+        """
+        raise NotImplementedError()
+
+    def get_validation_batch_threads(self):
+        """
+        Returns the number of threads used to validate the fields of a 
+        ValidationBatch in parallel.
+        """
+        raise NotImplementedError()
+
+    def get_validation_redirect_allow_list(self):
+        """
+        Returns the list of hosts and paths that redirects may go to. See
+        RedirectPolicy for the format of the entries.
+        """
+        raise NotImplementedError()
+
+    def get_validation_metrics_enabled(self):
+        """
+        Returns True if validation rules should record metrics.
+        """
+        raise NotImplementedError()
+
+    def get_validation_profile_cache_file(self):
+        """
+        Returns the file the analyzed validation patterns are cached in, or
+        None.
+        """
+        raise NotImplementedError()
+
+    def get_validation_async_max_pending(self):
+        """
+        Returns the most checks an AsyncValidator lets wait for or run on
+        its executor.
+        """
+        raise NotImplementedError()
+
+    def get_validation_json_max_depth(self):
+        """
+        Returns the deepest nesting allowed in a validated JSON body.
+        """
+        raise NotImplementedError()
+
+    def get_validation_json_max_keys(self):
+        """
+        Returns the most keys allowed in one object of a validated JSON body.
+        """
+        raise NotImplementedError()
@@ -25,17 +25,65 @@ import esapi.test.conf
 import unittest
 import os
 import os.path
+import shutil
+import tempfile
+import threading
+import hashlib
+import inspect
+import gc
+import time
 from datetime import datetime, timedelta
 from Cookie import Morsel
+from StringIO import StringIO
 
 from esapi.core import ESAPI
-from esapi.exceptions import AuthenticationException
+from esapi.reference.shelve_authenticator import ShelveAuthenticator
+from esapi.reference.sqlite_authenticator import SQLiteAuthenticator
+from esapi.reference.user_cache import UserCache
+from esapi.reference import password_hashing
+from esapi.reference.password_hashing_pool import PasswordHashingPool
+from esapi.reference.user_credentials import VerificationCache
+from esapi.reference import bulk_users
+from esapi.reference import password_policy
+from esapi.reference import bloom_filter
+from esapi.exceptions import AuthenticationException, AuthenticationAccountsException, AvailabilityException, ConfigurationException, EncryptionException
 from esapi.http_utilities import HTTPUtilities
 from esapi.test.http.mock_http_request import MockHttpRequest
 from esapi.test.http.mock_http_response import MockHttpResponse
 
 # A test should be added to test the thread safety
 
+class SleepingPasswordHasher(password_hashing.PasswordHasher):
+    """
+    Takes delay seconds for each hash, for the hashing pool tests.
+    """
+    def __init__(self, delay):
+        self.delay = delay
+        
+    def hash(self, password, account_name, salt=None):
+        time.sleep(self.delay)
+        return "$sleep$%s" % password
+        
+class SleepingPasswordHasher(password_hashing.PasswordHasher):
+    """
+    Takes delay seconds for each hash, for the hashing pool tests.
+    """
+    def __init__(self, delay):
+        self.delay = delay
+        
+    def hash(self, password, account_name, salt=None):
+        time.sleep(self.delay)
+        return "$sleep$%s" % password
+
+class FailingPasswordHasher(password_hashing.PasswordHasher):
+    """
+    Fails to hash the password "failfailfail1234", for the bulk import test.
+    """
+    def hash(self, password, account_name, salt=None):
+        if password == "failfailfail1234":
+            raise EncryptionException("Hash failed", "Hash failed")
+        return password_hashing.get_password_hasher().hash(password, account_name, salt)
+
 class ValidatorTest(unittest.TestCase):
     def __init__(self, test_name=""):
         unittest.TestCase.__init__(self, test_name)
@@ -131,6 +179,111 @@ class ValidatorTest(unittest.TestCase):
         instance.verify_password_strength("super calif ragil istic")
         instance.verify_password_strength("TONYTONYTONYTONY")
         instance.verify_password_strength(instance.generate_strong_password())
+        
+    def test_password_policy(self):
+        self.assertEquals(0, password_policy.count_character_classes(""))
+        # The confusing characters are in no class
+        self.assertEquals(0, password_policy.count_character_classes("0o1l"))
+        self.assertEquals(1, password_policy.count_character_classes("abc0"))
+        self.assertEquals(4, password_policy.count_character_classes(u"aB3!aB3!"))
+        self.assertEquals(set(["abc", "bcd"]), password_policy.substrings("abcd", 3))
+        
+        policy = password_policy.get_password_policy([
+            ('length', {'min_length' : 8, 'max_length' : 12}),
+            ('character_classes', {'min_classes' : 3}),
+            ('old_password', {'length' : 4}),
+            ('breach_list', {'hashes' : frozenset([hashlib.sha1("Passw0rd!").hexdigest().upper()])}),
+            ])
+        policy.check("aB3!aB3!")
+        self.assertTrue(policy.is_valid("aB3!aB3!"))
+        self.assertFalse(policy.is_valid("aB3!"))
+        policy.check("aB3!aB3!", "xyzaB3x")
+        # Long passwords are compared as sets of pieces
+        self.assertRaises(AuthenticationException, policy.check, "aB3!aB3!", "x" * 300 + "3!aB")
+        self.assertEquals(None, password_policy.OldPasswordRule(4).get_failure("aB3!" * 100, "x" * 300))
+        for password, old_password in (("aB3!", None), ("aB3!aB3!aB3!a", None),
+            ("abcdefgh", None), ("aB3!aB3!", "xaB3!"), ("Passw0rd!", None)):
+            self.assertRaises(AuthenticationException, policy.check, password, old_password)
+        
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "breached.txt")
+            breach_file = open(filename, "w")
+            breach_file.write("%s:42\n" % hashlib.sha1("hunter2").hexdigest().lower())
+            breach_file.close()
+            rule = password_policy.BreachListRule(filename)
+            self.assertNotEquals(None, rule.get_failure("hunter2"))
+            self.assertEquals(None, rule.get_failure("hunter3"))
+        finally:
+            shutil.rmtree(directory)
+        
+        self.assertRaises(ConfigurationException, password_policy.get_password_policy,
+            [('unknown', {})])
+        
+    def test_breach_filter(self):
+        instance = ESAPI.authenticator()
+        directory = tempfile.mkdtemp()
+        try:
+            breached = ["breached%s!" % i for i in range(2000)]
+            hashes_filename = os.path.join(directory, "breached.txt")
+            hashes_file = open(hashes_filename, "w")
+            for password in breached:
+                hashes_file.write("%s:%s\n" % (hashlib.sha1(password).hexdigest().upper(), 1))
+            hashes_file.close()
+            
+            filter_filename = os.path.join(directory, "breached.bloom")
+            self.assertEquals(2000, bloom_filter.build_filter(hashes_filename, filter_filename, 0.01))
+            self.assertTrue(bloom_filter.is_bloom_filter(filter_filename))
+            self.assertFalse(bloom_filter.is_bloom_filter(hashes_filename))
+            breach_filter = bloom_filter.open_filter(filter_filename)
+            self.assertTrue(breach_filter is bloom_filter.open_filter(filter_filename))
+            for password in breached:
+                self.assertTrue(breach_filter.contains_password(password))
+                self.assertTrue(hashlib.sha1(password).hexdigest() in breach_filter)
+            false_positives = len([i for i in range(10000)
+                if breach_filter.contains_password("unbreached%s!" % i)])
+            self.assertTrue(false_positives < 300, false_positives)
+            self.assertTrue(0.005 < breach_filter.get_false_positive_rate() < 0.015)
+            
+            # New and changed passwords are checked against the filter
+            policy = instance.password_policy
+            instance.password_policy = password_policy.get_password_policy([
+                ('strength', {'min_strength' : 16}),
+                ('breach_list', {'filename' : filter_filename}),
+                ])
+            try:
+                self.assertRaises(AuthenticationException, instance.create_user,
+                    "testBreached", "breached7!", "breached7!")
+                user = instance.create_user("testBreached", "a1b2c3d4e5f6g7h8", "a1b2c3d4e5f6g7h8")
+                self.assertRaises(AuthenticationException, instance.change_password,
+                    user, "a1b2c3d4e5f6g7h8", "breached42!", "breached42!")
+            finally:
+                instance.password_policy = policy
+            
+            # A rebuilt filter is used by existing rules
+            rule = password_policy.BreachListRule(filter_filename)
+            self.assertTrue(rule.get_failure("breached7!") is not None)
+            hashes_file = open(hashes_filename, "w")
+            hashes_file.write("%s\n" % hashlib.sha1("rebuilt1!").hexdigest().upper())
+            hashes_file.close()
+            bloom_filter.build_filter(hashes_filename, filter_filename, 0.01)
+            modified = os.stat(filter_filename).st_mtime + 10
+            os.utime(filter_filename, (modified, modified))
+            self.assertTrue(rule.get_failure("rebuilt1!") is not None)
+            self.assertFalse(bloom_filter.open_filter(filter_filename) is breach_filter)
+            self.assertEquals(1, bloom_filter.open_filter(filter_filename).count)
+            
+            bad_filename = os.path.join(directory, "bad.txt")
+            bad_file = open(bad_filename, "w")
+            bad_file.write("not a hash\n")
+            bad_file.close()
+            self.assertRaises(ValueError, bloom_filter.build_filter, bad_filename, filter_filename)
+            # The failed build leaves the old filter in place
+            self.assertEquals(sorted(["bad.txt", "breached.bloom", "breached.txt"]),
+                sorted(os.listdir(directory)))
+            self.assertTrue(bloom_filter.BloomFilter(filter_filename).contains_password("rebuilt1!"))
+        finally:
+            shutil.rmtree(directory)
             
     def test_current_user(self):
         instance = ESAPI.authenticator()
@@ -162,6 +315,290 @@ class ValidatorTest(unittest.TestCase):
         self.assertTrue( instance.get_user(account_name) )
         self.assertFalse( instance.get_user("ridiculous") )
         
+    def test_get_user_by_account_id(self):
+        instance = ESAPI.authenticator()
+        password = "a1b2c3d4e5f6g7h8"
+        user = instance.create_user("testGetUserById", password, password)
+        account_id = user.account_id
+        self.assertEquals("testgetuserbyid", instance.get_user(account_id=account_id).account_name)
+        self.assertTrue(instance.exists(account_id=account_id))
+        self.assertFalse(instance.exists(account_id=account_id + 1))
+        self.assertEquals(None, instance.get_user(account_id=account_id + 1))
+        
+        # The index can be rebuilt from the users
+        instance.id_shelf.clear()
+        self.assertFalse(instance.exists(account_id=account_id))
+        instance.rebuild_account_id_index()
+        self.assertTrue(instance.exists(account_id=account_id))
+        
+        # Stale entries are dropped, and the user they named is indexed
+        other = instance.create_user("testGetUserByIdOther", password, password)
+        del instance.id_shelf[str(other.account_id)]
+        instance.id_shelf[str(account_id + 1)] = "testgetuserbyidother"
+        self.assertEquals(None, instance.get_user(account_id=account_id + 1))
+        self.assertFalse(instance.id_shelf.has_key(str(account_id + 1)))
+        self.assertTrue(instance.exists(account_id=other.account_id))
+        self.assertFalse(instance.exists(account_id=account_id + 1))
+        
+        instance.remove_user("testGetUserById")
+        self.assertFalse(instance.exists(account_id=account_id))
+        self.assertEquals(None, instance.get_user(account_id=account_id))
+        
+    def test_flush_changed_users(self):
+        instance = ESAPI.authenticator()
+        password = "a1b2c3d4e5f6g7h8"
+        user = instance.create_user("flushbob", password, password)
+        self.assertFalse(user.is_dirty())
+        self.assertTrue(user is instance.get_user("flushbob"))
+        
+        # Ordinary changes wait for the next batch
+        instance.flush()
+        user.screen_name = "Bob"
+        instance.save_user(user)
+        self.assertTrue(user.is_dirty())
+        self.assertEquals(None, instance.user_shelf["flushbob"].screen_name)
+        
+        # Locking is written at once, along with the earlier change, and
+        # the user stays cached
+        user.lock()
+        instance.save_user(user)
+        self.assertFalse(user.is_dirty())
+        stored = instance.user_shelf["flushbob"]
+        self.assertTrue(stored.is_locked())
+        self.assertEquals("Bob", stored.screen_name)
+        self.assertFalse(stored.is_dirty())
+        self.assertTrue(instance.get_user("flushbob") is user)
+        
+        # The end of the request writes the rest
+        user.screen_name = "Robert"
+        self.assertEquals(1, instance.flush())
+        self.assertEquals(0, instance.flush())
+        user.screen_name = "Bobby"
+        instance.clear_current()
+        self.assertEquals("Bobby", instance.user_shelf["flushbob"].screen_name)
+        
+        # A copy kept by a session after the cached one expired does not
+        # undo changes saved through the newer copy
+        user.unlock()
+        instance.save_user(user)
+        instance.user_cache.clear()
+        newer = instance.get_user("flushbob")
+        self.assertFalse(newer is user)
+        newer.lock()
+        instance.save_user(newer)
+        user.last_host_address = "10.1.2.3"
+        instance.save_user(user)
+        instance.flush()
+        stored = instance.user_shelf["flushbob"]
+        self.assertTrue(stored.is_locked())
+        self.assertEquals("10.1.2.3", stored.last_host_address)
+        
+    def test_user_cache(self):
+        evicted = []
+        cache = UserCache(2, on_evict=lambda name, user: evicted.append(name))
+        cache.put("a", "user a")
+        cache.put("b", "user b")
+        self.assertEquals("user a", cache.get("a"))
+        # b is now the least recently used
+        cache.put("c", "user c")
+        self.assertEquals(["b"], evicted)
+        self.assertEquals(None, cache.get("b"))
+        self.assertTrue(cache.invalidate("a"))
+        self.assertFalse(cache.invalidate("a"))
+        self.assertEquals(["b", "a"], evicted)
+        stats = cache.get_statistics()
+        self.assertEquals(1, stats['size'])
+        self.assertEquals(1, stats['hits'])
+        self.assertEquals(1, stats['misses'])
+        self.assertEquals(0.5, stats['hit_rate'])
+        self.assertEquals(1, stats['evictions'])
+        self.assertEquals(1, stats['invalidations'])
+        
+        # Users expire after the time to live
+        cache = UserCache(10, timedelta(0))
+        cache.put("a", "user a")
+        self.assertEquals(None, cache.get("a"))
+        self.assertEquals(1, cache.get_statistics()['expirations'])
+        self.assertEquals(0, len(cache))
+        
+        # The authenticator reads through the cache
+        instance = ESAPI.authenticator()
+        password = "a1b2c3d4e5f6g7h8"
+        instance.create_user("cachebob", password, password)
+        instance.user_cache.reset_statistics()
+        user = instance.get_user("cachebob")
+        self.assertTrue(user is instance.get_user("cachebob"))
+        self.assertEquals(2, instance.user_cache.get_statistics()['hits'])
+        
+        instance.remove_user("cachebob")
+        self.assertEquals(None, instance.get_user("cachebob"))
+        self.assertEquals(1, instance.user_cache.get_statistics()['invalidations'])
+        
+    def test_sqlite_authenticator(self):
+        directory = tempfile.mkdtemp()
+        try:
+            instance = SQLiteAuthenticator(os.path.join(directory, "users.db"))
+            password = "a1b2c3d4e5f6g7h8"
+            user = instance.create_user("testSQLite", password, password)
+            self.assertTrue(user is instance.get_user("TESTSQLITE"))
+            self.assertTrue(user is instance.get_user(account_id=user.account_id))
+            self.assertTrue(instance.exists("testsqlite"))
+            self.assertTrue(instance.exists(account_id=user.account_id))
+            self.assertFalse(instance.exists(account_id=user.account_id + 1))
+            self.assertTrue(instance.verify_password(user, password))
+            self.assertFalse(instance.verify_password(user, "wrong"))
+            self.assertRaises(AuthenticationException, instance.create_user, "testSQLite",
+                password, password)
+            
+            new_password = "z9y8x7w6v5u4t3s2"
+            instance.change_password(user, password, new_password, new_password)
+            self.assertTrue(instance.verify_password(user, new_password))
+            self.assertEquals(2, len(instance.get_old_password_hashes("testsqlite")))
+            
+            # Changes are written by save_user, and other threads and 
+            # processes use their own connection
+            user.screen_name = "Tester"
+            instance.save_user(user)
+            other = SQLiteAuthenticator(instance.filename)
+            found = []
+            thread = threading.Thread(target=lambda: found.append(other.get_user("testsqlite")))
+            thread.start()
+            thread.join()
+            self.assertEquals("Tester", found[0].screen_name)
+            self.assertFalse(found[0] is user)
+            
+            # Saving a user only writes its changes, and keeps a lock saved
+            # by another process
+            third = SQLiteAuthenticator(instance.filename)
+            locked = third.get_user("testsqlite")
+            locked.lock()
+            third.save_user(locked)
+            user.screen_name = "Tester2"
+            instance.save_user(user)
+            stored = SQLiteAuthenticator(instance.filename).get_user("testsqlite")
+            self.assertTrue(stored.is_locked())
+            self.assertEquals("Tester2", stored.screen_name)
+            locked.unlock()
+            third.save_user(locked)
+            third.close()
+            
+            # Changed users dropped from the cache are written by flush
+            other.close()
+            other = SQLiteAuthenticator(instance.filename)
+            changed = other.get_user("testsqlite")
+            changed.lock()
+            other.user_cache.invalidate("testsqlite")
+            del changed
+            gc.collect()
+            other.clear_current()
+            self.assertTrue(SQLiteAuthenticator(instance.filename).get_user("testsqlite").is_locked())
+            changed = other.get_user("testsqlite")
+            changed.unlock()
+            other.save_user(changed)
+            del changed
+            
+            instance.remove_user("testSQLite")
+            self.assertFalse(instance.exists("testsqlite"))
+            self.assertEquals(None, instance.get_user(account_id=user.account_id))
+            self.assertEquals([], instance.get_old_password_hashes("testsqlite"))
+            
+            # Import the users of the shelve authenticator
+            shelve_authenticator = ESAPI.authenticator()
+            shelve_authenticator.create_user("testImport", password, password)
+            shelve_authenticator.user_shelf.sync()
+            shelve_authenticator.cred_shelf.sync()
+            config = ESAPI.security_configuration()
+            self.assertEquals(1, instance.import_shelves(
+                config.get_resource_file(shelve_authenticator.USERS_FILENAME),
+                config.get_resource_file(shelve_authenticator.CREDS_FILENAME)))
+            imported = instance.get_user("testimport")
+            self.assertTrue(instance.verify_password(imported, password))
+            self.assertEquals(shelve_authenticator.get_user("testimport").account_id, imported.account_id)
+            
+            # Creating a user writes the user and its credentials together
+            self.assertRaises(AuthenticationException, instance.create_user, "testImport",
+                password, password)
+            duplicate = imported.__class__("testother", imported.account_id)
+            self.assertRaises(AuthenticationAccountsException, instance.add_user, duplicate)
+            self.assertEquals(None, instance.get_credentials("testother"))
+            
+            # No inherited method uses the storage of the ShelveAuthenticator
+            storage = set(['user_shelf', 'cred_shelf', 'id_shelf', '_pending', '_lock', '_last_flush'])
+            for name, method in inspect.getmembers(SQLiteAuthenticator, inspect.ismethod):
+                if method.im_func.func_globals is not ShelveAuthenticator.__init__.im_func.func_globals:
+                    continue
+                self.assertEquals(set(), storage & set(method.im_func.func_code.co_names), name)
+            instance.rebuild_account_id_index()
+            
+            instance.clear_all_data()
+            self.assertFalse(instance.exists("testimport"))
+            instance.close()
+            other.close()
+        finally:
+            shutil.rmtree(directory)
+        
+    def test_bulk_import_export(self):
+        instance = ESAPI.authenticator()
+        password = "a1b2c3d4e5f6g7h8"
+        user = instance.create_user("testBulk", password, password)
+        user.add_roles(["admin", "user"])
+        user.enable()
+        user.expiration_time = datetime(2030, 1, 2, 3, 4, 5)
+        instance.change_password(user, password, "z9y8x7w6v5u4t3s2", "z9y8x7w6v5u4t3s2")
+        instance.save_user(user)
+        
+        records = list(bulk_users.read_jsonl([
+            '{"account_name": "bulkOne", "password": "q1w2e3r4t5y6u7i8", "roles": ["user"], "enabled": true}',
+            '',
+            '{"account_name": "bulkTwo", "password": "p0o9i8u7y6t5r4e3", "account_id": 42}',
+            '{"account_name": "bulkone", "password": "q1w2e3r4t5y6u7i8"}',
+            '{"account_name": "bulkWeak", "password": "weak"}',
+            '{"account_name": "bulkNone"}',
+            ]))
+        progress = []
+        importer = bulk_users.BulkUserImporter(processes=2, batch_size=1, progress=progress.append)
+        report = importer.import_records(records)
+        self.assertEquals(5, report.read)
+        self.assertEquals(2, report.imported)
+        self.assertEquals([3, 4, 5], [number for number, message in report.errors])
+        self.assertEquals(2, len(progress))
+        one = instance.get_user("bulkone")
+        self.assertTrue(one.is_enabled())
+        self.assertTrue(one.is_in_role("user"))
+        self.assertTrue(instance.verify_password(one, "q1w2e3r4t5y6u7i8"))
+        self.assertEquals("bulktwo", instance.get_user(account_id=42).account_name)
+        
+        # Exported users keep their password hashes, history and settings
+        for format in ('csv', 'jsonl'):
+            stream = StringIO()
+            self.assertEquals(3, bulk_users.export_users(stream, format))
+            instance.clear_all_data()
+            stream.seek(0)
+            report = bulk_users.BulkUserImporter(processes=1).import_stream(stream, format)
+            self.assertEquals((3, []), (report.imported, report.errors))
+            copy = instance.get_user("testbulk")
+            self.assertEquals(user.account_id, copy.account_id)
+            self.assertEquals(user.roles, copy.roles)
+            self.assertTrue(copy.is_enabled())
+            self.assertEquals(user.expiration_time, copy.expiration_time)
+            self.assertTrue(instance.verify_password(copy, "z9y8x7w6v5u4t3s2"))
+            self.assertEquals(2, len(instance.get_old_password_hashes("testbulk")))
+        
+        # A failed hash rejects its record and not the rest of the batch
+        instance.clear_all_data()
+        importer = bulk_users.BulkUserImporter(processes=1)
+        importer._hasher = FailingPasswordHasher()
+        report = importer.import_records([
+            {"account_name": "bulkOne", "password": "q1w2e3r4t5y6u7i8"},
+            {"account_name": "bulkFail", "password": "failfailfail1234"},
+            {"account_name": "bulkTwo", "password": "p0o9i8u7y6t5r4e3"}])
+        self.assertEquals(2, report.imported)
+        self.assertEquals([2], [number for number, message in report.errors])
+        self.assertTrue(instance.exists("bulkone"))
+        self.assertTrue(instance.exists("bulktwo"))
+        self.assertFalse(instance.exists("bulkfail"))
+        self.assertTrue(instance.verify_password(instance.get_user("bulktwo"), "p0o9i8u7y6t5r4e3"))
+        
     def test_get_user_from_token(self):
         instance = ESAPI.authenticator()
         instance.logout()
@@ -221,7 +658,167 @@ class ValidatorTest(unittest.TestCase):
         password = "test"
         result1 = instance.hash_password(password, username)
         result2 = instance.hash_password(password, username)
-        self.assertEquals(result1, result2)
+        # Each hash has its own random salt
+        self.assertNotEquals(result1, result2)
+        self.assertTrue(password_hashing.verify_password(password, username, result1))
+        self.assertTrue(password_hashing.verify_password(password, username, result2))
+        self.assertFalse(password_hashing.verify_password("wrong", username, result1))
+        
+    def test_password_hashing(self):
+        hasher = password_hashing.get_password_hasher('pbkdf2', 
+            {'digest' : 'sha256', 'iterations' : 1000})
+        stored = hasher.hash(u"p\xe4ssword", "bob")
+        self.assertTrue(stored.startswith("$pbkdf2-sha256$i=1000$"))
+        self.assertTrue(password_hashing.verify_password(u"p\xe4ssword", "bob", stored))
+        self.assertFalse(password_hashing.verify_password(u"password", "bob", stored))
+        self.assertFalse(password_hashing.verify_password(u"p\xe4ssword", "bob", stored[:-4]))
+        self.assertFalse(hasher.needs_update(stored))
+        self.assertTrue(password_hashing.get_password_hasher('pbkdf2',
+            {'digest' : 'sha256', 'iterations' : 2000}).needs_update(stored))
+        self.assertRaises(EncryptionException, password_hashing.get_password_hasher, 'md4crypt')
+        self.assertRaises(EncryptionException, password_hashing.verify_password, 
+            "password", "bob", "$md4crypt$x$y$z")
+        
+        if hasattr(hashlib, 'scrypt'):
+            hasher = password_hashing.get_password_hasher('scrypt', {'n' : 1024, 'r' : 8, 'p' : 1})
+            stored = hasher.hash("password", "bob")
+            self.assertTrue(stored.startswith("$scrypt$n=1024,r=8,p=1$"))
+            self.assertTrue(password_hashing.verify_password("password", "bob", stored))
+        else:
+            self.assertRaises(EncryptionException, password_hashing.get_password_hasher, 'scrypt')
+            
+        parameters = password_hashing.calibrate('pbkdf2', 0.001)
+        self.assertTrue(parameters['iterations'] >= 1000)
+        
+    def test_hashing_pool(self):
+        hasher = password_hashing.get_password_hasher()
+        for processes in (0, 2):
+            pool = PasswordHashingPool(processes, max_pending=4)
+            try:
+                stored = pool.hash(hasher, "password", "bob")
+                self.assertTrue(pool.verify("password", "bob", stored))
+                self.assertFalse(pool.verify("wrong", "bob", stored))
+                self.assertTrue(pool.verify_any("password", "bob", ["junk", stored]))
+                self.assertFalse(pool.verify_any("password", "bob", []))
+                self.assertRaises(EncryptionException, pool.verify, "password", "bob", "$md4crypt$x$y$z")
+                
+                future = pool.verify_async("password", "bob", stored)
+                done = threading.Event()
+                future.add_done_callback(lambda future: done.set())
+                done.wait(10)
+                self.assertTrue(future.get())
+            finally:
+                pool.close()
+                
+        # Past max_pending, calls are rejected at once
+        slow = password_hashing.get_password_hasher('pbkdf2', 
+            {'digest' : 'sha512', 'iterations' : 200000})
+        pool = PasswordHashingPool(1, max_pending=1)
+        try:
+            future = pool.hash_async(slow, "password", "bob")
+            self.assertRaises(AvailabilityException, pool.verify, "password", "bob", "junk")
+            self.assertTrue(future.get(10).startswith("$pbkdf2"))
+        finally:
+            pool.close()
+        
+        # Closing fails the pending hashes and gives back their places
+        pool = PasswordHashingPool(1, max_pending=4)
+        try:
+            futures = [pool.hash_async(slow, "password", "bob") for i in range(3)]
+            pool.close()
+            for future in futures:
+                self.assertRaises(AvailabilityException, future.get, 1)
+            futures = [pool.hash_async(hasher, "password", "bob") for i in range(4)]
+            for future in futures:
+                self.assertTrue(future.get(10).startswith("$pbkdf2"))
+        finally:
+            pool.close()
+        
+        # A pool that does not finish in time is replaced
+        pool = PasswordHashingPool(1, max_pending=2, timeout=timedelta(milliseconds=50))
+        try:
+            self.assertRaises(AvailabilityException, pool.hash, slow, "password", "bob")
+            pool.timeout = 10
+            self.assertTrue(pool.verify("password", "bob", pool.hash(hasher, "password", "bob")))
+        finally:
+            pool.close()
+        
+        # A busy pool that keeps finishing hashes is not replaced when a
+        # call times out in its queue
+        sleeping = SleepingPasswordHasher(0.2)
+        pool = PasswordHashingPool(1, max_pending=4, timeout=timedelta(milliseconds=500))
+        try:
+            futures = [pool.hash_async(sleeping, "password%s" % i, "bob") for i in range(3)]
+            workers = pool._pool
+            self.assertRaises(AvailabilityException, pool.hash, sleeping, "password", "bob")
+            self.assertTrue(workers is pool._pool)
+            self.assertEquals(["$sleep$password0", "$sleep$password1", "$sleep$password2"],
+                [future.get(10) for future in futures])
+        finally:
+            pool.close()
+        
+    def test_password_history(self):
+        instance = ESAPI.authenticator()
+        passwords = ["a1b2c3d4e5f6g7h8", "Zq9Yp8Xo7Wn6Vm5", "Kj4Lh3Mg2Nf1Pe0", "Rt6Su7Tv8Uw9Vx0"]
+        user = instance.create_user("historybob", passwords[0], passwords[0])
+        for old, new in zip(passwords, passwords[1:]):
+            instance.change_password(user, old, new, new)
+        self.assertTrue(instance.verify_password(user, passwords[-1]))
+        
+        # The replaced passwords share one salt, the current one has its own
+        hashes = instance.get_old_password_hashes("historybob")
+        self.assertEquals(4, len(hashes))
+        salts = [password_hashing.get_salt(stored_hash) for stored_hash in hashes]
+        self.assertEquals(1, len(set(salts[:-1])))
+        self.assertNotEquals(salts[0], salts[-1])
+        for password in passwords:
+            self.assertTrue(password_hashing.verify_any(password, "historybob", hashes))
+        self.assertFalse(password_hashing.verify_any("Bq1Cr2Ds3Et4Fu5", "historybob", hashes))
+        self.assertRaises(AuthenticationException, instance.change_password, user, 
+            passwords[-1], passwords[1], passwords[1])
+            
+    def test_verification_cache(self):
+        cache = VerificationCache(2, timedelta(minutes=1))
+        self.assertFalse(cache.check("bob", "password", "$hash"))
+        cache.add("bob", "password", "$hash")
+        self.assertTrue(cache.check("BOB", "password", "$hash"))
+        self.assertFalse(cache.check("bob", "wrong", "$hash"))
+        self.assertFalse(cache.check("bob", "password", "$newhash"))
+        cache.add("alice", "password", "$hash")
+        cache.add("carol", "password", "$hash")
+        self.assertFalse(cache.check("bob", "password", "$hash"))
+        self.assertFalse(VerificationCache(2, timedelta(0)).check("bob", "password", "$hash"))
+        expired = VerificationCache(2, timedelta(0))
+        expired.add("bob", "password", "$hash")
+        self.assertFalse(expired.check("bob", "password", "$hash"))
+        
+        # Repeated verifications skip the hash
+        instance = ESAPI.authenticator()
+        password = "a1b2c3d4e5f6g7h8"
+        user = instance.create_user("cachedbob", password, password)
+        instance.verification_cache.clear()
+        self.assertTrue(instance.verify_password(user, password))
+        self.assertTrue(instance.verification_cache.check("cachedbob", password,
+            instance.get_hashed_password(user)))
+        self.assertFalse(instance.verify_password(user, "wrong"))
+        
+    def test_upgrade_password_hash(self):
+        instance = ESAPI.authenticator()
+        password = "a1b2c3d4e5f6g7h8"
+        user = instance.create_user("upgradebob", password, password)
+        
+        # A hash stored before password hashing was configurable
+        credentials = instance.get_credentials("upgradebob")
+        credentials.update_hashed_password(ESAPI.encryptor().hash(password, "upgradebob"))
+        instance.save_credentials(credentials)
+        self.assertFalse(instance.get_hashed_password(user).startswith("$"))
+        
+        self.assertFalse(instance.verify_password(user, "wrong"))
+        self.assertFalse(instance.get_hashed_password(user).startswith("$"))
+        self.assertTrue(instance.verify_password(user, password))
+        self.assertTrue(instance.get_hashed_password(user).startswith("$pbkdf2-sha512$i=1000$"))
+        self.assertEquals(1, len(instance.get_old_password_hashes("upgradebob")))
+        self.assertTrue(instance.verify_password(user, password))
         
     def test_login(self):
         instance = ESAPI.authenticator()
@@ -238,6 +835,14 @@ class ValidatorTest(unittest.TestCase):
         test = instance.login( request, response )
         self.assertTrue( test.is_logged_in() )
         
+        # The lock caused by failed logins is stored
+        instance.logout()
+        request.POST['password'] = "wrong"
+        attempts = ESAPI.security_configuration().get_allowed_login_attempts()
+        for i in range(attempts):
+            self.assertRaises(AuthenticationException, instance.login, request, response)
+        self.assertTrue(instance.user_shelf["testloginuser"].is_locked())
+        
     def test_remove_user(self):
         instance = ESAPI.authenticator()
         instance.logout()
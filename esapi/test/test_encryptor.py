@@ -63,6 +63,13 @@ class EncryptorTest(unittest.TestCase):
         hash4 = instance.hash("test", "salt1")
         self.assertTrue(hash3 == hash4)
         
+        # Different iterations
+        hash5 = instance.hash("test", "salt1", 1)
+        hash6 = instance.hash("test", "salt1", 2)
+        self.assertFalse(hash5 == hash6)
+        self.assertEquals(hash3, instance.hash("test", "salt1", 
+            ESAPI.security_configuration().get_hash_iterations()))
+        
     def test_crypt(self):
         instance = ESAPI.encryptor()
         
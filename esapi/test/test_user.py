@@ -28,6 +28,7 @@ import esapi.test.conf
 
 import unittest
 import inspect
+import pickle
 import time
 from datetime import datetime, timedelta
 
@@ -263,6 +264,27 @@ class UserTest(unittest.TestCase):
         user.unlock()
         self.assertFalse(user.is_locked())
         
+    def test_dirty_fields(self):
+        user = self.create_test_user()
+        self.assertFalse(user.is_dirty())
+        self.assertEquals(frozenset(), user.get_dirty_fields())
+        user.lock()
+        user.add_role("rolea")
+        user.increment_failed_login_count()
+        self.assertTrue(user.is_dirty())
+        self.assertEquals(frozenset(('locked', 'roles', 'failed_login_count')), 
+            user.get_dirty_fields())
+        user.clear_dirty()
+        self.assertFalse(user.is_dirty())
+        
+        # Reading does not make the user dirty, and stored copies are clean
+        user.is_locked()
+        user.roles
+        self.assertFalse(user.is_dirty())
+        user.screen_name = "Dirty"
+        self.assertFalse(pickle.loads(pickle.dumps(user)).is_dirty())
+        self.assertTrue(user.is_dirty())
+        
     def test_is_session_absolute_timeout(self):
         pass
         
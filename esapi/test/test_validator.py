@@ -25,6 +25,15 @@ import esapi.test.conf
 import unittest
 import os
 import os.path
+from StringIO import StringIO
+import tempfile
+import pickle
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+from datetime import datetime
+from datetime import timedelta
 
 from esapi.core import ESAPI
 
@@ -32,6 +41,23 @@ from esapi.codecs.html_entity import HTMLEntityCodec
 
 from esapi.validation_error_list import ValidationErrorList
 from esapi.reference.validation.string_validation_rule import StringValidationRule
+from esapi.reference.validation.date_validation_rule import DateValidationRule
+from esapi.reference.validation.number_validation_rule import NumberValidationRule
+from esapi.reference.validation.date_validation_rule import get_date_parser
+from esapi.reference.validation.pattern_analyzer import analyze_pattern
+from esapi.reference.validation import pattern_matcher
+from esapi.reference.validation import file_content_validation_rule
+from esapi.reference.validation import html_validation_rule
+from esapi.reference.validation.validation_batch import ValidationBatch
+from esapi.reference.validation.redirect_validation_rule import RedirectPolicy
+from esapi.reference.validation import validation_metrics
+from esapi.reference.validation import validation_profile
+from esapi.reference.validation.async_validator import AsyncValidator
+from esapi.reference.validation.validator_registry import ValidatorRegistry
+from esapi.reference.validation.validator_registry import get_validator
+from esapi.reference.default_validator import DefaultValidator
+from esapi.exceptions import ValidationException
+from esapi.exceptions import ValidationAvailabilityException
 
 class ValidatorTest(unittest.TestCase):
 
@@ -67,6 +93,56 @@ class ValidatorTest(unittest.TestCase):
         instance.get_valid_credit_card("cctest8", "4417 1234 5678 9112", False, errors)
         self.assertEquals( 2, len(errors) )
     
+    def test_credit_card_validate_many(self):
+        from esapi.reference.validation import credit_card_validation_rule
+        
+        rule = credit_card_validation_rule.CreditCardValidationRule("creditcard", None)
+        inputs = ["1234 9876 0000 0008", "1234987600000008", "12349876000000081",
+            "4417 1234 5678 9112", "", "1234&#x20;9876&#x20;0000&#x20;0008", "4111-1111-1111-1111"]
+        
+        # Same results as get_valid, with errors keyed by position
+        errors = ValidationErrorList()
+        results = list(rule.validate_many("cc", inputs, errors))
+        self.assertEquals(["1234987600000008", "1234987600000008", None, None, None,
+            "1234987600000008", "4111111111111111"], results)
+        self.assertEquals(["cc[2]", "cc[3]", "cc[4]"], sorted(errors.keys()))
+        
+        # Without an error list the first error is raised, and no exceptions
+        # are built for the inputs after it
+        built = []
+        luhn_exception = rule._luhn_exception
+        def count_luhn_exception(context):
+            built.append(context)
+            return luhn_exception(context)
+        rule._luhn_exception = count_luhn_exception
+        generator = rule.validate_many("cc", inputs)
+        self.assertEquals(["1234987600000008", "1234987600000008"], [generator.next(), generator.next()])
+        try:
+            generator.next()
+            self.fail()
+        except ValidationException, extra:
+            self.assertTrue("context=cc[2]" in extra.get_log_message())
+        self.assertEquals([], built)
+        generator = rule.validate_many("cc", ["4417 1234 5678 9112", "4417 1234 5678 9112", ""])
+        self.assertRaises(ValidationException, list, generator)
+        self.assertEquals(["cc[0]"], built)
+        del rule._luhn_exception
+        
+        # Batches are streamed
+        old_batch_size = credit_card_validation_rule.BATCH_SIZE
+        credit_card_validation_rule.BATCH_SIZE = 2
+        try:
+            errors = ValidationErrorList()
+            self.assertEquals(results, list(rule.validate_many("cc", iter(inputs), errors)))
+            self.assertEquals(["cc[2]", "cc[3]", "cc[4]"], sorted(errors.keys()))
+        finally:
+            credit_card_validation_rule.BATCH_SIZE = old_batch_size
+            
+        # The vectorized Luhn test agrees with the scalar one
+        numbers = [str(n) for n in range(4111111111111100, 4111111111111200)] + ["0", "18", "79927398713"]
+        self.assertEquals([credit_card_validation_rule.luhn_valid(n) for n in numbers],
+            credit_card_validation_rule.luhn_valid_many(numbers))
+    
     def test_is_valid_date(self):
         instance = ESAPI.validator()
         format = "%B %d, %Y"
@@ -85,6 +161,40 @@ class ValidatorTest(unittest.TestCase):
         instance.get_valid_date( "test", "June 32, 2008", "%B %d, %Y", False, errors )
         self.assertEquals( 2, len(errors) )
         
+    def test_date_parser(self):
+        # Compiled parsers accept exactly what strptime accepts
+        inputs = ["2001-09-11", "2001-9-1", "2001-09-11 ", "2001-02-29",
+                  "2001-13-01", "01-09-11", "", "2001-09-11T10:00"]
+        for format in ["%Y-%m-%d", "%Y-%m-%dT%H:%M", "%y-%m-%d", "%Y-%m-%d %%"]:
+            parser = get_date_parser(format)
+            self.assertTrue(parser is not None)
+            for input_ in inputs:
+                try:
+                    expected = datetime.strptime(input_, format)
+                except ValueError:
+                    self.assertRaises(ValueError, parser.parse, input_)
+                else:
+                    self.assertEquals(expected, parser.parse(input_))
+        self.assertEquals(datetime(2001, 9, 11, 8, 30, 0, 250000),
+            get_date_parser("%B %d, %Y %H:%M:%S.%f").parse("sePTember  11, 2001 08:30:00.25"))
+        
+        # Other directives fall back to strptime
+        self.assertEquals(None, get_date_parser("%A %d %B %Y"))
+        rule = DateValidationRule("test", ESAPI.encoder(), "%a %Y-%m-%d")
+        self.assertEquals(datetime(2001, 9, 11), rule.get_valid("test", "Tue 2001-09-11"))
+        
+    def test_date_validate_many(self):
+        rule = DateValidationRule("test", ESAPI.encoder(), "%Y-%m-%d")
+        errors = ValidationErrorList()
+        inputs = ["2001-09-11", "2001-02-30", "", "1999-12-31"]
+        results = list(rule.validate_many("dates", inputs, errors))
+        self.assertEquals([datetime(2001, 9, 11), None, None, datetime(1999, 12, 31)], results)
+        self.assertEquals(2, len(errors))
+        self.assertTrue(errors["dates[1]"] is not None)
+        self.assertTrue(errors["dates[2]"] is not None)
+        
+        self.assertRaises(ValidationException, list, rule.validate_many("dates", inputs))
+        
     def test_is_valid_number(self):
         instance = ESAPI.validator();
     
@@ -167,6 +277,260 @@ class ValidatorTest(unittest.TestCase):
         self.assertEquals( 2, len(errors) );
         instance.get_valid_number("dtest5", float, "99999999.9", 0, 20, True, errors );
         self.assertEquals( 3, len(errors) );
+        
+    def test_number_validate_many(self):
+        rule = NumberValidationRule("number", int, ESAPI.encoder(), -10, 10)
+        errors = ValidationErrorList()
+        inputs = ["5", "-10", "+7", "11", "1.5", "&#49;", "%35", "", "x"]
+        results = list(rule.validate_many("numbers", inputs, errors))
+        self.assertEquals([5, -10, 7, None, None, 1, 5, None, None], results)
+        self.assertEquals(4, len(errors))
+        for index in (3, 4, 7, 8):
+            self.assertTrue(errors["numbers[%s]" % index] is not None)
+        self.assertRaises(ValidationException, list, rule.validate_many("numbers", inputs))
+        
+        # Plain numbers skip canonicalization but parse the same
+        rule = NumberValidationRule("number", float, ESAPI.encoder(), -1000, 1000)
+        for input_ in ["1.", ".5", "-0", "+007.50", "1e2", " 3", "1.2.3", ".", "-"]:
+            try:
+                expected = float(ESAPI.encoder().canonicalize(input_))
+            except ValueError:
+                expected = None
+            self.assertEquals(expected, rule.get_safe("test", input_))
+        
+    def test_validation_metrics(self):
+        self.assertTrue(validation_metrics.get_metrics() is None)
+        metrics = validation_metrics.enable_metrics()
+        try:
+            rule = NumberValidationRule("number", int, ESAPI.encoder(), -10, 10)
+            errors = ValidationErrorList()
+            list(rule.validate_many("numbers", ["5", "11", "x", "%35"], errors))
+            self.assertFalse(rule.is_valid("number", "%2535"))
+            rule = StringValidationRule("name", ESAPI.encoder())
+            rule.set_maximum_length(5)
+            rule.get_valid("name", "abc")
+            
+            snapshot = metrics.snapshot()
+            stats = snapshot['types']['number']
+            self.assertEquals(5, stats['calls'])
+            self.assertEquals(2, stats['passes'])
+            self.assertEquals(3, stats['failures'])
+            self.assertEquals(1, stats['encoding_failures'])
+            self.assertEquals(5, sum([bucket['count'] for bucket in stats['latency']]))
+            # Indexed contexts from validate_many are counted together
+            self.assertEquals(4, snapshot['contexts']['numbers']['calls'])
+            self.assertEquals(1, snapshot['contexts']['number']['calls'])
+            self.assertEquals(1, snapshot['types']['name']['passes'])
+            self.assertTrue('"encoding_failures": 1' in metrics.to_json())
+            
+            # Non-ASCII contexts are recorded as unicode
+            rule.get_valid(u"caf\xe9", "abc")
+            self.assertEquals(1, metrics.snapshot()['contexts'][u"caf\xe9"]['calls'])
+            
+            # File names and directory paths are measured by the validator
+            instance = ESAPI.validator()
+            self.assertTrue(instance.is_valid_filename("file", "test.txt", False))
+            errors = ValidationErrorList()
+            instance.get_valid_filename("file", "test.exe", False, errors)
+            self.assertEquals(None, instance.get_valid_directory_path("dir", "", "/", True))
+            stats = metrics.snapshot()['types']
+            self.assertEquals((2, 1, 1), (stats['filename']['calls'],
+                stats['filename']['passes'], stats['filename']['failures']))
+            self.assertEquals(1, stats['directory_path']['passes'])
+            
+            # Distinct contexts are capped
+            for i in range(validation_metrics.MAX_CONTEXTS + 10):
+                metrics.record("number", "context%s" % i, 0.0, 'pass')
+            snapshot = metrics.snapshot()
+            self.assertEquals(validation_metrics.MAX_CONTEXTS + 1, len(snapshot['contexts']))
+            self.assertTrue(validation_metrics.OTHER_CONTEXT in snapshot['contexts'])
+            
+            metrics.reset()
+            self.assertEquals({}, metrics.snapshot()['types'])
+        finally:
+            validation_metrics.disable_metrics()
+        
+        # Disabled, nothing is recorded
+        rule.get_valid("name", "abc")
+        self.assertEquals({}, metrics.snapshot()['types'])
+    
+    def test_validation_profile(self):
+        class Settings:
+            Validator_Name = r"^[a-z]+$"
+            Validator_Broken = r"^[a-z+$"
+            Validator_Nested = r"^(a+)+$"
+            Validation_Other = r"^.*$"
+        
+        profile = validation_profile.load_profile(Settings)
+        self.assertEquals(['Broken', 'Name', 'Nested'], profile.get_names())
+        self.assertTrue(profile.get_pattern("Name").match("abc"))
+        self.assertTrue(profile.get_pattern("Broken") is None)
+        self.assertTrue('Broken' in profile.get_errors())
+        self.assertEquals(['Nested'], profile.get_warnings().keys())
+        self.assertTrue(profile.get_pattern("Other") is None)
+        self.assertRaises(AttributeError, setattr, profile, 'fingerprint', None)
+        
+        copy = pickle.loads(pickle.dumps(profile, pickle.HIGHEST_PROTOCOL))
+        self.assertEquals(profile.fingerprint, copy.fingerprint)
+        self.assertEquals(profile.get_errors(), copy.get_errors())
+        self.assertTrue(copy.get_pattern("Name").match("abc"))
+        
+        # A pattern the analyzer fails on is compiled, with a warning
+        analyze_pattern = validation_profile.analyze_pattern
+        def broken_analyzer(source):
+            raise ValueError("unsupported")
+        validation_profile.analyze_pattern = broken_analyzer
+        try:
+            profile = validation_profile.load_profile(Settings)
+        finally:
+            validation_profile.analyze_pattern = analyze_pattern
+        self.assertTrue(profile.get_pattern("Name").match("abc"))
+        self.assertEquals(['Broken'], profile.get_errors().keys())
+        self.assertEquals(['Name', 'Nested'], sorted(profile.get_warnings().keys()))
+        self.assertTrue("unsupported" in profile.get_warnings()["Name"][0])
+        profile = validation_profile.load_profile(Settings)
+        
+        # The cache file is reused until the patterns change
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "profile.cache")
+            validation_profile.load_profile(Settings, filename)
+            self.assertTrue(os.path.exists(filename))
+            cached = validation_profile.load_profile(Settings, filename)
+            self.assertEquals(profile.fingerprint, cached.fingerprint)
+            
+            Settings.Validator_Name = r"^[a-z]*$"
+            changed = validation_profile.load_profile(Settings, filename)
+            self.assertNotEquals(profile.fingerprint, changed.fingerprint)
+            self.assertTrue(changed.get_pattern("Name").match(""))
+            
+            open(filename, 'wb').write("damaged")
+            self.assertEquals(changed.fingerprint,
+                validation_profile.load_profile(Settings, filename).fingerprint)
+        finally:
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+        
+        config = ESAPI.security_configuration()
+        self.assertTrue(config.get_validation_pattern("AccountName") is
+            config.get_validation_profile().get_pattern("AccountName"))
+        self.assertTrue(config.get_validation_pattern("Nonexistent") is None)
+    
+    def test_async_validator(self):
+        instance = ESAPI.validator()
+        pool = ThreadPool(2)
+        try:
+            validator = AsyncValidator(instance, pool, 4)
+            
+            # Cheap checks are done inline
+            future = validator.get_valid_input("test", "jeff", "AccountName", 20, False)
+            self.assertTrue(future.ready())
+            self.assertEquals("jeff", future.get())
+            future = validator.get_valid_number("test", int, "11", 0, 10, False)
+            self.assertTrue(future.ready())
+            self.assertFalse(future.successful())
+            self.assertRaises(ValidationException, future.get)
+            
+            future = validator.get_valid_safe_html("test", "<b>bold</b><script>x</script>", 100, False)
+            self.assertEquals("<b>bold</b>", future.get(5))
+            lines = validator.safe_read_lines("lines", StringIO("jeff\nab\n"), "AccountName", 20, False, ValidationErrorList())
+            self.assertEquals(["jeff", None], lines.get(5))
+            
+            done = []
+            future.add_done_callback(done.append)
+            self.assertEquals([future], done)
+            
+            # Past the limit, checks fail at once instead of queuing
+            class SlowValidator:
+                def __init__(self):
+                    self.release = threading.Event()
+                def get_valid_file_content(self, context, input_, max_bytes, allow_none):
+                    self.release.wait(5)
+                    return input_
+            slow = SlowValidator()
+            validator = AsyncValidator(slow, pool, 1)
+            first = validator.get_valid_file_content("test", "content", 100, False)
+            second = validator.get_valid_file_content("test", "content", 100, False)
+            self.assertTrue(second.ready())
+            self.assertRaises(ValidationAvailabilityException, second.get)
+            self.assertRaises(TimeoutError, first.get, 0.01)
+            first.add_done_callback(done.append)
+            slow.release.set()
+            self.assertEquals("content", first.get(5))
+            self.assertEquals(first, done[-1])
+            self.assertEquals("more", validator.get_valid_file_content("test", "more", 100, False).get(5))
+        finally:
+            pool.terminate()
+    
+    def test_get_valid_json(self):
+        instance = ESAPI.validator()
+        name = StringValidationRule("name", ESAPI.encoder(), "^[a-z]+$")
+        name.set_maximum_length(10)
+        rules = {"count" : NumberValidationRule("count", int, ESAPI.encoder(), 0, 10),
+                 "items[].name" : name}
+        
+        body = '{"count": 2, "items": [{"name": "abc", "tags": [true, null]}, {"name": "def"}], "note": "caf\\u00e9"}'
+        self.assertEquals({"count" : 2,
+                           "items" : [{"name" : "abc", "tags" : [True, None]}, {"name" : "def"}],
+                           "note" : u"caf\u00e9"},
+                          instance.get_valid_json("order", body, rules, 1000, False))
+        # Read a byte at a time, so that every token is split across reads
+        class Trickle:
+            def __init__(self, text):
+                self.text = text
+            def read(self, size):
+                char, self.text = self.text[:1], self.text[1:]
+                return char
+        self.assertEquals(2, instance.get_valid_json("order", Trickle(body), rules, 1000, False)["count"])
+        
+        errors = ValidationErrorList()
+        self.assertEquals(None, instance.get_valid_json("order", '{"count": 2, "items": [{"name": "ABC"}]}', rules, 1000, False, errors))
+        self.assertTrue("context=order.items[0].name" in errors["order"].get_log_message())
+        self.assertFalse(instance.is_valid_json("order", '{"count": 11}', rules, 1000, False))
+        self.assertFalse(instance.is_valid_json("order", '{"count": [1]}', rules, 1000, False))
+        
+        # Reading stops at the first violation
+        stream = StringIO('{"count": 12, "rest": "' + 'x' * 100000 + '"}')
+        self.assertFalse(instance.is_valid_json("order", stream, rules, 1000000, False))
+        self.assertTrue(stream.tell() < 10000)
+        
+        for body in ['', '{', '{"a" 1}', '{"a": 1,}', '[1 2]', '01', 'tru', '"abc',
+                     '{"a": 1}x', '1.2.3', '{"a": 1, "a": 2}', '"\x01"', '"\\q"',
+                     '[[[[[[[[[[[[[[[[[[[[[[[[[[[[[[[[[1]]]]]]]]]]]]]]]]]]]]]]]]]]]]]]]]]',
+                     '[' + '1,' * 1000 + '1]']:
+            self.assertFalse(instance.is_valid_json("body", body, {}, 2000, False), body)
+        self.assertTrue(instance.is_valid_json("body", '', {}, 2000, True))
+        self.assertTrue(instance.is_valid_json("body", '[' + '1,' * 500 + '1]', {}, 2000, False))
+    
+    def test_validator_registry(self):
+        registry = ValidatorRegistry()
+        built = []
+        def factory():
+            time.sleep(0.01)
+            built.append(DefaultValidator())
+            return built[-1]
+        registry.register("slow", factory)
+        
+        # Threads asking at the same time share one validator
+        found = []
+        threads = [threading.Thread(target=lambda: found.append(registry.get("slow")))
+            for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(1, len(built))
+        self.assertEquals([built[0]] * 8, found)
+        self.assertRaises(KeyError, registry.get, "missing")
+        
+        registry.clear()
+        self.assertFalse(registry.get("slow") is built[0])
+        
+        file_validator = get_validator('file')
+        self.assertTrue(file_validator is get_validator('file'))
+        self.assertTrue(file_validator is ESAPI.validator().make_file_validator())
+        self.assertEquals(2, len(file_validator.encoder.codecs))
     
     def test_is_valid_dir_path(self):
         encoder_class = ESAPI.security_configuration().get_class_for_interface('encoder')
@@ -244,6 +608,96 @@ class ValidatorTest(unittest.TestCase):
         instance.get_valid_directory_path("dirtest3", "ridicul%00ous", parent, False, errors);
         self.assertEquals( 2, len(errors) );
         
+    def test_directory_cache(self):
+        instance = ESAPI.validator()
+        parent = os.path.realpath(tempfile.mkdtemp())
+        path = os.path.join(parent, "upload")
+        other = os.path.join(parent, "other")
+        os.mkdir(path)
+        os.mkdir(other)
+        try:
+            instance.directory_cache.clear()
+            self.assertEquals(path, instance.get_valid_directory_path("test", path, parent, False))
+            self.assertEquals(1, len(instance.directory_cache))
+            self.assertEquals(path, instance.directory_cache.get(path, parent))
+            self.assertEquals(path, instance.get_valid_directory_path("test", path, parent, False))
+            
+            # Replacing the directory with a symlink invalidates the entry
+            os.rmdir(path)
+            if hasattr(os, 'symlink'):
+                os.symlink(other, path)
+                self.assertEquals(None, instance.directory_cache.get(path, parent))
+                self.assertFalse(instance.is_valid_directory_path("test", path, parent, False))
+                os.remove(path)
+            self.assertFalse(instance.is_valid_directory_path("test", path, parent, False))
+            
+            # So does replacing a component between the parent and the
+            # directory with a symlink to the same place
+            if hasattr(os, 'symlink'):
+                middle = os.path.join(other, "middle")
+                leaf = os.path.join(middle, "leaf")
+                os.makedirs(leaf)
+                self.assertTrue(instance.is_valid_directory_path("test", leaf, parent, False))
+                os.rename(middle, middle + "2")
+                os.symlink(middle + "2", middle)
+                try:
+                    self.assertEquals(None, instance.directory_cache.get(leaf, parent))
+                    self.assertFalse(instance.is_valid_directory_path("test", leaf, parent, False))
+                finally:
+                    os.remove(middle)
+                    os.rmdir(os.path.join(middle + "2", "leaf"))
+                    os.rmdir(middle + "2")
+        finally:
+            os.rmdir(other)
+            os.rmdir(parent)
+            instance.directory_cache.clear()
+        
+    def test_validation_batch(self):
+        instance = ESAPI.validator()
+        errors = ValidationErrorList()
+        
+        batch = ValidationBatch(errors)
+        batch.add("name", instance.get_valid_input, "jeff", "AccountName", 20, False)
+        batch.add("bad", instance.get_valid_input, "<script>", "AccountName", 20, False)
+        batch.add("date", instance.get_valid_date, "June 23, 1967", "%B %d, %Y", False)
+        self.assertRaises(RuntimeError, batch.add, "name", instance.get_valid_input)
+        results = batch.run()
+        
+        self.assertEquals("jeff", results["name"])
+        self.assertEquals(None, results["bad"])
+        self.assertEquals(1967, results["date"].year)
+        self.assertEquals(1, len(errors))
+        self.assertTrue(errors["bad"] is not None)
+        self.assertEquals(set(["name", "bad", "date"]), 
+            set([context for context, seconds in batch.get_timings()]))
+        
+        # Without an error list the first error is raised
+        batch = ValidationBatch()
+        batch.add("first", instance.get_valid_input, "<a>", "AccountName", 20, False)
+        batch.add("second", instance.get_valid_input, "<b>", "AccountName", 20, False)
+        try:
+            batch.run()
+            self.fail()
+        except ValidationException, extra:
+            self.assertTrue("first" in extra.get_log_message())
+        
+        # A batch run by a field of another batch does not wait on the pool
+        pool = ThreadPool(1)
+        try:
+            def nested(context):
+                inner = ValidationBatch(pool=pool)
+                inner.add("inner", instance.get_valid_input, "jeff", "AccountName", 20, False)
+                return inner.run()["inner"]
+            batch = ValidationBatch(pool=pool)
+            batch.add("outer", nested)
+            results = []
+            thread = threading.Thread(target=lambda: results.append(batch.run()))
+            thread.start()
+            thread.join(10)
+            self.assertEquals([{"outer" : "jeff"}], results)
+        finally:
+            pool.terminate()
+        
     def test_is_valid_filename(self):
         instance = ESAPI.validator()
         
@@ -297,6 +751,105 @@ class ValidatorTest(unittest.TestCase):
         
     def test_get_valid_input(self):
         pass
+        
+    def test_is_valid_safe_html(self):
+        instance = ESAPI.validator()
+        
+        self.assertTrue(instance.is_valid_safe_html("test", "<b>Jeff</b>", 100, False))
+        self.assertTrue(instance.is_valid_safe_html("test", "<a href=\"http://www.aspectsecurity.com\">Aspect Security</a>", 100, False))
+        self.assertTrue(instance.is_valid_safe_html("test", "Test. <script>alert(document.cookie)</script>", 100, False))
+        self.assertFalse(instance.is_valid_safe_html("test", "<b>" + "x" * 100 + "</b>", 100, False))
+        self.assertFalse(instance.is_valid_safe_html("test", "", 100, False))
+        self.assertTrue(instance.is_valid_safe_html("test", None, 100, True))
+        
+    def test_get_valid_safe_html(self):
+        instance = ESAPI.validator()
+        errors = ValidationErrorList()
+        
+        tests = [
+            ("Test. <b>Jeff</b>", "Test. <b>Jeff</b>"),
+            ("Test. <script>alert(document.cookie)</script>", "Test. "),
+            ("Test. <div style={xss:expression(xss)}>b</div>", "Test. <div>b</div>"),
+            ("<A HREF=\"javascript:alert(1)\" title='a\"b'>x</a>", "<a title=\"a&quot;b\">x</a>"),
+            ("<a href=\"jav&#x09;ascript:alert(1)\">x</a>", "<a>x</a>"),
+            ("<a href=\"/page?a=1&amp;b=2\">x</a>", "<a href=\"/page?a=1&amp;b=2\">x</a>"),
+            ("<img src=x onerror=alert(1)>", "<img src=\"x\" />"),
+            ("<b><i>open", "<b><i>open</i></b>"),
+            ("<b>a</i>b</b>c</b>", "<b>ab</b>c"),
+            ("1 < 2 &amp; 3 &bogus; &#60;<!-- comment -->", "1 &lt; 2 &amp; 3 &amp;bogus &#60;"),
+            ("<p>a<blink>b</blink><iframe src=x>c</iframe>d</p>", "<p>abd</p>"),
+            ]
+        for input_, expected in tests:
+            self.assertEquals(expected, instance.get_valid_safe_html("test", input_, 100, False))
+            
+        # Cleaning is the same when the tokenizer is fed in small chunks
+        old_chunk_size = html_validation_rule.CHUNK_SIZE
+        html_validation_rule.CHUNK_SIZE = 3
+        try:
+            for input_, expected in tests:
+                self.assertEquals(expected, instance.get_valid_safe_html("test", input_, 100, False))
+        finally:
+            html_validation_rule.CHUNK_SIZE = old_chunk_size
+            
+        # Escaping can make the output longer than the input
+        instance.get_valid_safe_html("test1", "<" * 50, 100, False, errors)
+        self.assertEquals(1, len(errors))
+        
+    def test_analyze_pattern(self):
+        # Nested quantifiers and overlapping alternations are reported
+        self.assertEquals(1, len(analyze_pattern(r"^(a+)+$")))
+        self.assertEquals(1, len(analyze_pattern(r"^(\w+\s?)*$")))
+        self.assertEquals(1, len(analyze_pattern(r"^(\w|\d)+$")))
+        self.assertEquals(1, len(analyze_pattern(r"^(ab|a.)*$")))
+        
+        # Bounded or unambiguous repetition is fine
+        self.assertEquals(0, len(analyze_pattern(r"^(\d{4}[- ]?){3}\d{4}$")))
+        self.assertEquals(0, len(analyze_pattern(r"^(x|y)+$")))
+        self.assertEquals(0, len(analyze_pattern(r"^(:[0-9]*)*$")))
+        self.assertEquals(0, len(analyze_pattern(r"^[a-zA-Z0-9]{3,20}$")))
+        
+    def test_pattern_match_timeout(self):
+        evil = r"^(a+)+$"
+        matcher = pattern_matcher.PatternMatcher('process', timedelta(milliseconds=500))
+        old_matcher = pattern_matcher.get_pattern_matcher()
+        pattern_matcher.set_pattern_matcher(matcher)
+        try:
+            rule = StringValidationRule("evil", None, evil)
+            self.assertEquals("aaaa", rule.get_valid("test", "aaaa"))
+            self.assertRaises(ValidationAvailabilityException, 
+                rule.get_valid, "test", "a" * 40 + "!")
+                
+            # The matcher recovers after a timeout
+            self.assertEquals("aaaa", rule.get_valid("test", "aaaa"))
+            
+            stats = matcher.get_statistics()
+            self.assertEquals(1, len(stats))
+            self.assertEquals(evil, stats[0].pattern)
+            self.assertEquals(3, stats[0].calls)
+            self.assertEquals(1, stats[0].timeouts)
+            
+            # Time spent waiting for a busy worker does not count against
+            # the budget, so a match queued behind two slow ones, for longer
+            # than the budget, still passes
+            matcher.processes = 1
+            matcher.close()
+            results = []
+            def slow():
+                try:
+                    rule.get_valid("test", "a" * 40 + "!")
+                except ValidationAvailabilityException, extra:
+                    results.append(extra)
+            threads = [threading.Thread(target=slow) for i in range(2)]
+            for thread in threads:
+                thread.start()
+                time.sleep(0.05)
+            self.assertEquals("aaaa", rule.get_valid("test", "aaaa"))
+            for thread in threads:
+                thread.join()
+            self.assertEquals(2, len(results))
+        finally:
+            pattern_matcher.set_pattern_matcher(old_matcher)
+            matcher.close()
 
     def test_is_valid_number(self):
         instance = ESAPI.validator()
@@ -348,6 +901,52 @@ class ValidatorTest(unittest.TestCase):
         instance.get_valid_file_content("test", content, 4, True, errors)
         self.assertEquals(1, len(errors))
         
+    def test_get_valid_file_content_stream(self):
+        instance = ESAPI.validator()
+        errors = ValidationErrorList()
+        
+        handle, path = tempfile.mkstemp()
+        try:
+            os.write(handle, "%PDF-1.4\n" + "x" * 100 + "\xc3\xa9<script>")
+            os.close(handle)
+            
+            self.assertEquals(119, instance.get_valid_file_content_stream("test", path, 119, False))
+            self.assertFalse(instance.is_valid_file_content_stream("test", path, 118, False))
+            self.assertTrue(instance.is_valid_file_content_stream("test", path, 200, False, 
+                magic_numbers=["GIF8", "%PDF-"], encoding="utf-8"))
+            self.assertFalse(instance.is_valid_file_content_stream("test", path, 200, False, 
+                magic_numbers=["GIF8"]))
+            self.assertFalse(instance.is_valid_file_content_stream("test", path, 200, False, 
+                encoding="ascii"))
+            
+            # Forbidden patterns are found across chunk boundaries
+            old_chunk_size = file_content_validation_rule.CHUNK_SIZE
+            file_content_validation_rule.CHUNK_SIZE = 7
+            try:
+                instance.get_valid_file_content_stream("test1", path, 200, False, 
+                    forbidden_patterns=["<script"], error_list=errors)
+                self.assertEquals(1, len(errors))
+                stream = open(path, 'rb')
+                try:
+                    instance.get_valid_file_content_stream("test2", stream, 200, False, 
+                        forbidden_patterns=["<object"], encoding="utf-8", error_list=errors)
+                finally:
+                    stream.close()
+                self.assertEquals(1, len(errors))
+            finally:
+                file_content_validation_rule.CHUNK_SIZE = old_chunk_size
+        finally:
+            os.remove(path)
+            
+        # Streams of unknown size are not read past the limit
+        stream = StringIO("y" * 1000)
+        self.assertFalse(instance.is_valid_file_content_stream("test", stream, 100, False))
+        self.assertTrue(stream.tell() <= 101)
+        
+        self.assertEquals(None, instance.get_valid_file_content_stream("test", StringIO(""), 100, True))
+        self.assertFalse(instance.is_valid_file_content_stream("test", StringIO(""), 100, False))
+        self.assertFalse(instance.is_valid_file_content_stream("test", path, 100, False))
+        
     def test_is_valid_file_upload(self):
         directory_path = os.path.expanduser('~')
         if os.name == 'nt': # Windows
@@ -379,14 +978,79 @@ class ValidatorTest(unittest.TestCase):
         pass
         
     def test_is_valid_redirect_location(self):
-        pass
+        instance = ESAPI.validator()
+        
+        # Validation_RedirectAllowList in the test settings
+        allowed = ["http://example.com/", "https://EXAMPLE.com.:8443/x?y=1#z",
+                   "http://www.example.org/app/page", "http://example.org/app/",
+                   "/test/page", "/test", "/test?x=1"]
+        denied = ["http://www.example.com/", "http://example.org/other",
+                  "http://evil.com/", "http://example.com.evil.com/",
+                  "javascript:alert(1)", "ftp://example.com/", 
+                  "//evil.com/", "http://user@example.com/", "/other",
+                  "http://example.com/a/../b", "/test/..%2F..%2Fadmin",
+                  "http://example.com:80x/",
+                  "relative/test", "///evil.com", "///test.evil.com",
+                  "/testing", "/test.evil.com",
+                  "http://example.org/application"]
+        for location in allowed:
+            self.assertTrue(instance.is_valid_redirect_location("test", location, False), location)
+        for location in denied:
+            self.assertFalse(instance.is_valid_redirect_location("test", location, False), location)
         
     def test_get_valid_redirect_location(self):
-        pass
+        instance = ESAPI.validator()
+        errors = ValidationErrorList()
+        
+        self.assertEquals("http://example.com/a b", 
+            instance.get_valid_redirect_location("test1", "http://example.com/a%20b", False, errors))
+        instance.get_valid_redirect_location("test2", "http://evil.com/", False, errors)
+        instance.get_valid_redirect_location("test3", "/test" + "x" * 512, False, errors)
+        self.assertEquals(2, len(errors))
+        self.assertEquals(None, instance.get_valid_redirect_location("test4", "", True))
+        
+        # Lookups do not depend on the size of the allow list
+        policy = RedirectPolicy(["host%s.example.com/path%s/" % (i, i) for i in range(5000)])
+        self.assertTrue(policy.is_allowed("http://host4999.example.com/path4999/x"))
+        self.assertFalse(policy.is_allowed("http://host4999.example.com/path4998/x"))
+        self.assertFalse(policy.is_allowed("http://example.com/"))
+        self.assertFalse(policy.is_allowed("http:\\\\host1.example.com/path1/"))
+        
+        # Entries match whole path segments, and "///host" is not relative
+        policy = RedirectPolicy(["/", "/app", "example.com/docs"])
+        self.assertTrue(policy.is_allowed("/app/x"))
+        self.assertFalse(policy.is_allowed("///evil.com"))
+        self.assertFalse(policy.is_allowed("/\\evil.com"))
+        self.assertFalse(policy.is_allowed("\\\\evil.com"))
+        self.assertTrue(policy.is_allowed("http://example.com/docs"))
+        self.assertFalse(policy.is_allowed("http://example.com/docsevil"))
+        policy = RedirectPolicy(["/app"])
+        self.assertFalse(policy.is_allowed("/application"))
         
     def test_safe_read_line(self):
         pass
                 
+    def test_safe_read_lines(self):
+        instance = ESAPI.validator()
+        errors = ValidationErrorList()
+        stream = StringIO("jeff\r\nbad<script>\n\n" + "x" * 100 + "\nbob")
+        lines = list(instance.safe_read_lines("import", stream, "AccountName", 10, False, errors))
+        self.assertEquals(["jeff", None, None, None, "bob"], lines)
+        self.assertEquals(3, len(errors))
+        for line_number in (2, 3, 4):
+            self.assertTrue(errors["import[%s]" % line_number] is not None)
+            
+        # A line of exactly max_length is allowed with either terminator
+        stream = StringIO("a" * 10 + "\r\n" + "b" * 10 + "\n" + "c" * 10)
+        lines = list(instance.safe_read_lines("import", stream, "AccountName", 10, False))
+        self.assertEquals(["a" * 10, "b" * 10, "c" * 10], lines)
+        
+        # Any ValidationRule can check the lines
+        rule = DateValidationRule("date", ESAPI.encoder(), "%Y-%m-%d")
+        stream = StringIO("2001-09-11\nfreakshow\n")
+        self.assertRaises(ValidationException, list, 
+            instance.safe_read_lines("dates", stream, rule, 10, False))
+                
 if __name__ == "__main__":
     unittest.main()
 
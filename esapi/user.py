@@ -493,6 +493,42 @@ class User(object):
         """
         raise NotImplementedError()
         
+    # Persistence
+    def is_dirty(self):
+        """
+        Checks if this user has changed since it was last stored. The
+        Authenticator only writes users that have changed.
+        
+        @return: true if the user has unsaved changes
+        """
+        raise NotImplementedError()
+        
+    def get_dirty_fields(self):
+        """
+        Gets the names of the fields changed since this user was last stored.
+        
+        @return: a frozenset of field names, such as 'roles' or 'locked'
+        """
+        raise NotImplementedError()
+        
+    def clear_dirty(self):
+        """
+        Marks this user as stored. Called by the Authenticator after it
+        writes the user.
+        """
+        raise NotImplementedError()
+        
+    def copy_changes_to(self, other):
+        """
+        Copies the fields changed on this user onto other, another copy of
+        the same user, such as the stored one. The Authenticator writes
+        only the changed fields this way, so that changes made through
+        another copy are kept.
+        
+        @param other: a copy of this user
+        """
+        raise NotImplementedError()
+        
 ######################
 
 class AnonymousUser(object):  
@@ -694,3 +730,17 @@ class AnonymousUser(object):
     # Security event dictionary 
     def get_event_dict(self):
         raise NotImplementedError()
+
+    # Persistence
+    # The anonymous user is never stored
+    def is_dirty(self):
+        return False
+        
+    def get_dirty_fields(self):
+        return frozenset()
+        
+    def clear_dirty(self):
+        pass
+
+    def copy_changes_to(self, other):
+        pass
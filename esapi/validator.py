@@ -464,6 +464,56 @@ class Validator():
         """
         raise NotImplementedError()
 
+    def is_valid_file_content_stream(self, context, input_, max_bytes, allow_none,
+                                           magic_numbers=None,
+                                           forbidden_patterns=None,
+                                           encoding=None):
+        """
+        Returns true if the content of a file is valid, according to the 
+        same checks as get_valid_file_content_stream.
+
+        @return: true, if the file contains valid content. Otherwise, false.
+        """
+        raise NotImplementedError()
+
+    def get_valid_file_content_stream(self, context, input_, max_bytes, allow_none,
+                                            magic_numbers=None,
+                                            forbidden_patterns=None,
+                                            encoding=None,
+                                            error_list=None):
+        """
+        Validates the content of a file without reading it all into memory,
+        which makes it suitable for large uploads. Regular files are memory
+        mapped and other streams are read in chunks. Validation stops at the
+        first violation, so an oversized stream is not read past the limit.
+
+        @param context: A descriptive name of the parameter that you are validating 
+            (e.g., LoginPage_UsernameField). This value is used by any 
+            logging or error handling that is done with respect to the 
+            value passed in.
+        @param input_: The path of the file, or a file object positioned at
+            the start of the content.
+        @param max_bytes: The maximum number of bytes allowed in a legal file.
+        @param allow_none: If allow_none is true then no input or an empty
+            file will be legal. If allow_none is false then no input or an
+            empty file will throw a ValidationException. A path that does
+            not exist always throws a ValidationException.
+        @param magic_numbers: A list of byte strings. If given, the content
+            must start with one of them.
+        @param forbidden_patterns: A list of byte strings that must not
+            appear anywhere in the content.
+        @param encoding: The name of an encoding, such as 'utf-8', that the
+            content must be valid in.
+        @param error_list: If error_list exists, any errors will be captured in the list
+            instead of being thrown. The method will return None in this
+            case.
+            
+        @return: The number of bytes of valid content.
+
+        @raise IntrusionException:
+        """
+        raise NotImplementedError()
+
     def is_valid_file_upload(self, context,
                                 directory_path,
                                 parent,
@@ -588,6 +638,43 @@ class Validator():
         """
         raise NotImplementedError()
 
+    def is_valid_json(self, context, input_, rules, max_bytes, allow_none):
+        """
+        Returns true if input is a valid JSON body, according to the same
+        checks as get_valid_json.
+
+        @return: true, if input is a valid JSON body. Otherwise, false.
+        """
+        raise NotImplementedError()
+
+    def get_valid_json(self, context, input_, rules, max_bytes, allow_none, error_list=None):
+        """
+        Reads a JSON request body as a stream and validates each value as 
+        it is read, with the rule for its path. Validation stops at the 
+        first violation, without reading the rest of the body.
+
+        @param context: A descriptive name of the parameter that you are validating 
+            (e.g., LoginPage_UsernameField). This value is used by any 
+            logging or error handling that is done with respect to the 
+            value passed in.
+        @param input_: The JSON text, or a file object to read it from, 
+            such as wsgi.input.
+        @param rules: A dictionary of ValidationRules by path, such as
+            "items[].price". See JSONValidationRule for the path syntax.
+        @param max_bytes: The maximum size of the body in bytes.
+        @param allow_none: If allow_none is true then an empty body will be
+            legal. If allow_none is false then an empty body will throw a 
+            ValidationException.
+        @param error_list: If error_list exists, any errors will be captured in the list
+            instead of being thrown. The method will return None in this
+            case.
+
+        @return: The document, with the values returned by the rules.
+
+        @raise IntrusionException:
+        """
+        raise NotImplementedError()
+
     def is_valid_redirect_location(self, context, input_, allow_none):
         """
         Returns true if input is a valid redirect location, as defined by "ESAPI.conf.settings".
@@ -637,4 +724,32 @@ class Validator():
         """
         raise NotImplementedError()
 
+    def safe_read_lines(self, context, input_stream, type_, max_length, allow_none, error_list=None):
+        """
+        Reads lines from an input stream, such as a file, a socket file or
+        wsgi.input, and validates each one. Lines are read one at a time with
+        a bounded buffer, so a stream of any size can be processed in constant
+        memory. A line longer than max_length is read in chunks, discarded and
+        reported as invalid. Line terminators are removed before validation.
+
+        @param context: A descriptive name of the stream. The error for line n,
+            counting from 1, is stored in error_list under the key "context[n]".
+        @param input_stream: The stream from which to read lines. It must have
+            a readline method that accepts a maximum size.
+        @param type_: The regular expression name that maps to the actual 
+            regular expression from "ESAPI.conf.settings", as in 
+            get_valid_input, or a ValidationRule to check each line against.
+        @param max_length: Maximum characters allowed in a line
+        @param allow_none: If allow_none is true then an empty line will be 
+            legal. Ignored when type_ is a ValidationRule.
+        @param error_list: If validation is in error, resulting errors will be
+            stored in the error_list by line and None will be yielded for the
+            invalid line. Otherwise, the first error is raised.
+
+        @return: a generator yielding the canonicalized and validated lines
+
+        @raises ValidationException: 
+        """
+        raise NotImplementedError()
 
+